@@ -1,4 +1,6 @@
-import { Injectable } from '@angular/core';
+import { inject, Injectable } from '@angular/core';
+import { HttpClient, HttpParams } from '@angular/common/http';
+import { firstValueFrom } from 'rxjs';
 import {
   LocationOption,
   LocationProvider,
@@ -6,10 +8,21 @@ import {
   ReverseGeocodingResult
 } from './location-selector-service';
 
+interface LocalReverseGeocodingResponse {
+  id: number | null;
+  localityId: number;
+  name: string | null;
+  state: string | null;
+  country: string | null;
+  latitude: number;
+  longitude: number;
+}
+
 @Injectable({
   providedIn: 'root'
 })
 export class NominatimLocationSelectorService implements LocationSelectorService {
+  private http = inject(HttpClient);
   locationProviderName: LocationProvider = 'nominatim';
 
   async searchLocations(country: string, state: string, locality: string): Promise<LocationOption[]> {
@@ -27,6 +40,11 @@ export class NominatimLocationSelectorService implements LocationSelectorService
   }
 
   async reverseGeocode(latitude: number, longitude: number): Promise<ReverseGeocodingResult> {
+    const local = await this.reverseGeocodeLocally(latitude, longitude);
+    if (local) {
+      return local;
+    }
+
     const url = `https://nominatim.openstreetmap.org/reverse?format=geocodejson&lat=${latitude}&lon=${longitude}`;
     const response = await fetch(url);
     const data = await response.json();
@@ -46,4 +64,29 @@ export class NominatimLocationSelectorService implements LocationSelectorService
       country: geocoding.country || '',
     };
   }
+
+  /**
+   * Find the locality with the boundaries loaded by the backend,
+   * null if the backend has none for the coordinates.
+   */
+  private async reverseGeocodeLocally(latitude: number, longitude: number): Promise<ReverseGeocodingResult | null> {
+    try {
+      const params = new HttpParams()
+        .set('lat', latitude.toString())
+        .set('lng', longitude.toString());
+      const locality = await firstValueFrom(
+        this.http.get<LocalReverseGeocodingResponse>('/api/localities/reverse', { params })
+      );
+      return {
+        osmId: locality.localityId,
+        displayName: [locality.name, locality.state, locality.country].filter(Boolean).join(', '),
+        city: locality.name || '',
+        state: locality.state || '',
+        country: locality.country || '',
+      };
+    } catch (error) {
+      // no boundaries on the backend or none at the coordinates
+      return null;
+    }
+  }
 }
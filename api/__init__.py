@@ -10,6 +10,7 @@ from flask_sqlalchemy import SQLAlchemy
 from jwt import PyJWTError
 from sqlalchemy import Engine, MetaData, event
 
+from api.blueprints.common.compression import init_compression
 from api.config import DevConfig
 
 if TYPE_CHECKING:
@@ -46,8 +47,14 @@ def register_routes(app):
     from api.blueprints.ai_comments import ai_comments, models, routes  # noqa: F811
     from api.blueprints.auth import auth, models, routes  # noqa: F811
     from api.blueprints.comments import comments, models, routes  # noqa: F811
-    from api.blueprints.locations import locations, models, routes  # noqa: F811
-    from api.blueprints.posts import models, posts, routes  # noqa: F811
+    from api.blueprints.locations import (  # noqa: F811
+        commands,
+        locations,
+        models,
+        routes,
+    )
+    from api.blueprints.posts import commands, models, posts, routes  # noqa: F401, F811
+    from api.blueprints.search import routes, search  # noqa: F811
     from api.blueprints.solutions import models, routes, solutions  # noqa: F811
     from api.blueprints.uploads import models, routes, uploads_bp  # noqa: F811
     from api.blueprints.users import models, routes, users  # noqa: F401, F811
@@ -59,6 +66,7 @@ def register_routes(app):
     app.register_blueprint(comments)
     app.register_blueprint(locations)
     app.register_blueprint(posts)
+    app.register_blueprint(search)
     app.register_blueprint(solutions)
     app.register_blueprint(uploads_bp)
     app.register_blueprint(users)
@@ -87,6 +95,10 @@ def create_app(config):
     migrate.init_app(app, db)
     jwt.init_app(app)
     app.storage_service = config.STORAGE_SERVICE  # type: ignore[attr-defined]
+    if app.config["JSON_PROVIDER"] == "orjson":
+        from api.blueprints.common.serialization import OrjsonProvider
+
+        app.json = OrjsonProvider(app)
 
     @event.listens_for(Engine, "connect")
     def set_sqlite_pragma(dbapi_conn, connection_record):
@@ -96,6 +108,7 @@ def create_app(config):
             cursor.close()
 
     register_routes(app)
+    init_compression(app)
 
     @app.errorhandler(PyJWTError)
     @app.errorhandler(JWTExtendedException)
@@ -0,0 +1,124 @@
+"""Throughput of serializing a 100 item feed page.
+
+Compares marshmallow with compiled schemas and the json module with orjson on a
+page of posts with authors, localities and three images each, loaded from an
+in-memory database. The text is ASCII, responses with non-ASCII text are encoded
+by the json module with either provider. Run from the repository root:
+
+    python -m api.benchmarks.serialization
+"""
+
+import timeit
+
+import email_validator
+
+from api import create_app, db
+from api.blueprints.auth.models import User
+from api.blueprints.common.schemas import loader_options
+from api.blueprints.common.serialization import OrjsonProvider
+from api.blueprints.locations.models import Locality
+from api.blueprints.posts.models import Post, PostImage
+from api.blueprints.posts.schemas import PostOutPaginationSchema
+from api.blueprints.uploads.models import Image
+from api.blueprints.uploads.services import LocalFolderStorageService
+from api.config import TestConfig
+
+PAGE_SIZE = 100
+REPEAT = 5
+NUMBER = 20
+
+
+def create_posts() -> None:
+    locality = Locality(
+        latitude=50.45,  # type: ignore
+        longitude=30.52,  # type: ignore
+        osm_id=3167397,  # type: ignore
+    )
+    author = User(
+        firstname="Olena",
+        lastname="Doe",
+        email="olena@example.com",
+        password_hash="-",  # noqa: S106
+        locality=locality,
+    )
+    images = [
+        Image(url=f"https://example.com/images/{i}.png")  # type: ignore
+        for i in range(3)
+    ]
+    for i in range(PAGE_SIZE):
+        post = Post(
+            title=f"Pothole on street {i}",  # type: ignore
+            body="Deep pothole in the middle of the road " * 10,  # type: ignore
+            latitude=50.45 + i / 1000,  # type: ignore
+            longitude=30.52 - i / 1000,  # type: ignore
+            author=author,  # type: ignore
+            locality=locality,  # type: ignore
+        )
+        post.image_association = [
+            PostImage(image=image, order=order)  # type: ignore
+            for order, image in enumerate(images)
+        ]
+        post.set_image_preview([image.url for image in images])
+        db.session.add(post)
+    db.session.commit()
+
+
+def feed_page() -> dict:
+    posts = (
+        Post.query.options(*loader_options(PostOutPaginationSchema))
+        .order_by(Post.created_at.desc(), Post.id.desc())
+        .limit(PAGE_SIZE)
+        .all()
+    )
+    return {
+        "items": posts,
+        "links": {"self": "/posts?page=1", "first": "/posts?page=1"},
+        "has_prev": False,
+        "has_next": False,
+        "page": 1,
+        "total_pages": 1,
+        "items_per_page": PAGE_SIZE,
+        "total_items": PAGE_SIZE,
+        "count_mode": "exact",
+    }
+
+
+def main() -> None:
+    email_validator.TEST_ENVIRONMENT = True
+    TestConfig.STORAGE_SERVICE = LocalFolderStorageService()
+    app = create_app(TestConfig)
+    default_provider = app.json
+    orjson_provider = OrjsonProvider(app)
+    schema = PostOutPaginationSchema()
+
+    with app.app_context(), app.test_request_context():
+        db.create_all()
+        create_posts()
+        page = feed_page()
+
+        baseline = None
+        for compiled in (False, True):
+            for provider in (default_provider, orjson_provider):
+                app.config["COMPILED_SCHEMAS"] = compiled
+                app.json = provider
+
+                def serialize():
+                    return app.json.response(schema.dump(page)).get_data()  # type: ignore
+
+                body = serialize()
+                if baseline is None:
+                    baseline = body
+                seconds = (
+                    min(timeit.repeat(serialize, repeat=REPEAT, number=NUMBER)) / NUMBER
+                )
+                print(
+                    f"{'compiled' if compiled else 'marshmallow':<12}"
+                    f"{type(provider).__name__:<22}"
+                    f"{1 / seconds:8.1f} pages/s"
+                    f"{PAGE_SIZE / seconds:10.0f} items/s"
+                    f"  same bytes: {body == baseline}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -4,12 +4,14 @@ from flask_jwt_extended import jwt_required
 from api.blueprints.admin import admin
 from api.blueprints.admin.schemas import (
     CreateAdminSchema,
+    GeocodingStatusSchema,
     ReportPaginationSchema,
     ReportSchema,
     ReportSortingFilteringSchema,
 )
 from api.blueprints.common.schemas import merge_schemas, pagination_query_schema
 from api.blueprints.users.schemas import UserOutPaginationSchema, UserOutSchema
+from api.services import NominatimService
 
 
 class Reports(MethodView):
@@ -85,6 +87,21 @@ class Admins(MethodView):
         return {}, 501
 
 
+class GeocodingStatus(MethodView):
+    @jwt_required()
+    @admin.output(GeocodingStatusSchema)
+    @admin.doc(
+        security="jwt_access_token",
+        responses={403: "Forbidden", 200: "Geocoding status retrieved"},
+    )
+    def get(self):
+        """Get the circuit breaker state and metrics of the geocoding provider"""
+        return {
+            "provider": NominatimService.PROVIDER,
+            "circuit_breaker": NominatimService.circuit_breaker().metrics(),
+        }
+
+
 admin.add_url_rule("/reports", view_func=Reports.as_view("reports"))
 admin.add_url_rule("/reports/<int:report_id>", view_func=Report.as_view("report"))
 admin.add_url_rule(
@@ -97,3 +114,4 @@ admin.add_url_rule(
 )
 
 admin.add_url_rule("/admins", view_func=Admins.as_view("admins"))
+admin.add_url_rule("/geocoding", view_func=GeocodingStatus.as_view("geocoding"))
@@ -1,5 +1,5 @@
 from apiflask import Schema
-from apiflask.fields import Integer, String
+from apiflask.fields import Float, Integer, Nested, String
 from apiflask.validators import OneOf
 
 from api.blueprints.auth.schemas import PasswordSchema
@@ -33,3 +33,18 @@ class ReportSortingFilteringSchema(Schema):
         validate=OneOf(["asc", "desc"]),
     )
     related_type = String(validate=OneOf(["post", "solution", "comment"]))
+
+
+class CircuitBreakerSchema(CamelCaseSchema):
+    state = String(validate=OneOf(["closed", "open", "half_open"]))
+    consecutive_failures = Integer()
+    calls = Integer(metadata={"description": "Calls let through to the service"})
+    failures = Integer()
+    rejected_calls = Integer(metadata={"description": "Calls failed fast"})
+    times_opened = Integer()
+    retry_in = Float(metadata={"description": "Seconds until a probe call"})
+
+
+class GeocodingStatusSchema(CamelCaseSchema):
+    provider = String()
+    circuit_breaker = Nested(CircuitBreakerSchema)
@@ -0,0 +1,364 @@
+"""Response cache for anonymous GET requests with tag based invalidation."""
+
+import abc
+import contextlib
+import functools
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Iterable
+from typing import NamedTuple
+from urllib.parse import urlencode
+
+from flask import current_app, g, make_response, request
+
+from api.blueprints.common.compression import (
+    compressed_variants,
+    negotiate_encoding,
+    set_encoding,
+)
+from api.blueprints.common.models import on_commit
+
+# validators kept with cached responses so conditional requests still get a 304
+CACHED_HEADERS = ("ETag", "Last-Modified")
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    mimetype: str | None
+    headers: tuple[tuple[str, str], ...] = ()
+    # compressed bodies by encoding, so hits are not compressed again
+    variants: tuple[tuple[str, bytes], ...] = ()
+
+    def pack(self) -> bytes:
+        """Serialize as a JSON header line followed by the bodies."""
+        header = {
+            "mimetype": self.mimetype,
+            "headers": self.headers,
+            "variants": [(encoding, len(body)) for encoding, body in self.variants],
+        }
+        return b"".join(
+            [json.dumps(header).encode(), b"\n", self.body]
+            + [body for _, body in self.variants]
+        )
+
+    @classmethod
+    def unpack(cls, data: bytes) -> "CachedResponse":
+        header, _, bodies = data.partition(b"\n")
+        header = json.loads(header)
+        variants = []
+        end = len(bodies)
+        for encoding, size in reversed(header["variants"]):
+            variants.insert(0, (encoding, bodies[end - size : end]))
+            end -= size
+        return cls(
+            bodies[:end],
+            header["mimetype"],
+            tuple(map(tuple, header["headers"])),
+            tuple(variants),
+        )
+
+
+class CacheBackend(abc.ABC):
+    """Storage of serialized responses tagged with the data they were built from."""
+
+    @abc.abstractmethod
+    def get(self, key: str) -> CachedResponse | None:
+        """Return the cached response, None if it is missing or expired."""
+        pass
+
+    @abc.abstractmethod
+    def set(
+        self, key: str, response: CachedResponse, tags: Iterable[str], ttl: int
+    ) -> None:
+        """Store the response for ``ttl`` seconds."""
+        pass
+
+    @abc.abstractmethod
+    def invalidate_tags(self, tags: Iterable[str]) -> None:
+        """Remove every response stored with any of the tags."""
+        pass
+
+    @abc.abstractmethod
+    def clear(self) -> None:
+        """Remove all responses."""
+        pass
+
+
+class LRUCacheBackend(CacheBackend):
+    """In-process cache of the most recently used responses.
+
+    Every worker process has its own copy, which is only invalidated by the
+    commits of that process.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[CachedResponse, float, set[str]]] = (
+            OrderedDict()
+        )
+        self._tags: dict[str, set[str]] = {}
+
+    def _remove(self, key: str) -> None:
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            response, expires, _ = entry
+            if time.monotonic() >= expires:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return response
+
+    def set(self, key, response, tags, ttl):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            tags = set(tags)
+            self._entries[key] = (response, time.monotonic() + ttl, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_tags(self, tags):
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+
+class FileSystemCacheBackend(CacheBackend):
+    """Responses stored as files, shared by the worker processes of one host.
+
+    Every tag has a version file. Entries record the versions of their tags, and
+    invalidating a tag bumps its version, so stale entries are skipped on read
+    and overwritten later.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    @staticmethod
+    def _hash(value: str) -> str:
+        return hashlib.sha256(value.encode()).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, "entries", f"{self._hash(key)}.cache")
+
+    def _tag_path(self, tag: str) -> str:
+        return os.path.join(self.directory, "tags", self._hash(tag))
+
+    def _tag_version(self, tag: str) -> str:
+        try:
+            with open(self._tag_path(tag)) as file:
+                return file.read()
+        except FileNotFoundError:
+            return ""
+
+    def _write(self, path: str, content: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file first so readers never see a partial file
+        with tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(path), suffix=".tmp", delete=False
+        ) as file:
+            file.write(content)
+        os.replace(file.name, path)
+
+    def get(self, key):
+        try:
+            with open(self._entry_path(key), "rb") as file:
+                header = json.loads(file.readline())
+                data = file.read()
+        except (FileNotFoundError, ValueError):
+            return None
+        if header["key"] != key or time.time() >= header["expires"]:
+            return None
+        for tag, version in header["tags"].items():
+            if self._tag_version(tag) != version:
+                return None
+        return CachedResponse.unpack(data)
+
+    def set(self, key, response, tags, ttl):
+        header = {
+            "key": key,
+            "expires": time.time() + ttl,
+            "tags": {tag: self._tag_version(tag) for tag in tags},
+        }
+        self._write(
+            self._entry_path(key), json.dumps(header).encode() + b"\n" + response.pack()
+        )
+
+    def invalidate_tags(self, tags):
+        for tag in tags:
+            self._write(self._tag_path(tag), str(time.time_ns()).encode())
+
+    def clear(self):
+        for subdirectory in ("entries", "tags"):
+            with contextlib.suppress(FileNotFoundError):
+                for name in os.listdir(os.path.join(self.directory, subdirectory)):
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(os.path.join(self.directory, subdirectory, name))
+
+
+class RedisCacheBackend(CacheBackend):
+    """Responses stored in Redis, shared by all processes and hosts.
+
+    :param client: A client speaking the Redis protocol, e.g. ``redis.Redis``.
+    :param prefix: Prefix of all keys written by the cache.
+    """
+
+    def __init__(self, client, prefix: str = "response-cache:"):
+        self.client = client
+        self.prefix = prefix
+
+    def _entry_key(self, key: str) -> str:
+        return f"{self.prefix}entry:{key}"
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self.prefix}tag:{tag}"
+
+    def get(self, key):
+        value = self.client.get(self._entry_key(key))
+        if value is None:
+            return None
+        return CachedResponse.unpack(value)
+
+    def set(self, key, response, tags, ttl):
+        entry_key = self._entry_key(key)
+        pipeline = self.client.pipeline()
+        pipeline.set(entry_key, response.pack(), ex=ttl)
+        for tag in tags:
+            pipeline.sadd(self._tag_key(tag), entry_key)
+            pipeline.expire(self._tag_key(tag), ttl)
+        pipeline.execute()
+
+    def invalidate_tags(self, tags):
+        for tag in tags:
+            tag_key = self._tag_key(tag)
+            entry_keys = self.client.smembers(tag_key)
+            self.client.delete(tag_key, *entry_keys)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=f"{self.prefix}*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+def get_response_cache() -> CacheBackend | None:
+    return current_app.config.get("RESPONSE_CACHE")
+
+
+def _is_anonymous_request() -> bool:
+    return "Authorization" not in request.headers and not any(
+        name.startswith("access_token") for name in request.cookies
+    )
+
+
+def _cache_key() -> str:
+    # the same query parameters in another order share the cached response
+    return f"{request.path}?{urlencode(sorted(request.args.items(multi=True)))}"
+
+
+def add_cache_tags(*tags: str) -> None:
+    """Tag the response of the current request, see ``cached_response``."""
+    cache_tags = g.get("cache_tags")
+    if cache_tags is not None:
+        cache_tags.update(tags)
+
+
+def _encode(response, variants: tuple[tuple[str, bytes], ...]):
+    """Use the precompressed body the client accepts, if any."""
+    if not variants:
+        return response
+    encoding = negotiate_encoding([encoding for encoding, _ in variants])
+    response.vary.add("Accept-Encoding")
+    if encoding is None:
+        return response
+    body = dict(variants)[encoding] if response.status_code == 200 else None
+    return set_encoding(response, encoding, body)
+
+
+def cached_response(tags: Iterable[str] = ()) -> Callable:
+    """Cache successful responses of the view for anonymous GET requests.
+
+    Apply it above the input and output decorators so the final response is cached.
+    The view adds the tags describing the data it read with ``add_cache_tags``,
+    commits writing that data invalidate the tags.
+
+    :param tags: Tags of every response of the view.
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = get_response_cache()
+            if cache is None or request.method != "GET" or not _is_anonymous_request():
+                return view(*args, **kwargs)
+            key = _cache_key()
+            cached = cache.get(key)
+            if cached is not None:
+                response = current_app.response_class(
+                    cached.body, mimetype=cached.mimetype, headers=cached.headers
+                )
+                response.headers["X-Cache"] = "HIT"
+                response = response.make_conditional(request)
+                return _encode(response, cached.variants)
+
+            g.cache_tags = set(tags)
+            response = make_response(view(*args, **kwargs))
+            response.headers["X-Cache"] = "MISS"
+            if response.status_code != 200 or response.direct_passthrough:
+                return response
+            variants = compressed_variants(response)
+            cache.set(
+                key,
+                CachedResponse(
+                    response.get_data(),
+                    response.mimetype,
+                    tuple(
+                        (name, response.headers[name])
+                        for name in CACHED_HEADERS
+                        if name in response.headers
+                    ),
+                    variants,
+                ),
+                g.cache_tags,
+                current_app.config["RESPONSE_CACHE_TTL"],
+            )
+            return _encode(response, variants)
+
+        return wrapper
+
+    return decorator
+
+
+def invalidate_on_commit(collect: Callable[[object], Iterable[str]]) -> None:
+    """Invalidate the cache tags returned by ``collect`` for every written instance."""
+
+    def invalidate(tags) -> None:
+        cache = get_response_cache()
+        if cache is not None:
+            cache.invalidate_tags(tags)
+
+    on_commit(collect, invalidate)
@@ -0,0 +1,115 @@
+"""Compression of response bodies negotiated with ``Accept-Encoding``.
+
+Responses are compressed with brotli when the ``brotli`` package is installed and
+the client accepts it, otherwise with gzip. Bodies smaller than
+``COMPRESS_MIN_SIZE``, streamed files, already encoded bodies and binary types
+like images are sent as they are.
+
+The ETag of a compressed response gets the encoding as a suffix, since the bytes
+differ, and the suffix is removed from ``If-None-Match`` and ``If-Match`` before
+the views compare them with the ETag of the resource.
+"""
+
+import gzip
+import re
+
+from flask import Flask, Response, current_app, request
+from werkzeug.http import quote_etag
+
+try:
+    import brotli  # type: ignore
+except ImportError:  # optional, gzip only
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = frozenset(
+    {
+        "application/json",
+        "application/problem+json",
+        "application/vnd.mapbox-vector-tile",
+        "application/javascript",
+        "text/css",
+        "text/html",
+        "text/plain",
+    }
+)
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+_ENCODING_ETAG_SUFFIX = re.compile(r'-(?:br|gzip)"')
+
+
+def available_encodings() -> list[str]:
+    """Return the supported encodings, preferred first."""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def is_compressible(response: Response) -> bool:
+    """Return whether the body of the response is worth compressing."""
+    return (
+        current_app.config["COMPRESS_RESPONSES"]
+        and 200 <= response.status_code < 300
+        and response.status_code != 204
+        and not response.direct_passthrough
+        and not response.is_streamed
+        and "Content-Encoding" not in response.headers
+        and "no-transform" not in response.headers.get("Cache-Control", "")
+        and response.mimetype in COMPRESSIBLE_MIMETYPES
+        and response.content_length is not None
+        and response.content_length >= current_app.config["COMPRESS_MIN_SIZE"]
+    )
+
+
+def negotiate_encoding(encodings: list[str] | None = None) -> str | None:
+    """Return the encoding the client prefers out of ``encodings``."""
+    return request.accept_encodings.best_match(encodings or available_encodings())
+
+
+def compressed_variants(response: Response) -> tuple[tuple[str, bytes], ...]:
+    """Compress the body with every available encoding, for the response cache."""
+    if not is_compressible(response):
+        return ()
+    body = response.get_data()
+    return tuple(
+        (encoding, compress(body, encoding)) for encoding in available_encodings()
+    )
+
+
+def set_encoding(response: Response, encoding: str, body: bytes | None) -> Response:
+    """Mark the response as encoded, ``body`` is None for bodiless responses."""
+    if body is not None:
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    etag, weak = response.get_etag()
+    if etag is not None:
+        response.headers["ETag"] = quote_etag(f"{etag}-{encoding}", bool(weak))
+    return response
+
+
+def _strip_etag_suffixes() -> None:
+    for header in ("HTTP_IF_NONE_MATCH", "HTTP_IF_MATCH"):
+        value = request.environ.get(header)
+        if value:
+            request.environ[header] = _ENCODING_ETAG_SUFFIX.sub('"', value)
+
+
+def _compress_response(response: Response) -> Response:
+    if not is_compressible(response):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return response
+    return set_encoding(response, encoding, compress(response.get_data(), encoding))
+
+
+def init_compression(app: Flask) -> None:
+    """Register request hooks compressing the responses of the app."""
+    app.before_request(_strip_etag_suffixes)
+    app.after_request(_compress_response)
@@ -1,7 +1,11 @@
 import datetime
+from collections.abc import Callable, Hashable, Iterable
+from typing import cast
 
 import sqlalchemy as sa
+from sqlalchemy import event
 from sqlalchemy import orm as so
+from sqlalchemy.dialects import postgresql, sqlite
 
 
 class TimestampMixin:
@@ -14,9 +18,90 @@ class TimestampMixin:
         sa.DateTime, server_default=sa.func.now(), server_onupdate=sa.func.now()
     )
 
+    # the user-editable columns, edited_at moves only when one of them changes
+    __edited_columns__: tuple[str, ...] = ()
+
     @classmethod
     def __declare_last__(cls) -> None:
-        @sa.event.listens_for(cls, "before_update", propagate=True)
-        def _sqlite_touch_edited_at(mapper, connection, target) -> None:
-            if connection.dialect.name == "sqlite":
+        # server_onupdate only marks the column, no database sets it on update
+        @event.listens_for(cls, "before_update", propagate=True)
+        def _touch_edited_at(mapper, connection, target) -> None:
+            if any(
+                so.attributes.get_history(target, key).has_changes()
+                for key in target.__edited_columns__
+            ):
                 target.edited_at = datetime.datetime.now(tz=datetime.UTC)
+
+
+class ImagePreviewMixin:
+    """Mixin to store the first image URL and the number of images of a model.
+
+    The columns let listings render previews without joining the images.
+    """
+
+    thumbnail_url: so.Mapped[str | None] = so.mapped_column(sa.String, nullable=True)
+    image_count: so.Mapped[int] = so.mapped_column(
+        sa.Integer, default=0, server_default="0", nullable=False
+    )
+
+    def set_image_preview(self, image_urls: list[str]) -> None:
+        """Update the preview from the URLs of the images in display order."""
+        self.thumbnail_url = image_urls[0] if image_urls else None
+        self.image_count = len(image_urls)
+
+
+def table_of(model: type) -> sa.Table:
+    """Return the table a model class is mapped to."""
+    return cast(sa.Table, so.class_mapper(model, configure=False).local_table)
+
+
+def dialect_insert(
+    bind: sa.Connection | so.Session | so.scoped_session, table
+) -> postgresql.Insert | sqlite.Insert:
+    """Create an INSERT construct supporting ON CONFLICT clauses for the bound dialect.
+
+    :param bind: The connection or session the statement will be executed with.
+    :param table: The table or mapped class to insert into.
+    :return: A PostgreSQL or SQLite specific insert statement.
+    """
+    dialect_name = (
+        bind.dialect.name
+        if isinstance(bind, sa.Connection)
+        else bind.get_bind().dialect.name
+    )
+    if dialect_name == "postgresql":
+        return postgresql.insert(table)
+    if dialect_name == "sqlite":
+        return sqlite.insert(table)
+    raise NotImplementedError(f"Upserts are not supported for {dialect_name}")
+
+
+def on_commit(
+    collect: Callable[[object], Iterable[Hashable]],
+    apply: Callable[[set[Hashable]], None],
+) -> None:
+    """Run a side effect for the instances written by a transaction once it commits.
+
+    :param collect: Called in ``after_flush`` for every new, dirty and deleted
+        instance, while the attribute history is still available. Returns keys
+        describing what has to be done for the instance.
+    :param apply: Called after commit with all collected keys. Not called if the
+        transaction is rolled back.
+    """
+    info_key = object()
+
+    @event.listens_for(so.Session, "after_flush")
+    def collect_keys(session, flush_context) -> None:
+        keys = session.info.setdefault(info_key, set())
+        for instance in (*session.new, *session.dirty, *session.deleted):
+            keys.update(collect(instance))
+
+    @event.listens_for(so.Session, "after_commit")
+    def apply_keys(session) -> None:
+        keys = session.info.pop(info_key, None)
+        if keys:
+            apply(keys)
+
+    @event.listens_for(so.Session, "after_rollback")
+    def discard_keys(session) -> None:
+        session.info.pop(info_key, None)
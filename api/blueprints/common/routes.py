@@ -1,13 +1,29 @@
+import base64
+import binascii
+import datetime
+import hashlib
+import json
+import threading
+import time
 import typing as t
+from collections.abc import Iterable
 
-from apiflask import APIBlueprint
+import sqlalchemy as sa
+from apiflask import APIBlueprint, Schema, abort
 from apiflask.types import DecoratedType
-from flask import url_for
+from flask import Response, current_app, jsonify, request, url_for
 from flask_sqlalchemy.model import Model
-from flask_sqlalchemy.pagination import Pagination
+from flask_sqlalchemy.pagination import Pagination, QueryPagination
 from flask_sqlalchemy.query import Query
+from sqlalchemy.sql.util import find_tables
+from werkzeug.http import http_date, is_resource_modified, quote_etag
 
-from api.blueprints.common.schemas import LocationHeader
+from api.blueprints.common.models import on_commit, table_of
+from api.blueprints.common.schemas import (
+    LocationHeader,
+    loader_options,
+    sparse_schema,
+)
 
 
 class CustomAPIBlueprint(APIBlueprint):
@@ -17,10 +33,265 @@ class CustomAPIBlueprint(APIBlueprint):
         return super().output(*args, **kwargs)
 
 
-def pagination_links(pagination: Pagination, endpoint: str, **kwargs) -> dict:
+class CursorPagination:
+    """A page of a query paginated with a cursor instead of an offset.
+
+    The cursor stores the sort values of the first or last item of a page, and the
+    next page is selected with a ``WHERE (sort_column, id) > (value, id)`` condition
+    served by the index, so every page costs the same as the first one.
+    No totals are computed.
+    """
+
+    def __init__(
+        self,
+        query: Query,
+        order_columns: tuple[sa.ColumnElement, sa.ColumnElement],
+        order: str,
+        cursor: str,
+        per_page: int,
+    ):
+        self.cursor = cursor
+        self.per_page = per_page
+        self._names = [column.key for column in order_columns]
+        keys = [self._sort_key(query, column) for column in order_columns]
+        values, direction = self._decode(cursor, keys) if cursor else (None, "next")
+
+        backwards = direction == "prev"
+        descending = (order == "desc") != backwards
+        if values is not None:
+            query = query.filter(
+                sa.tuple_(*keys) < sa.tuple_(*values)
+                if descending
+                else sa.tuple_(*keys) > sa.tuple_(*values)
+            )
+        rows = (
+            query.order_by(*(key.desc() if descending else key.asc() for key in keys))
+            .add_columns(*keys)
+            .limit(per_page + 1)
+            .all()
+        )
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        if backwards:
+            rows.reverse()
+        self.items = [row[0] for row in rows]
+        self._first_values = list(rows[0][1:]) if rows else None
+        self._last_values = list(rows[-1][1:]) if rows else None
+        if backwards:
+            self.has_next = True
+            self.has_prev = has_more
+        else:
+            self.has_next = has_more
+            self.has_prev = values is not None
+
+    @staticmethod
+    def _sort_key(query: Query, column) -> sa.ColumnElement:
+        # SQLite stores datetimes as text in more than one format (CURRENT_TIMESTAMP
+        # has no microseconds), so the stored text is both sorted and compared
+        dialect_name = query.session.get_bind().dialect.name
+        if dialect_name == "sqlite" and column.type.python_type is datetime.datetime:
+            return sa.type_coerce(column, sa.String)
+        return column
+
+    def _decode(self, cursor: str, keys: list[sa.ColumnElement]) -> tuple[list, str]:
+        try:
+            names, values, direction = json.loads(
+                base64.urlsafe_b64decode(cursor.encode())
+            )
+            if names != self._names or direction not in ("next", "prev"):
+                raise ValueError
+            values = [
+                self._decode_value(key, value)
+                for key, value in zip(keys, values, strict=True)
+            ]
+        except (binascii.Error, TypeError, ValueError):
+            abort(422, message="Invalid cursor")
+        return values, direction
+
+    @staticmethod
+    def _decode_value(key: sa.ColumnElement, value):
+        """Check that a cursor value is a scalar of the Python type of its key."""
+        python_type = key.type.python_type
+        if python_type is datetime.datetime:
+            if not isinstance(value, str):
+                raise TypeError
+            return datetime.datetime.fromisoformat(value)
+        if python_type is float and isinstance(value, int):
+            value = float(value)
+        # bool is an int, but not a value of an integer column
+        if isinstance(value, bool) != (python_type is bool) or not isinstance(
+            value, python_type
+        ):
+            raise TypeError
+        return value
+
+    def _encode(self, values: list, direction: str) -> str:
+        values = [
+            value.isoformat() if isinstance(value, datetime.datetime) else value
+            for value in values
+        ]
+        payload = json.dumps([self._names, values, direction]).encode()
+        return base64.urlsafe_b64encode(payload).decode()
+
+    @property
+    def next_cursor(self) -> str | None:
+        if not self.has_next or self._last_values is None:
+            return None
+        return self._encode(self._last_values, "next")
+
+    @property
+    def prev_cursor(self) -> str | None:
+        if not self.has_prev or self._first_values is None:
+            return None
+        return self._encode(self._first_values, "prev")
+
+
+class UncountedQueryPagination(QueryPagination):
+    """Query pagination that looks one item ahead instead of counting all items."""
+
+    def _query_items(self) -> list[t.Any]:
+        query = self._query_args["query"]
+        items = query.limit(self.per_page + 1).offset(self._query_offset).all()
+        self._has_more = len(items) > self.per_page
+        return items[: self.per_page]
+
+    @property
+    def has_next(self) -> bool:
+        return self._has_more
+
+
+class CountCache:
+    """Totals of filtered queries, dropped when a row of a table they read is written.
+
+    Every worker process has its own cache, the TTL bounds how long it can miss the
+    writes of other processes.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._counts: dict[tuple, tuple[int, float]] = {}
+
+    @staticmethod
+    def key(query: Query, table_name: str) -> tuple:
+        """Key the count of the query by its tables and filter set.
+
+        The tables are the counted one and the ones read by subqueries of the filter.
+        """
+        whereclause = query.whereclause
+        if whereclause is None:
+            return frozenset([table_name]), "", ()
+        tables = {
+            table.name
+            for table in find_tables(whereclause, check_columns=True)
+            if getattr(table, "name", None)
+        }
+        compiled = whereclause.compile()
+        return (
+            frozenset([table_name, *tables]),
+            str(compiled),
+            tuple(sorted(compiled.params.items())),
+        )
+
+    def get(self, key: tuple) -> int | None:
+        with self._lock:
+            count, expires = self._counts.get(key, (None, 0.0))
+            if time.monotonic() >= expires:
+                self._counts.pop(key, None)
+                return None
+            return count
+
+    def set(self, key: tuple, count: int) -> None:
+        with self._lock:
+            self._counts[key] = (count, time.monotonic() + self.ttl)
+
+    def invalidate(self, table_names: Iterable[str]) -> None:
+        with self._lock:
+            table_names = set(table_names)
+            for key in [key for key in self._counts if key[0] & table_names]:
+                del self._counts[key]
+
+
+def get_count_cache() -> CountCache:
+    cache = current_app.extensions.get("count_cache")
+    if cache is None:
+        cache = CountCache(current_app.config["COUNT_CACHE_TTL"])
+        current_app.extensions["count_cache"] = cache
+    return cache
+
+
+def _changed_tables(instance) -> list[str]:
+    table = getattr(instance, "__table__", None)
+    return [table.name] if table is not None else []
+
+
+def invalidate_counts(table_names) -> None:
+    cache = current_app.extensions.get("count_cache")
+    if cache is not None:
+        cache.invalidate(table_names)
+
+
+on_commit(_changed_tables, invalidate_counts)
+
+
+def estimate_count(query: Query) -> int | None:
+    """Return the row estimate of the PostgreSQL planner, None on other databases."""
+    connection = query.session.connection()
+    if connection.dialect.name != "postgresql":
+        return None
+    compiled = query.order_by(None).statement.compile(dialect=connection.dialect)
+    plan = connection.exec_driver_sql(
+        f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params
+    ).scalar_one()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def paginate(
+    query: Query, table_name: str, count: str = "exact"
+) -> tuple[Pagination, str]:
+    """Paginate the query computing the total in the requested way.
+
+    :param query: The ordered query to paginate.
+    :param table_name: The table counted by the query, used to invalidate cached totals.
+    :param count: ``exact``, ``estimate`` or ``none``.
+    :return: The pagination and how its total was computed: ``exact``, ``cached``,
+        ``estimate`` or ``none``.
+    """
+    if count == "none":
+        return UncountedQueryPagination(query=query, count=False), "none"
+    if count == "estimate":
+        estimate = estimate_count(query)
+        if estimate is not None:
+            # the estimate is only reported, the next page is found by looking ahead
+            pagination = UncountedQueryPagination(query=query, count=False)
+            # the estimate can be below the number of items already seen
+            pagination.total = max(
+                estimate,
+                (pagination.page - 1) * pagination.per_page
+                + len(pagination.items)
+                + pagination.has_next,
+            )
+            return pagination, "estimate"
+    pagination = query.paginate(count=False)
+    cache = get_count_cache()
+    key = CountCache.key(query, table_name)
+    total = cache.get(key)
+    if total is not None:
+        pagination.total = total
+        return pagination, "cached"
+    pagination.total = query.order_by(None).count()
+    cache.set(key, pagination.total)
+    return pagination, "exact"
+
+
+def pagination_links(
+    pagination: Pagination | CursorPagination, endpoint: str, **kwargs
+) -> dict:
     """Generate pagination links for the given pagination object and endpoint.
 
-    :param pagination: The pagination object from Flask-SQLAlchemy.
+    :param pagination: The pagination object from Flask-SQLAlchemy or a cursor page.
     :param endpoint: The endpoint to generate links for.
     :param kwargs: Additional query parameters to include in the links.
     :return: A dictionary containing pagination links.
@@ -28,7 +299,24 @@ def pagination_links(pagination: Pagination, endpoint: str, **kwargs) -> dict:
     nav_links = {}
     kwargs.pop("page", None)
     kwargs.pop("per_page", None)
+    kwargs.pop("cursor", None)
     per_page = pagination.per_page
+    if isinstance(pagination, CursorPagination):
+        # cursor pages have no totals
+        kwargs.pop("count", None)
+        nav_links["self"] = url_for(
+            endpoint, cursor=pagination.cursor, per_page=per_page, **kwargs
+        )
+        nav_links["first"] = url_for(endpoint, cursor="", per_page=per_page, **kwargs)
+        if pagination.prev_cursor is not None:
+            nav_links["prev"] = url_for(
+                endpoint, cursor=pagination.prev_cursor, per_page=per_page, **kwargs
+            )
+        if pagination.next_cursor is not None:
+            nav_links["next"] = url_for(
+                endpoint, cursor=pagination.next_cursor, per_page=per_page, **kwargs
+            )
+        return nav_links
     this_page = pagination.page
     last_page = pagination.pages
     nav_links["self"] = url_for(endpoint, page=this_page, per_page=per_page, **kwargs)
@@ -41,10 +329,71 @@ def pagination_links(pagination: Pagination, endpoint: str, **kwargs) -> dict:
         nav_links["next"] = url_for(
             endpoint, page=pagination.next_num, per_page=per_page, **kwargs
         )
-    nav_links["last"] = url_for(endpoint, page=last_page, per_page=per_page, **kwargs)
+    if pagination.total is not None:
+        nav_links["last"] = url_for(
+            endpoint, page=last_page, per_page=per_page, **kwargs
+        )
     return nav_links
 
 
+def sparse_response(schema: Schema, data) -> Response:
+    """Serialize the data with a schema created for this request.
+
+    The schema of the output decorator is fixed, so responses with sparse fieldsets
+    are serialized here and returned as a ready response.
+    """
+    return jsonify(schema.dump(data))
+
+
+class ResourceVersion(t.NamedTuple):
+    """Validators of a post or solution used for conditional requests."""
+
+    etag: str
+    last_modified: datetime.datetime
+
+    @property
+    def headers(self) -> dict[str, str]:
+        return {
+            "ETag": quote_etag(self.etag),
+            "Last-Modified": http_date(self.last_modified),
+        }
+
+
+def resource_version(instance, *variant: str) -> ResourceVersion:
+    """Return the version of a resource with ``edited_at`` and ordered images.
+
+    The strong ETag hashes the columns of the row and the image ids in display order,
+    because reordering images does not always change the row and ``edited_at`` only
+    moves with the user's edits, not e.g. with a resolved locality. ``variant`` tells
+    apart different representations of the resource, e.g. sparse fieldsets.
+    """
+    columns = sa.inspect(instance).mapper.column_attrs
+    row = ",".join(repr(getattr(instance, column.key)) for column in columns)
+    image_ids = ",".join(str(image.image_id) for image in instance.image_association)
+    value = f"{row}|{image_ids}|{','.join(variant)}"
+    return ResourceVersion(
+        hashlib.sha256(value.encode()).hexdigest()[:32], instance.edited_at
+    )
+
+
+def not_modified_response(version: ResourceVersion) -> Response | None:
+    """Return a 304 response if the client's copy matches ``If-None-Match``.
+
+    ``If-Modified-Since`` is only used when the request has no ``If-None-Match``.
+    """
+    if is_resource_modified(
+        request.environ, etag=version.etag, last_modified=version.last_modified
+    ):
+        return None
+    return current_app.response_class(status=304, headers=version.headers)
+
+
+def check_if_match(version: ResourceVersion) -> None:
+    """Abort with 412 if the client edited a version other than the current one."""
+    if request.if_match and not request.if_match.contains(version.etag):
+        abort(412, message="Resource was modified by another request")
+
+
 def create_pagination_response(
     query: Query,
     db_model: type[Model],
@@ -52,33 +401,77 @@ def create_pagination_response(
     sort_by: str,
     order: str,
     secondary_sort: str = "id",
+    schema: type[Schema] | None = None,
     **kwargs,
-) -> dict:
+) -> dict | Response:
     """Create a pagination response that matches your schema.
 
+    When the query parameters contain a ``cursor`` the response is paginated with
+    ``CursorPagination`` and has no page number and totals. Otherwise the ``count``
+    query parameter chooses how totals are computed, see ``paginate``.
+
     :param query: The query object from Flask-SQLAlchemy to paginate.
     :param db_model: The database model being queried.
     :param endpoint: The endpoint to generate links for.
     :param sort_by: The column to sort by.
     :param order: The order to sort (asc or desc).
     :param secondary_sort: The column to sort by if the primary sort column is not unique.
-    :param kwargs: Additional query parameters to include in the links.
-    :return: A dictionary matching pagination schema
+    :param schema: The output schema, its loader options are applied to the query.
+    :param kwargs: Additional query parameters to include in the links. With
+        ``sparse_fields`` only those item fields are loaded and serialized.
+    :return: A dictionary matching pagination schema, or a serialized response for
+        sparse fieldsets
     """
     order_column = getattr(db_model, sort_by)
     secondary_order_column = getattr(db_model, secondary_sort)
-    if order == "desc":
-        query = query.order_by(order_column.desc(), secondary_order_column.desc())
+    fields = kwargs.pop("sparse_fields", None)
+    fields_schema = sparse_schema(schema, fields) if schema and fields else None
+    output_schema = fields_schema or schema
+    if output_schema is not None:
+        query = query.options(*loader_options(output_schema, db_model))
+    if kwargs.get("cursor") is not None:
+        cursor_pagination = CursorPagination(
+            query,
+            (order_column, secondary_order_column),
+            order,
+            kwargs["cursor"],
+            kwargs["per_page"],
+        )
+        response = {
+            "has_next": cursor_pagination.has_next,
+            "has_prev": cursor_pagination.has_prev,
+            "items": cursor_pagination.items,
+            "items_per_page": cursor_pagination.per_page,
+            "links": pagination_links(
+                cursor_pagination,
+                endpoint,
+                sort_by=sort_by,
+                order=order,
+                fields=fields,
+                **kwargs,
+            ),
+            "count_mode": "none",
+        }
     else:
-        query = query.order_by(order_column.asc(), secondary_order_column.asc())
-    pagination = query.paginate()
-    return {
-        "has_next": pagination.has_next,
-        "has_prev": pagination.has_prev,
-        "items": pagination.items,
-        "items_per_page": pagination.per_page,
-        "links": pagination_links(pagination, endpoint, **kwargs),
-        "page": pagination.page,
-        "total_items": pagination.total,
-        "total_pages": pagination.pages,
-    }
+        if order == "desc":
+            query = query.order_by(order_column.desc(), secondary_order_column.desc())
+        else:
+            query = query.order_by(order_column.asc(), secondary_order_column.asc())
+        pagination, count_mode = paginate(
+            query, table_of(db_model).name, kwargs.get("count", "exact")
+        )
+        response = {
+            "has_next": pagination.has_next,
+            "has_prev": pagination.has_prev,
+            "items": pagination.items,
+            "items_per_page": pagination.per_page,
+            "links": pagination_links(pagination, endpoint, fields=fields, **kwargs),
+            "page": pagination.page,
+            "count_mode": count_mode,
+        }
+        if pagination.total is not None:
+            response["total_items"] = pagination.total
+            response["total_pages"] = pagination.pages
+    if fields_schema is not None:
+        return sparse_response(fields_schema, response)
+    return response
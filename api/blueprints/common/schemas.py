@@ -1,10 +1,17 @@
-from collections.abc import Sequence, Set
+import functools
+from collections.abc import Callable, Iterable, Sequence, Set
+from typing import ClassVar
 
+import marshmallow as ma
+import sqlalchemy as sa
 from apiflask import Schema
 from apiflask.fields import URL, Boolean, Field, Integer, Nested, String
 from apiflask.validators import Length, OneOf, Range
+from marshmallow import ValidationError
+from sqlalchemy import orm as so
 
 
+@functools.cache  # called for every field of every schema instance
 def snake_to_camel(string):
     parts = string.split("_")
     return parts[0] + "".join(p.title() for p in parts[1:])
@@ -13,6 +20,10 @@ def snake_to_camel(string):
 class CamelCaseSchema(Schema):
     """Base schema that auto converts snake_case ⇄ camelCase"""
 
+    # factories of the loader options (joinedload, selectinload, ...) needed to
+    # dump a field without lazy loading, by field name, see ``loader_options``
+    field_loader_options: ClassVar[dict[str, Callable[[], Iterable]]] = {}
+
     def on_bind_field(self, field_name, field_obj):
         field_obj.data_key = snake_to_camel(field_name)
 
@@ -23,10 +34,21 @@ class LocationHeader(Schema):
     location = URL(metadata={"description": "URL of the created resource"})
 
 
+COUNT_MODES = ["exact", "estimate", "none"]
+
+
 def pagination_query_schema(
-    default_per_page: int = 20, max_per_page: int = 100
+    default_per_page: int = 20,
+    max_per_page: int = 100,
+    cursor: bool = False,
+    count: bool = False,
 ) -> type[Schema]:
-    """Create a pagination query schema with specified default per_page and max per_page values."""
+    """Create a pagination query schema with specified default per_page and max per_page values.
+
+    With ``cursor`` enabled the schema also accepts the ``cursor`` parameter of the
+    keyset pagination mode of ``create_pagination_response``, with ``count``
+    enabled the ``count`` parameter choosing how totals are computed.
+    """
 
     class PaginationQuerySchema(Schema):
         """Schema for pagination query parameters"""
@@ -36,7 +58,29 @@ def pagination_query_schema(
             load_default=default_per_page, validate=Range(min=1, max=max_per_page)
         )
 
-    return PaginationQuerySchema
+    fields = {}
+    if cursor:
+        fields["cursor"] = String(
+            metadata={
+                "description": "Opaque cursor from the pagination links, "
+                "pass an empty value to get the first page in cursor mode. "
+                "Cursor pages do not contain page numbers and totals."
+            }
+        )
+    if count:
+        fields["count"] = String(
+            load_default="exact",
+            validate=OneOf(COUNT_MODES),
+            metadata={
+                "enum": COUNT_MODES,
+                "description": "How totals are computed: exact (cached until the "
+                "next write), estimate (query planner estimate on PostgreSQL) "
+                "or none (no totals)",
+            },
+        )
+    if not fields:
+        return PaginationQuerySchema
+    return type("PaginationQuerySchema", (PaginationQuerySchema,), fields)
 
 
 class PaginationLinksSchema(CamelCaseSchema):
@@ -59,6 +103,107 @@ class PaginationOutSchema(CamelCaseSchema):
     total_pages = Integer()
     items_per_page = Integer()
     total_items = Integer()
+    count_mode = String(
+        metadata={
+            "enum": ["exact", "cached", "estimate", "none"],
+            "description": "How total_items was computed",
+        }
+    )
+
+
+def _items_schema(schema: ma.Schema) -> ma.Schema:
+    """Return the items schema of a pagination schema, other schemas unchanged."""
+    items = schema.fields.get("items")
+    if isinstance(schema, PaginationOutSchema) and isinstance(items, Nested):
+        return items.schema
+    return schema
+
+
+def loader_options(schema: Schema | type[Schema], model: type | None = None) -> list:
+    """Collect the loader options an output schema needs for the fields it dumps.
+
+    For pagination schemas the options of the items schema are returned.
+
+    :param schema: The output schema class or instance, ``only`` and ``exclude`` of
+        an instance are respected.
+    :param model: The queried model. If given and the schema dumps only some fields,
+        only the columns of those fields are loaded.
+    :return: Options to pass to ``Query.options``.
+    """
+    items_schema = _items_schema(schema() if isinstance(schema, type) else schema)
+    registry = getattr(items_schema, "field_loader_options", {})
+    factories = []
+    for field_name in items_schema.dump_fields:
+        factory = registry.get(field_name)
+        if factory is not None and factory not in factories:
+            factories.append(factory)
+    options = [option for factory in factories for option in factory()]
+    if model is not None and items_schema.only is not None:
+        columns = sa.inspect(model).columns.keys()
+        extra_columns = getattr(items_schema, "field_columns", {})
+        load_columns = set()
+        for field_name, field in items_schema.dump_fields.items():
+            attribute = (field.attribute or field_name).split(".")[0]
+            if attribute in columns:
+                load_columns.add(attribute)
+            load_columns.update(extra_columns.get(field_name, ()))
+        options.append(
+            so.load_only(*(getattr(model, column) for column in sorted(load_columns)))
+        )
+    return options
+
+
+def sparse_fields_query_schema(schema: type[Schema]) -> type[Schema]:
+    """Create a query schema for the ``fields`` parameter of the output schema.
+
+    ``fields`` is a comma separated list of the response field names to return,
+    use ``sparse_schema`` to build the schema dumping them.
+    """
+    names = sorted(
+        field.data_key or field_name
+        for field_name, field in _items_schema(schema()).fields.items()
+    )
+
+    def validate_fields(value: str) -> None:
+        unknown = set(value.split(",")) - set(names)
+        if unknown:
+            raise ValidationError(f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    class SparseFieldsQuerySchema(Schema):
+        """Schema for the sparse fieldset query parameter"""
+
+        sparse_fields = String(
+            data_key="fields",
+            validate=validate_fields,
+            metadata={
+                "description": "Comma separated response fields to return, "
+                f"one of: {', '.join(names)}"
+            },
+        )
+
+    return SparseFieldsQuerySchema
+
+
+def sparse_schema(schema: type[Schema], fields: str) -> Schema:
+    """Instantiate the output schema dumping only the requested response fields.
+
+    :param schema: The output schema, for pagination schemas the fields select
+        the fields of the items.
+    :param fields: Comma separated response field names validated by
+        ``sparse_fields_query_schema``.
+    """
+    requested = set(fields.split(","))
+    full_schema = schema()
+    items_schema = _items_schema(full_schema)
+    only = [
+        field_name
+        for field_name, field in items_schema.fields.items()
+        if (field.data_key or field_name) in requested
+    ]
+    if items_schema is full_schema:
+        return schema(only=only)
+    pagination_fields = [name for name in full_schema.fields if name != "items"]
+    return schema(only=[*pagination_fields, *(f"items.{name}" for name in only)])
 
 
 class TextBodySchema(CamelCaseSchema):
@@ -1,5 +1,9 @@
 from api.blueprints.common.routes import CustomAPIBlueprint
 
 locations = CustomAPIBlueprint(
-    "locations", __name__, tag="Locations operations", url_prefix="/"
+    "locations",
+    __name__,
+    tag="Locations operations",
+    url_prefix="/",
+    cli_group="locations",
 )
@@ -0,0 +1,144 @@
+import json
+import os
+from pathlib import Path
+
+import click
+import sqlalchemy as sa
+
+from api import db
+from api.blueprints.locations import locations
+from api.blueprints.locations.gazetteer import (
+    GAZETTEER_FORMATS,
+    READERS,
+    ImportProgress,
+    detect_format,
+    import_gazetteer,
+    open_binary,
+)
+from api.blueprints.locations.models import Locality
+from api.blueprints.locations.stats import check_location_stats, rebuild_location_stats
+from api.services import NominatimService
+
+
+def _file_version(path: Path) -> dict:
+    stat = path.stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _read_checkpoint(checkpoint: Path, path: Path) -> int:
+    """Return the records imported by an interrupted run over the same file."""
+    try:
+        state = json.loads(checkpoint.read_text())
+    except (OSError, ValueError):
+        return 0
+    if state.get("file") != _file_version(path):
+        click.echo("Ignoring the checkpoint of a different version of the file")
+        return 0
+    return int(state.get("records", 0))
+
+
+def _write_checkpoint(checkpoint: Path, path: Path, records: int) -> None:
+    temporary = checkpoint.with_name(checkpoint.name + ".tmp")
+    temporary.write_text(json.dumps({"file": _file_version(path), "records": records}))
+    os.replace(temporary, checkpoint)
+
+
+@locations.cli.command("import-gazetteer")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option(
+    "--format",
+    "file_format",
+    type=click.Choice(GAZETTEER_FORMATS),
+    help="Format of the file, detected from its suffix by default.",
+)
+@click.option("--batch-size", default=5000, show_default=True, type=click.IntRange(1))
+@click.option(
+    "--checkpoint",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="File recording the progress, PATH.checkpoint by default.",
+)
+@click.option(
+    "--restart", is_flag=True, help="Ignore the checkpoint and import from the start."
+)
+def import_gazetteer_command(path, file_format, batch_size, checkpoint, restart):
+    """Import localities from a CSV, NDJSON or OSM XML gazetteer file.
+
+    An interrupted import continues after the last committed batch when it is run
+    again with the same file.
+    """
+    try:
+        file_format = file_format or detect_format(path)
+    except ValueError as e:
+        raise click.UsageError(str(e)) from e
+    checkpoint = checkpoint or path.with_name(path.name + ".checkpoint")
+    skip = 0 if restart else _read_checkpoint(checkpoint, path)
+    if skip:
+        click.echo(f"Resuming after {skip} records")
+
+    def on_batch(progress: ImportProgress) -> None:
+        _write_checkpoint(checkpoint, path, progress.records)
+        click.echo(f"{progress.records} records imported")
+
+    with open_binary(path) as stream:
+        progress = import_gazetteer(
+            READERS[file_format](stream), batch_size, skip, on_batch
+        )
+    checkpoint.unlink(missing_ok=True)
+    # the import bypasses the events counting localities of states
+    rebuild_location_stats()
+    click.echo(
+        f"Imported {progress.records - progress.invalid} localities, "
+        f"skipped {progress.invalid} invalid records"
+    )
+
+
+@locations.cli.command("refine-localities")
+@click.option("--batch-size", default=1000, show_default=True, type=click.IntRange(1))
+def refine_localities(batch_size):
+    """Look up the coordinates of localities placed approximately.
+
+    Localities get the coordinates of a post while Nominatim is unavailable,
+    they are looked up in batches and committed every ``--batch-size`` localities.
+    """
+    localities = db.session.scalars(
+        sa.select(Locality)
+        .where(Locality.approximate, Locality.osm_id.is_not(None))
+        .order_by(Locality.id)
+    ).all()
+    refined = 0
+    for start in range(0, len(localities), batch_size):
+        batch = localities[start : start + batch_size]
+        coordinates = NominatimService.get_latitude_longitude_many(
+            [locality.osm_id for locality in batch]
+        )
+        for locality in batch:
+            found = coordinates.get(locality.osm_id)
+            if found is None:  # unknown id or failed lookup
+                continue
+            locality.latitude, locality.longitude = found
+            locality.approximate = False
+            refined += 1
+        db.session.commit()
+    click.echo(f"Refined {refined} of {len(localities)} approximate localities")
+    if refined < len(localities):
+        raise click.ClickException(
+            f"{len(localities) - refined} localities are still approximate"
+        )
+
+
+@locations.cli.command("rebuild-stats")
+def rebuild_stats():
+    """Recompute the user, post and solution counts of all locations."""
+    rows = rebuild_location_stats()
+    click.echo(f"Location stats rebuilt with {rows} rows")
+
+
+@locations.cli.command("check-stats")
+def check_stats():
+    """Check the location counts against the source tables."""
+    problems = check_location_stats()
+    for problem in problems:
+        click.echo(problem)
+    if problems:
+        raise click.ClickException(f"Found {len(problems)} inconsistent location stats")
+    click.echo("Location stats are consistent")
@@ -0,0 +1,262 @@
+"""Offline import of localities from a gazetteer file.
+
+Supported formats, optionally compressed with gzip (``.gz``) or bzip2 (``.bz2``):
+
+- ``csv``: a header row with ``osm_id``, ``latitude``, ``longitude`` and
+  optionally ``name``, ``state`` and ``country`` columns,
+- ``ndjson``: one JSON object per line with the same keys,
+- ``osm``: an OpenStreetMap XML extract, nodes tagged as a city, town, village or
+  hamlet are imported with their ``is_in:*`` or ``addr:*`` state and country.
+
+Files are read as a stream and written in batches, so memory does not grow with
+the size of the file. Records are upserted by ``osm_id``, importing a file again
+updates the localities. Countries and states are created from the names and
+linked to the localities, a state is only linked with its country.
+"""
+
+import bz2
+import csv
+import gzip
+import io
+import itertools
+import json
+import xml.etree.ElementTree as ET
+from collections.abc import Callable, Iterable, Iterator, Mapping
+from pathlib import Path
+from typing import IO, NamedTuple, cast
+
+import sqlalchemy as sa
+
+from api import db
+from api.blueprints.common.models import dialect_insert, table_of
+from api.blueprints.locations.models import Country, Locality, State
+
+GAZETTEER_FORMATS = ("csv", "ndjson", "osm")
+FORMAT_SUFFIXES = {
+    ".csv": "csv",
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+    ".osm": "osm",
+    ".xml": "osm",
+}
+PLACE_TYPES = frozenset({"city", "town", "village", "hamlet"})
+NAME_LENGTH = 100
+
+
+class GazetteerRecord(NamedTuple):
+    osm_id: int
+    latitude: float
+    longitude: float
+    name: str | None = None
+    state: str | None = None
+    country: str | None = None
+
+
+def _text(value) -> str | None:
+    return str(value)[:NAME_LENGTH] if value not in (None, "") else None
+
+
+def parse_record(values: Mapping) -> GazetteerRecord | None:
+    """Build a record from a CSV row or JSON object, None if it is invalid."""
+    try:
+        latitude = float(values["latitude"])
+        longitude = float(values["longitude"])
+        record = GazetteerRecord(
+            osm_id=int(values["osm_id"]),
+            latitude=latitude,
+            longitude=longitude,
+            name=_text(values.get("name")),
+            state=_text(values.get("state")),
+            country=_text(values.get("country")),
+        )
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return record
+
+
+def detect_format(path: Path) -> str:
+    """Return the format of the file from its suffix, ignoring compression."""
+    suffixes = [suffix.lower() for suffix in path.suffixes]
+    if suffixes and suffixes[-1] in (".gz", ".bz2"):
+        suffixes.pop()
+    if suffixes and suffixes[-1] in FORMAT_SUFFIXES:
+        return FORMAT_SUFFIXES[suffixes[-1]]
+    raise ValueError(f"Cannot detect the gazetteer format of {path.name}")
+
+
+def open_binary(path: Path) -> IO[bytes]:
+    """Open the file for reading, decompressing gzip and bzip2 files."""
+    suffix = path.suffix.lower()
+    if suffix == ".gz":
+        return cast(IO[bytes], gzip.open(path, "rb"))
+    if suffix == ".bz2":
+        return bz2.open(path, "rb")
+    return path.open("rb")
+
+
+def read_csv(stream: IO[bytes]) -> Iterator[GazetteerRecord | None]:
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    for row in csv.DictReader(text):
+        yield parse_record(row)
+
+
+def read_ndjson(stream: IO[bytes]) -> Iterator[GazetteerRecord | None]:
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            values = json.loads(line)
+        except ValueError:
+            yield None
+            continue
+        yield parse_record(values) if isinstance(values, dict) else None
+
+
+def read_osm(stream: IO[bytes]) -> Iterator[GazetteerRecord | None]:
+    """Read the place nodes of an OSM XML extract.
+
+    Ways and relations are skipped, their coordinates are not in the file.
+    """
+    root = None
+    # extracts are files chosen by the operator, not uploads
+    events = ET.iterparse(stream, events=("start", "end"))  # noqa: S314
+    for event, element in events:
+        if root is None:
+            root = element
+        if event != "end" or element.tag not in ("node", "way", "relation"):
+            continue
+        if element.tag == "node":
+            tags = {tag.get("k"): tag.get("v") for tag in element.iter("tag")}
+            if tags.get("place") in PLACE_TYPES:
+                yield parse_record(
+                    {
+                        "osm_id": element.get("id"),
+                        "latitude": element.get("lat"),
+                        "longitude": element.get("lon"),
+                        "name": tags.get("name:en") or tags.get("name"),
+                        "state": tags.get("is_in:state") or tags.get("addr:state"),
+                        "country": tags.get("is_in:country")
+                        or tags.get("addr:country"),
+                    }
+                )
+        # drop parsed elements, the tree would otherwise hold the whole file
+        root.clear()
+
+
+READERS: dict[str, Callable[[IO[bytes]], Iterator[GazetteerRecord | None]]] = {
+    "csv": read_csv,
+    "ndjson": read_ndjson,
+    "osm": read_osm,
+}
+
+
+def _get_or_create_ids(model, rows: list[dict], key: tuple[str, ...]) -> dict:
+    """Insert missing rows and return the ids of all rows by their ``key`` values."""
+    if not rows:
+        return {}
+    db.session.execute(
+        dialect_insert(db.session, model).on_conflict_do_nothing(
+            index_elements=list(key)
+        ),
+        rows,
+    )
+    columns = [getattr(model, name) for name in key]
+    found = db.session.execute(
+        sa.select(model.id, *columns).where(
+            sa.tuple_(*columns).in_([tuple(row[name] for name in key) for row in rows])
+        )
+    )
+    return {tuple(values): row_id for row_id, *values in found}
+
+
+def region_ids(records: list[GazetteerRecord]) -> tuple[dict, dict]:
+    """Get or create the countries and states of the records.
+
+    :return: Country ids by ``(name,)`` and state ids by ``(country_id, name)``.
+    """
+    countries = _get_or_create_ids(
+        Country,
+        [{"name": name} for name in {record.country for record in records} - {None}],
+        ("name",),
+    )
+    states = _get_or_create_ids(
+        State,
+        [
+            {"country_id": countries[country,], "name": state}
+            for country, state in {(record.country, record.state) for record in records}
+            if country is not None and state is not None
+        ],
+        ("country_id", "name"),
+    )
+    return countries, states
+
+
+def upsert_localities(records: list[GazetteerRecord]) -> None:
+    """Insert the localities or update the existing ones with the same ``osm_id``."""
+    countries, states = region_ids(records)
+    rows = []
+    for record in records:
+        country_id = countries.get((record.country,))
+        state_id = states.get((country_id, record.state))
+        rows.append(
+            {**record._asdict(), "country_id": country_id, "state_id": state_id}
+        )
+    table = table_of(Locality)
+    insert = dialect_insert(db.session, table)
+    db.session.execute(
+        insert.on_conflict_do_update(
+            index_elements=[table.c.osm_id],
+            set_={
+                name: insert.excluded[name]
+                for name in (
+                    "latitude",
+                    "longitude",
+                    "name",
+                    "state",
+                    "country",
+                    "state_id",
+                    "country_id",
+                )
+            },
+        ),
+        rows,
+    )
+
+
+class ImportProgress(NamedTuple):
+    """Records read from the start of the file and invalid records among them."""
+
+    records: int
+    invalid: int
+
+
+def import_gazetteer(
+    records: Iterable[GazetteerRecord | None],
+    batch_size: int = 5000,
+    skip: int = 0,
+    on_batch: Callable[[ImportProgress], None] | None = None,
+) -> ImportProgress:
+    """Upsert the records in batches, committing every batch.
+
+    :param records: Records from one of the ``READERS``, None for invalid ones.
+    :param batch_size: Records inserted and committed together.
+    :param skip: Records to skip from the start, to resume an interrupted import.
+    :param on_batch: Called with the progress after every committed batch.
+    :return: The progress after the last batch.
+    """
+    progress = ImportProgress(records=skip, invalid=0)
+    records = itertools.islice(records, skip, None)
+    while batch := list(itertools.islice(records, batch_size)):
+        valid = {record.osm_id: record for record in batch if record is not None}
+        if valid:
+            upsert_localities(list(valid.values()))
+        db.session.commit()
+        progress = ImportProgress(
+            records=progress.records + len(batch),
+            invalid=progress.invalid + sum(record is None for record in batch),
+        )
+        if on_batch is not None:
+            on_batch(progress)
+    return progress
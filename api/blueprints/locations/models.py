@@ -1,3 +1,4 @@
+import datetime
 from typing import TYPE_CHECKING
 
 import sqlalchemy as sa
@@ -10,13 +11,162 @@ if TYPE_CHECKING:
     from api.blueprints.posts.models import Post
 
 
-class Locality(db.Model):
+LOCATION_COUNTRY = "country"
+LOCATION_STATE = "state"
+LOCATION_LOCALITY = "locality"
+
+
+class LocationStats(db.Model):
+    """Counts of a country, state or locality maintained by ``stats``.
+
+    ``states`` is counted for countries and ``localities`` for states only.
+    """
+
+    __tablename__ = "location_stats"
+    kind: so.Mapped[str] = so.mapped_column(sa.String(10), primary_key=True)
+    location_id: so.Mapped[int] = so.mapped_column(sa.Integer, primary_key=True)
+    users: so.Mapped[int] = so.mapped_column(
+        sa.Integer, default=0, server_default="0", nullable=False
+    )
+    posts: so.Mapped[int] = so.mapped_column(
+        sa.Integer, default=0, server_default="0", nullable=False
+    )
+    approved_solutions: so.Mapped[int] = so.mapped_column(
+        sa.Integer, default=0, server_default="0", nullable=False
+    )
+    states: so.Mapped[int] = so.mapped_column(
+        sa.Integer, default=0, server_default="0", nullable=False
+    )
+    localities: so.Mapped[int] = so.mapped_column(
+        sa.Integer, default=0, server_default="0", nullable=False
+    )
+
+    def __repr__(self):
+        return f"<LocationStats {self.kind}:{self.location_id}>"
+
+
+def _stats_relationship(model_name: str, kind: str) -> so.Mapped[LocationStats | None]:
+    return so.relationship(
+        LocationStats,
+        primaryjoin=f"and_(LocationStats.kind == '{kind}', "
+        f"foreign(LocationStats.location_id) == {model_name}.id)",
+        viewonly=True,
+        uselist=False,
+    )
+
+
+class LocationStatsMixin:
+    """Counts of the location read from its ``location_stats`` row."""
+
+    stats: LocationStats | None
+
+    @property
+    def users_count(self) -> int:
+        return self.stats.users if self.stats else 0
+
+    @property
+    def posts_count(self) -> int:
+        return self.stats.posts if self.stats else 0
+
+    @property
+    def approved_solutions_count(self) -> int:
+        return self.stats.approved_solutions if self.stats else 0
+
+
+class Country(LocationStatsMixin, db.Model):
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    name: so.Mapped[str] = so.mapped_column(sa.String(100), unique=True, nullable=False)
+    created_at: so.Mapped[datetime.datetime] = so.mapped_column(
+        sa.DateTime, server_default=sa.func.now()
+    )
+    states: so.Mapped[list["State"]] = so.relationship(back_populates="country")
+    stats: so.Mapped[LocationStats | None] = _stats_relationship(
+        "Country", LOCATION_COUNTRY
+    )
+
+    @property
+    def states_count(self) -> int:
+        return self.stats.states if self.stats else 0
+
+    def __repr__(self):
+        return f"<Country {self.id}: {self.name}>"
+
+
+class State(LocationStatsMixin, db.Model):
+    __table_args__ = (sa.UniqueConstraint("country_id", "name"),)
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    name: so.Mapped[str] = so.mapped_column(sa.String(100), nullable=False)
+    country_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey("country.id"), nullable=False
+    )
+    country: so.Mapped[Country] = so.relationship(back_populates="states")
+    created_at: so.Mapped[datetime.datetime] = so.mapped_column(
+        sa.DateTime, server_default=sa.func.now()
+    )
+    stats: so.Mapped[LocationStats | None] = _stats_relationship(
+        "State", LOCATION_STATE
+    )
+
+    @property
+    def localities_count(self) -> int:
+        return self.stats.localities if self.stats else 0
+
+    def __repr__(self):
+        return f"<State {self.id}: {self.name}>"
+
+
+class Locality(LocationStatsMixin, db.Model):
     id: so.Mapped[int] = so.mapped_column(primary_key=True)
     latitude: so.Mapped[float] = so.mapped_column(sa.Float, nullable=False)
     longitude: so.Mapped[float] = so.mapped_column(sa.Float, nullable=False)
-    osm_id: so.Mapped[int] = so.mapped_column(sa.Integer, unique=True, nullable=True)
+    # OSM ids of nodes exceed 32 bits
+    osm_id: so.Mapped[int] = so.mapped_column(sa.BigInteger, unique=True, nullable=True)
+    # filled by the gazetteer import, localities found with Nominatim have no names
+    name: so.Mapped[str | None] = so.mapped_column(sa.String(100), nullable=True)
+    state: so.Mapped[str | None] = so.mapped_column(sa.String(100), nullable=True)
+    country: so.Mapped[str | None] = so.mapped_column(sa.String(100), nullable=True)
+    # the state and country above as rows, linked by the gazetteer import
+    state_id: so.Mapped[int | None] = so.mapped_column(
+        sa.ForeignKey("state.id"), nullable=True, index=True
+    )
+    country_id: so.Mapped[int | None] = so.mapped_column(
+        sa.ForeignKey("country.id"), nullable=True, index=True
+    )
+    created_at: so.Mapped[datetime.datetime] = so.mapped_column(
+        sa.DateTime, server_default=sa.func.now()
+    )
+    # coordinates supplied by a client while the geocoding provider was unavailable
+    approximate: so.Mapped[bool] = so.mapped_column(
+        default=False, server_default=sa.false()
+    )
     users: so.Mapped[list["User"]] = so.relationship(back_populates="locality")
     posts: so.Mapped[list["Post"]] = so.relationship(back_populates="locality")
+    stats: so.Mapped[LocationStats | None] = _stats_relationship(
+        "Locality", LOCATION_LOCALITY
+    )
 
     def __repr__(self):
         return f"<Locality id={self.id} lat={self.latitude} lon={self.longitude}>"
+
+
+class GeocodeCache(db.Model):
+    """Answers of geocoding providers by the provider's locality id.
+
+    Unknown ids are cached too, with None coordinates. The names of the locality,
+    its state and country are kept when the provider returns them.
+    """
+
+    __tablename__ = "geocode_cache"
+    provider: so.Mapped[str] = so.mapped_column(sa.String(20), primary_key=True)
+    external_id: so.Mapped[int] = so.mapped_column(sa.BigInteger, primary_key=True)
+    latitude: so.Mapped[float | None] = so.mapped_column(sa.Float, nullable=True)
+    longitude: so.Mapped[float | None] = so.mapped_column(sa.Float, nullable=True)
+    name: so.Mapped[str | None] = so.mapped_column(sa.String(100), nullable=True)
+    state: so.Mapped[str | None] = so.mapped_column(sa.String(100), nullable=True)
+    country: so.Mapped[str | None] = so.mapped_column(sa.String(100), nullable=True)
+    expires_at: so.Mapped[datetime.datetime] = so.mapped_column(
+        sa.DateTime(timezone=True), nullable=False
+    )
+
+    def __repr__(self):
+        return f"<GeocodeCache {self.provider}:{self.external_id}>"
@@ -0,0 +1,251 @@
+"""Reverse geocoding of coordinates to localities from local boundary polygons.
+
+Boundaries are read from the GeoJSON file set in ``LOCALITY_BOUNDARIES``,
+optionally compressed with gzip or bzip2. Every feature is a ``Polygon`` or
+``MultiPolygon`` with the OSM id of its locality in the ``osm_id`` property and
+optionally ``name``, ``state``, ``country`` and a ``latitude`` and ``longitude``
+label point. Features without a valid id or geometry are skipped.
+
+The bounding boxes of the boundaries are packed into a static R-tree with the
+Sort-Tile-Recursive algorithm, candidates found in the tree are checked with an
+exact point-in-polygon test. Nested boundaries are resolved to the smallest one.
+Coordinates are treated as planar, boundaries crossing the antimeridian must be
+split.
+"""
+
+import json
+import math
+import threading
+from collections.abc import Iterator, Sequence
+from pathlib import Path
+from typing import Generic, NamedTuple, TypeVar
+
+from flask import current_app
+
+from api.blueprints.locations.gazetteer import NAME_LENGTH, open_binary
+
+T = TypeVar("T")
+
+# (min_lng, min_lat, max_lng, max_lat)
+BBox = tuple[float, float, float, float]
+# closed rings as separate longitude and latitude tuples
+Ring = tuple[tuple[float, ...], tuple[float, ...]]
+
+
+def _ring_bbox(ring: Ring) -> BBox:
+    xs, ys = ring
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _union(boxes: Sequence[BBox]) -> BBox:
+    return (
+        min(box[0] for box in boxes),
+        min(box[1] for box in boxes),
+        max(box[2] for box in boxes),
+        max(box[3] for box in boxes),
+    )
+
+
+def _ring_area_centroid(ring: Ring) -> tuple[float, float, float]:
+    """Return the signed area and the centroid of the ring, by the shoelace formula."""
+    xs, ys = ring
+    area = cx = cy = 0.0
+    for i in range(len(xs) - 1):
+        cross = xs[i] * ys[i + 1] - xs[i + 1] * ys[i]
+        area += cross
+        cx += (xs[i] + xs[i + 1]) * cross
+        cy += (ys[i] + ys[i + 1]) * cross
+    area /= 2
+    if area == 0:
+        return 0.0, xs[0], ys[0]
+    return area, cx / (6 * area), cy / (6 * area)
+
+
+def _ring_contains(ring: Ring, x: float, y: float) -> bool:
+    """Ray casting, crossings of the ring by a ray from the point to the east."""
+    xs, ys = ring
+    inside = False
+    x1, y1 = xs[-1], ys[-1]
+    for x2, y2 in zip(xs, ys, strict=True):
+        if (y1 > y) != (y2 > y) and x < (x2 - x1) * (y - y1) / (y2 - y1) + x1:
+            inside = not inside
+        x1, y1 = x2, y2
+    return inside
+
+
+class Boundary(NamedTuple):
+    """Boundary of a locality, polygons are lists of an exterior ring and holes."""
+
+    osm_id: int
+    polygons: tuple[tuple[Ring, ...], ...]
+    bbox: BBox
+    area: float
+    latitude: float
+    longitude: float
+    name: str | None = None
+    state: str | None = None
+    country: str | None = None
+
+    def contains(self, latitude: float, longitude: float) -> bool:
+        min_lng, min_lat, max_lng, max_lat = self.bbox
+        if not (min_lat <= latitude <= max_lat and min_lng <= longitude <= max_lng):
+            return False
+        # odd crossings of all the rings of a polygon, holes included
+        return any(
+            sum(_ring_contains(ring, longitude, latitude) for ring in rings) % 2 == 1
+            for rings in self.polygons
+        )
+
+
+def _name(value) -> str | None:
+    return str(value)[:NAME_LENGTH] if value else None
+
+
+def _ring(coordinates) -> Ring | None:
+    points = [(float(point[0]), float(point[1])) for point in coordinates]
+    if len(points) < 3:
+        return None
+    if points[0] != points[-1]:
+        points.append(points[0])
+    xs, ys = zip(*points, strict=True)
+    return xs, ys
+
+
+def parse_boundary(feature) -> Boundary | None:
+    """Build a boundary from a GeoJSON feature, None if it is invalid."""
+    try:
+        properties = feature.get("properties") or {}
+        geometry = feature["geometry"]
+        if geometry["type"] == "Polygon":
+            polygons = [geometry["coordinates"]]
+        elif geometry["type"] == "MultiPolygon":
+            polygons = geometry["coordinates"]
+        else:
+            return None
+        parsed = []
+        for polygon in polygons:
+            rings = tuple(ring for ring in map(_ring, polygon) if ring is not None)
+            if rings:
+                parsed.append(rings)
+        if not parsed:
+            return None
+        exteriors = [_ring_area_centroid(rings[0]) for rings in parsed]
+        area = sum(abs(exterior[0]) for exterior in exteriors)
+        _, longitude, latitude = max(exteriors, key=lambda exterior: abs(exterior[0]))
+        if properties.get("latitude") is not None:
+            latitude = float(properties["latitude"])
+            longitude = float(properties["longitude"])
+        return Boundary(
+            osm_id=int(properties["osm_id"]),
+            polygons=tuple(parsed),
+            bbox=_union([_ring_bbox(rings[0]) for rings in parsed]),
+            area=area,
+            latitude=latitude,
+            longitude=longitude,
+            name=_name(properties.get("name")),
+            state=_name(properties.get("state")),
+            country=_name(properties.get("country")),
+        )
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+def read_boundaries(path: Path) -> Iterator[Boundary]:
+    with open_binary(path) as stream:
+        collection = json.load(stream)
+    for feature in collection.get("features", ()):
+        boundary = parse_boundary(feature)
+        if boundary is not None:
+            yield boundary
+
+
+class STRTree(Generic[T]):
+    """Static R-tree of bounding boxes packed with Sort-Tile-Recursive.
+
+    Entries are sorted into vertical slices by the centers of their boxes and
+    every slice into nodes of ``node_capacity`` entries, level by level up to the
+    root. Nodes are tuples of a box and either child nodes or a leaf item.
+    """
+
+    def __init__(self, entries: Sequence[tuple[BBox, T]], node_capacity: int = 16):
+        self.node_capacity = node_capacity
+        self.size = len(entries)
+        level = [(bbox, item, True) for bbox, item in entries]
+        while len(level) > 1:
+            level = self._pack(level)
+        self._root = level[0] if level else None
+
+    def _pack(self, nodes: list) -> list:
+        capacity = self.node_capacity
+        slices = math.ceil(math.sqrt(math.ceil(len(nodes) / capacity)))
+        slice_size = slices * capacity
+        nodes = sorted(nodes, key=lambda node: node[0][0] + node[0][2])
+        parents = []
+        for start in range(0, len(nodes), slice_size):
+            vertical_slice = sorted(
+                nodes[start : start + slice_size],
+                key=lambda node: node[0][1] + node[0][3],
+            )
+            for group_start in range(0, len(vertical_slice), capacity):
+                group = vertical_slice[group_start : group_start + capacity]
+                parents.append((_union([node[0] for node in group]), group, False))
+        return parents
+
+    def query_point(self, x: float, y: float) -> Iterator[T]:
+        """Yield the items whose boxes contain the point."""
+        if self._root is None:
+            return
+        stack: list[tuple] = [self._root]
+        while stack:
+            (min_x, min_y, max_x, max_y), content, leaf = stack.pop()
+            if not (min_x <= x <= max_x and min_y <= y <= max_y):
+                continue
+            if leaf:
+                yield content
+            else:
+                stack.extend(content)
+
+
+class ReverseGeocoder:
+    """Finds the locality boundaries containing coordinates."""
+
+    def __init__(self, boundaries: Sequence[Boundary]):
+        self._boundaries = {boundary.osm_id: boundary for boundary in boundaries}
+        self._tree = STRTree(
+            [(boundary.bbox, boundary) for boundary in self._boundaries.values()]
+        )
+
+    def __len__(self) -> int:
+        return len(self._boundaries)
+
+    def get(self, osm_id: int) -> Boundary | None:
+        return self._boundaries.get(osm_id)
+
+    def locate(self, latitude: float, longitude: float) -> Boundary | None:
+        """Return the smallest boundary containing the coordinates."""
+        return min(
+            (
+                boundary
+                for boundary in self._tree.query_point(longitude, latitude)
+                if boundary.contains(latitude, longitude)
+            ),
+            key=lambda boundary: boundary.area,
+            default=None,
+        )
+
+
+_loading = threading.Lock()
+
+
+def get_reverse_geocoder() -> ReverseGeocoder | None:
+    """Return the geocoder of the current application, None without boundaries."""
+    path = current_app.config["LOCALITY_BOUNDARIES"]
+    if not path:
+        return None
+    with _loading:
+        geocoder = current_app.extensions.get("reverse_geocoder")
+        if geocoder is None:
+            geocoder = ReverseGeocoder(list(read_boundaries(Path(path))))
+            current_app.logger.info("Loaded %s locality boundaries", len(geocoder))
+            current_app.extensions["reverse_geocoder"] = geocoder
+    return geocoder
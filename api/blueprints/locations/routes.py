@@ -4,14 +4,21 @@ from apiflask.views import MethodView
 from flask_jwt_extended import jwt_required
 
 from api import db
-from api.blueprints.common.schemas import pagination_query_schema
+from api.blueprints.common.routes import create_pagination_response
+from api.blueprints.common.schemas import loader_options, pagination_query_schema
 from api.blueprints.locations import locations
+from api.blueprints.locations.models import Country as CountryModel
+from api.blueprints.locations.models import Locality as LocalityModel
+from api.blueprints.locations.models import State as StateModel
+from api.blueprints.locations.reverse import get_reverse_geocoder
 from api.blueprints.locations.schemas import (
     CountryPaginationSchema,
     CountrySchema,
     LocalityPaginationSchema,
     LocalitySchema,
     LocationNameInputSchema,
+    ReverseGeocodingQuerySchema,
+    ReverseGeocodingSchema,
     StatePaginationSchema,
     StateSchema,
 )
@@ -19,17 +26,28 @@ from api.services import LocationService
 
 
 class Countries(MethodView):
-    @locations.input(pagination_query_schema(200, 200), location="query")
+    @locations.input(
+        pagination_query_schema(default_per_page=200, max_per_page=200),
+        location="query",
+    )
     @locations.output(CountryPaginationSchema)
     def get(self, query_data):
         """Get all countries"""
-        return {}, 501
+        return create_pagination_response(
+            CountryModel.query,
+            CountryModel,
+            "locations.countries",
+            "name",
+            "asc",
+            schema=CountryPaginationSchema,
+            **query_data,
+        )
 
     @jwt_required()
     @locations.input(LocationNameInputSchema)
     @locations.output(CountrySchema, status_code=201)
     @locations.doc(security="jwt_access_token", responses={201: "Country created"})
-    def post(self):
+    def post(self, json_data):
         """Create a new country. Activated account required."""
         return {}, 501
 
@@ -38,15 +56,29 @@ class Country(MethodView):
     @locations.output(CountrySchema)
     def get(self, country_id):
         """Get a country by ID"""
-        return {}, 501
+        return CountryModel.query.options(*loader_options(CountrySchema)).get_or_404(
+            country_id, description="Country not found"
+        )
 
 
 class CountryStates(MethodView):
-    @locations.input(pagination_query_schema(50, 200), location="query")
+    @locations.input(
+        pagination_query_schema(default_per_page=50, max_per_page=200), location="query"
+    )
     @locations.output(StatePaginationSchema)
     def get(self, country_id, query_data):
         """Get all states for the country"""
-        return {}, 501
+        CountryModel.query.get_or_404(country_id, description="Country not found")
+        return create_pagination_response(
+            StateModel.query.filter_by(country_id=country_id),
+            StateModel,
+            "locations.country_states",
+            "name",
+            "asc",
+            schema=StatePaginationSchema,
+            country_id=country_id,
+            **query_data,
+        )
 
     @jwt_required()
     @locations.input(LocationNameInputSchema)
@@ -54,32 +86,56 @@ class CountryStates(MethodView):
     @locations.doc(
         security="jwt_access_token", responses={201: "State created for the country"}
     )
-    def post(self, country_id):
+    def post(self, country_id, json_data):
         """Create a new state for the country. Activated account required."""
         return {}, 501
 
 
 class States(MethodView):
-    @locations.input(pagination_query_schema(50, 200), location="query")
+    @locations.input(
+        pagination_query_schema(default_per_page=50, max_per_page=200), location="query"
+    )
     @locations.output(StatePaginationSchema)
     def get(self, query_data):
         """Get all states"""
-        return {}, 501
+        return create_pagination_response(
+            StateModel.query,
+            StateModel,
+            "locations.states",
+            "name",
+            "asc",
+            schema=StatePaginationSchema,
+            **query_data,
+        )
 
 
 class State(MethodView):
     @locations.output(StateSchema)
     def get(self, state_id):
         """Get a state by ID"""
-        return {}, 501
+        return StateModel.query.options(*loader_options(StateSchema)).get_or_404(
+            state_id, description="State not found"
+        )
 
 
 class StateLocalities(MethodView):
-    @locations.input(pagination_query_schema(50, 200), location="query")
+    @locations.input(
+        pagination_query_schema(default_per_page=50, max_per_page=200), location="query"
+    )
     @locations.output(LocalityPaginationSchema)
     def get(self, state_id, query_data):
         """Get all localities for the state"""
-        return {}, 501
+        StateModel.query.get_or_404(state_id, description="State not found")
+        return create_pagination_response(
+            LocalityModel.query.filter_by(state_id=state_id),
+            LocalityModel,
+            "locations.state_localities",
+            "name",
+            "asc",
+            schema=LocalityPaginationSchema,
+            state_id=state_id,
+            **query_data,
+        )
 
     @jwt_required()
     @locations.input(LocationNameInputSchema)
@@ -87,24 +143,59 @@ class StateLocalities(MethodView):
     @locations.doc(
         security="jwt_access_token", responses={201: "Locality created for the state"}
     )
-    def post(self, state_id):
+    def post(self, state_id, json_data):
         """Create a new locality for the state. Activated account required."""
+        # localities need coordinates, they are created from geocoding results
         return {}, 501
 
 
 class Localities(MethodView):
-    @locations.input(pagination_query_schema(50, 200), location="query")
+    @locations.input(
+        pagination_query_schema(default_per_page=50, max_per_page=200), location="query"
+    )
     @locations.output(LocalityPaginationSchema)
     def get(self, query_data):
         """Get all localities"""
-        return {}, 501
+        return create_pagination_response(
+            LocalityModel.query,
+            LocalityModel,
+            "locations.localities",
+            "name",
+            "asc",
+            schema=LocalityPaginationSchema,
+            **query_data,
+        )
+
+
+class ReverseGeocoding(MethodView):
+    @locations.input(ReverseGeocodingQuerySchema, location="query")
+    @locations.output(ReverseGeocodingSchema)
+    @locations.doc(
+        responses={
+            404: "No locality at the coordinates",
+            501: "Locality boundaries are not configured",
+        }
+    )
+    def get(self, query_data):
+        """Get the locality at the coordinates from the local locality boundaries"""
+        geocoder = get_reverse_geocoder()
+        if geocoder is None:
+            abort(501, message="Locality boundaries are not configured")
+        boundary = geocoder.locate(query_data["lat"], query_data["lng"])
+        if boundary is None:
+            abort(404, message="No locality at the coordinates")
+        # read only, the locality is stored when a post is saved with it
+        locality = LocationService.find_locality(boundary.osm_id, "nominatim")
+        return {**boundary._asdict(), "id": locality.id if locality else None}
 
 
 class Locality(MethodView):
     @locations.output(LocalitySchema)
     def get(self, locality_id):
         """Get a locality by ID"""
-        return {}, 501
+        return LocalityModel.query.options(*loader_options(LocalitySchema)).get_or_404(
+            locality_id, description="Locality not found"
+        )
 
 
 # URL rules
@@ -125,15 +216,18 @@ locations.add_url_rule(
 )
 
 locations.add_url_rule("/localities", view_func=Localities.as_view("localities"))
+locations.add_url_rule(
+    "/localities/reverse", view_func=ReverseGeocoding.as_view("reverse_geocoding")
+)
 locations.add_url_rule(
     "/localities/<int:locality_id>", view_func=Locality.as_view("locality")
 )
 
 
-def get_or_create_locality(locality_id, locality_provider):
+def get_or_create_locality(locality_id, locality_provider, fallback_coordinates=None):
     try:
         return LocationService.get_or_create_locality(
-            locality_id, locality_provider, db.session
+            locality_id, locality_provider, db.session, fallback_coordinates
         )
     except ValueError:
         abort(400, message="Invalid locality id")
@@ -141,3 +235,31 @@ def get_or_create_locality(locality_id, locality_provider):
         abort(500, message="Location service unavailable")
     except NotImplementedError as e:
         abort(501, message=str(e))
+
+
+def find_locality(locality_id, locality_provider):
+    try:
+        return LocationService.find_locality(locality_id, locality_provider)
+    except NotImplementedError as e:
+        abort(501, message=str(e))
+
+
+def locality_at(latitude, longitude, locality_id=None, locality_provider="nominatim"):
+    """Return the locality at the coordinates from the local locality boundaries.
+
+    A given Nominatim locality must contain the coordinates if its boundary is
+    known. Returns None when the boundaries cannot tell, the locality is then
+    looked up by its id.
+    """
+    geocoder = get_reverse_geocoder()
+    if geocoder is None or locality_provider != "nominatim":
+        return None
+    if locality_id is None:
+        boundary = geocoder.locate(latitude, longitude)
+    else:
+        boundary = geocoder.get(locality_id)
+        if boundary is not None and not boundary.contains(latitude, longitude):
+            abort(400, message="The coordinates are outside the locality")
+    if boundary is None:
+        return None
+    return LocationService.get_or_create_boundary_locality(boundary, db.session)
@@ -1,42 +1,77 @@
-from apiflask.fields import DateTime, Integer, String
-from apiflask.validators import Length
+from typing import ClassVar
+
+from apiflask.fields import Constant, DateTime, Float, Integer, String
+from apiflask.validators import Length, Range
+from sqlalchemy import orm as so
 
 from api.blueprints.common.schemas import CamelCaseSchema, pagination_schema
 
 
+def _load_country_stats():
+    from api.blueprints.locations.models import Country
+
+    return [so.joinedload(Country.stats)]
+
+
+def _load_state_stats():
+    from api.blueprints.locations.models import State
+
+    return [so.joinedload(State.stats)]
+
+
+def _load_locality_stats():
+    from api.blueprints.locations.models import Locality
+
+    return [so.joinedload(Locality.stats)]
+
+
+# count fields read from the stats row of the location
+STATS_FIELDS = ("users", "posts", "approved_solutions")
+
+
 class CountrySchema(CamelCaseSchema):
+    field_loader_options: ClassVar = dict.fromkeys(
+        (*STATS_FIELDS, "states"), _load_country_stats
+    )
+
     id = Integer()
     name = String(
         metadata={"x-faker": "address.country"}, validate=Length(min=1, max=100)
     )
-    users = Integer()
-    posts = Integer()
-    approved_solutions = Integer()
-    states = Integer()
+    users = Integer(attribute="users_count")
+    posts = Integer(attribute="posts_count")
+    approved_solutions = Integer(attribute="approved_solutions_count")
+    states = Integer(attribute="states_count")
     created_at = DateTime(metadata={"x-faker": "date.past"})
 
 
 class StateSchema(CamelCaseSchema):
+    field_loader_options: ClassVar = dict.fromkeys(
+        (*STATS_FIELDS, "localities"), _load_state_stats
+    )
+
     id = Integer()
     name = String(
         metadata={"x-faker": "address.state"}, validate=Length(min=1, max=100)
     )
     country_id = Integer()
-    users = Integer()
-    posts = Integer()
-    approved_solutions = Integer()
-    localities = Integer()
+    users = Integer(attribute="users_count")
+    posts = Integer(attribute="posts_count")
+    approved_solutions = Integer(attribute="approved_solutions_count")
+    localities = Integer(attribute="localities_count")
     created_at = DateTime(metadata={"x-faker": "date.past"})
 
 
 class LocalitySchema(CamelCaseSchema):
+    field_loader_options: ClassVar = dict.fromkeys(STATS_FIELDS, _load_locality_stats)
+
     id = Integer()
     name = String(metadata={"x-faker": "address.city"}, validate=Length(min=1, max=100))
     country_id = Integer()
     state_id = Integer()
-    users = Integer()
-    posts = Integer()
-    approved_solutions = Integer()
+    users = Integer(attribute="users_count")
+    posts = Integer(attribute="posts_count")
+    approved_solutions = Integer(attribute="approved_solutions_count")
     created_at = DateTime(metadata={"x-faker": "date.past"})
 
 
@@ -44,6 +79,27 @@ class LocationNameInputSchema(CamelCaseSchema):
     name = String(validate=Length(min=1, max=100), required=True)
 
 
+class ReverseGeocodingQuerySchema(CamelCaseSchema):
+    lat = Float(required=True, validate=Range(-90, 90))
+    lng = Float(required=True, validate=Range(-180, 180))
+
+
+class ReverseGeocodingSchema(CamelCaseSchema):
+    id = Integer(
+        allow_none=True,
+        metadata={"description": "null until a post with the locality is saved"},
+    )
+    locality_id = Integer(
+        attribute="osm_id", metadata={"description": "provider's locality id"}
+    )
+    locality_provider = Constant("nominatim")
+    name = String(metadata={"x-faker": "address.city"})
+    state = String(metadata={"x-faker": "address.state"})
+    country = String(metadata={"x-faker": "address.country"})
+    latitude = Float()
+    longitude = Float()
+
+
 CountryPaginationSchema = pagination_schema(CountrySchema)
 StatePaginationSchema = pagination_schema(StateSchema)
 LocalityPaginationSchema = pagination_schema(LocalitySchema)
@@ -0,0 +1,311 @@
+"""Counts of users, posts and approved solutions by locality, state and country.
+
+The counts are stored in ``location_stats`` and updated by mapper events in the
+transaction of every ORM write of users, posts, solutions, localities and states.
+The counts of a locality are added to its state and country as well, states are
+counted for countries and localities for states.
+
+Writes bypassing the ORM, like bulk updates and the gazetteer import, are not
+counted, ``rebuild_location_stats`` recomputes the table from the source tables.
+"""
+
+from collections import defaultdict
+
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy import orm as so
+
+from api import db
+from api.blueprints.auth.models import User
+from api.blueprints.common.models import dialect_insert, table_of
+from api.blueprints.locations.models import (
+    LOCATION_COUNTRY,
+    LOCATION_LOCALITY,
+    LOCATION_STATE,
+    Country,
+    Locality,
+    LocationStats,
+    State,
+)
+from api.blueprints.posts.models import Post
+from api.blueprints.solutions.models import Solution
+
+STATS_COLUMNS = ("users", "posts", "approved_solutions", "states", "localities")
+# counts of a locality that are added to its state and country
+LOCALITY_COLUMNS = ("users", "posts", "approved_solutions")
+
+StatsKey = tuple[str, int]
+
+
+def _region_keys(state_id: int | None, country_id: int | None) -> list[StatsKey]:
+    keys = []
+    if state_id is not None:
+        keys.append((LOCATION_STATE, state_id))
+    if country_id is not None:
+        keys.append((LOCATION_COUNTRY, country_id))
+    return keys
+
+
+def locality_keys(connection: sa.Connection, locality_id: int | None) -> list[StatsKey]:
+    """Return the stats rows counting the locality: its own, its state and country."""
+    if locality_id is None:
+        return []
+    region = connection.execute(
+        sa.select(Locality.state_id, Locality.country_id).where(
+            Locality.id == locality_id
+        )
+    ).first()
+    return [(LOCATION_LOCALITY, locality_id), *_region_keys(*(region or (None, None)))]
+
+
+def add_stats(connection: sa.Connection, keys: list[StatsKey], **deltas: int) -> None:
+    """Add the deltas to the counts of every key, creating missing rows."""
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not keys or not deltas:
+        return
+    table = table_of(LocationStats)
+    insert = dialect_insert(connection, table).values(
+        [
+            {"kind": kind, "location_id": location_id, **deltas}
+            for kind, location_id in keys
+        ]
+    )
+    connection.execute(
+        insert.on_conflict_do_update(
+            index_elements=[table.c.kind, table.c.location_id],
+            set_={name: table.c[name] + insert.excluded[name] for name in deltas},
+        )
+    )
+
+
+def _change(target, name: str) -> tuple | None:
+    """Return the old and new value of a changed attribute, None if it is unchanged."""
+    history = so.attributes.get_history(target, name)
+    if not history.has_changes():
+        return None
+    old = history.deleted[0] if history.deleted else None
+    new = getattr(target, name)
+    return None if old == new else (old, new)
+
+
+def _post_locality_id(connection: sa.Connection, post_id: int) -> int | None:
+    return connection.scalar(sa.select(Post.locality_id).where(Post.id == post_id))
+
+
+def _delete_stats(connection: sa.Connection, kind: str, location_id: int) -> None:
+    connection.execute(
+        sa.delete(LocationStats).where(
+            LocationStats.kind == kind, LocationStats.location_id == location_id
+        )
+    )
+
+
+@event.listens_for(User, "after_insert")
+def count_new_user(mapper, connection, target):
+    add_stats(connection, locality_keys(connection, target.locality_id), users=1)
+
+
+@event.listens_for(User, "after_update")
+def move_user(mapper, connection, target):
+    change = _change(target, "locality_id")
+    if change is not None:
+        old, new = change
+        add_stats(connection, locality_keys(connection, old), users=-1)
+        add_stats(connection, locality_keys(connection, new), users=1)
+
+
+@event.listens_for(User, "after_delete")
+def count_deleted_user(mapper, connection, target):
+    add_stats(connection, locality_keys(connection, target.locality_id), users=-1)
+
+
+@event.listens_for(Post, "after_insert")
+def count_new_post(mapper, connection, target):
+    add_stats(connection, locality_keys(connection, target.locality_id), posts=1)
+
+
+@event.listens_for(Post, "after_update")
+def move_post(mapper, connection, target):
+    change = _change(target, "locality_id")
+    if change is None:
+        return
+    old, new = change
+    approved = connection.scalar(
+        sa.select(sa.func.count())
+        .select_from(Solution)
+        .where(Solution.post_id == target.id, Solution.approved)
+    )
+    add_stats(
+        connection,
+        locality_keys(connection, old),
+        posts=-1,
+        approved_solutions=-approved,
+    )
+    add_stats(
+        connection, locality_keys(connection, new), posts=1, approved_solutions=approved
+    )
+
+
+@event.listens_for(Post, "after_delete")
+def count_deleted_post(mapper, connection, target):
+    # solutions of the post are deleted before it and counted by their own events
+    add_stats(connection, locality_keys(connection, target.locality_id), posts=-1)
+
+
+def _count_approval(connection: sa.Connection, solution: Solution, sign: int) -> None:
+    locality_id = _post_locality_id(connection, solution.post_id)
+    add_stats(
+        connection, locality_keys(connection, locality_id), approved_solutions=sign
+    )
+
+
+@event.listens_for(Solution, "after_insert")
+def count_new_solution(mapper, connection, target):
+    if target.approved:
+        _count_approval(connection, target, 1)
+
+
+@event.listens_for(Solution, "after_update")
+def count_approval_toggle(mapper, connection, target):
+    change = _change(target, "approved")
+    if change is not None:
+        _count_approval(connection, target, 1 if change[1] else -1)
+
+
+@event.listens_for(Solution, "after_delete")
+def count_deleted_solution(mapper, connection, target):
+    if target.approved:
+        _count_approval(connection, target, -1)
+
+
+@event.listens_for(Locality, "after_insert")
+def count_new_locality(mapper, connection, target):
+    add_stats(connection, _region_keys(target.state_id, None), localities=1)
+
+
+@event.listens_for(Locality, "after_update")
+def move_locality(mapper, connection, target):
+    state_change = _change(target, "state_id")
+    country_change = _change(target, "country_id")
+    if state_change is None and country_change is None:
+        return
+    counts = connection.execute(
+        sa.select(
+            *(table_of(LocationStats).c[name] for name in LOCALITY_COLUMNS)
+        ).where(
+            LocationStats.kind == LOCATION_LOCALITY,
+            LocationStats.location_id == target.id,
+        )
+    ).first()
+    counts = dict(zip(LOCALITY_COLUMNS, counts or (0,) * 3, strict=True))
+    old_state, new_state = state_change or (target.state_id, target.state_id)
+    old_country, new_country = country_change or (target.country_id, target.country_id)
+    if state_change is not None:
+        add_stats(connection, _region_keys(old_state, None), localities=-1)
+        add_stats(connection, _region_keys(new_state, None), localities=1)
+    negated = {name: -count for name, count in counts.items()}
+    add_stats(connection, _region_keys(old_state, old_country), **negated)
+    add_stats(connection, _region_keys(new_state, new_country), **counts)
+
+
+@event.listens_for(Locality, "after_delete")
+def count_deleted_locality(mapper, connection, target):
+    add_stats(connection, _region_keys(target.state_id, None), localities=-1)
+    _delete_stats(connection, LOCATION_LOCALITY, target.id)
+
+
+@event.listens_for(State, "after_insert")
+def count_new_state(mapper, connection, target):
+    add_stats(connection, _region_keys(None, target.country_id), states=1)
+
+
+@event.listens_for(State, "after_delete")
+def count_deleted_state(mapper, connection, target):
+    add_stats(connection, _region_keys(None, target.country_id), states=-1)
+    _delete_stats(connection, LOCATION_STATE, target.id)
+
+
+@event.listens_for(Country, "after_delete")
+def count_deleted_country(mapper, connection, target):
+    _delete_stats(connection, LOCATION_COUNTRY, target.id)
+
+
+def compute_location_stats() -> dict[StatsKey, dict[str, int]]:
+    """Count everything from the source tables, keys without counts are left out."""
+    stats: dict[StatsKey, dict[str, int]] = defaultdict(
+        lambda: dict.fromkeys(STATS_COLUMNS, 0)
+    )
+    regions = {
+        locality_id: _region_keys(state_id, country_id)
+        for locality_id, state_id, country_id in db.session.execute(
+            sa.select(Locality.id, Locality.state_id, Locality.country_id)
+        )
+    }
+    locality_counts = {
+        "users": sa.select(User.locality_id, sa.func.count()).group_by(
+            User.locality_id
+        ),
+        "posts": sa.select(Post.locality_id, sa.func.count()).group_by(
+            Post.locality_id
+        ),
+        "approved_solutions": sa.select(Post.locality_id, sa.func.count())
+        .join(Solution, Solution.post_id == Post.id)
+        .where(Solution.approved)
+        .group_by(Post.locality_id),
+    }
+    for name, query in locality_counts.items():
+        for locality_id, count in db.session.execute(query):
+            if locality_id is None:
+                continue
+            keys = [(LOCATION_LOCALITY, locality_id), *regions.get(locality_id, ())]
+            for key in keys:
+                stats[key][name] += count
+    for country_id, count in db.session.execute(
+        sa.select(State.country_id, sa.func.count()).group_by(State.country_id)
+    ):
+        stats[LOCATION_COUNTRY, country_id]["states"] += count
+    for state_id, count in db.session.execute(
+        sa.select(Locality.state_id, sa.func.count()).group_by(Locality.state_id)
+    ):
+        if state_id is not None:
+            stats[LOCATION_STATE, state_id]["localities"] += count
+    return stats
+
+
+def rebuild_location_stats(batch_size: int = 1000) -> int:
+    """Recompute the whole ``location_stats`` table from the source tables.
+
+    :return: The number of stored rows.
+    """
+    stats = compute_location_stats()
+    db.session.execute(sa.delete(LocationStats))
+    rows = [
+        {"kind": kind, "location_id": location_id, **counts}
+        for (kind, location_id), counts in stats.items()
+    ]
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(sa.insert(LocationStats), rows[start : start + batch_size])
+    db.session.commit()
+    return len(rows)
+
+
+def check_location_stats() -> list[str]:
+    """Compare the stored counts with counts computed from the source tables.
+
+    :return: A description of every inconsistent row, empty if the counts are valid.
+    """
+    expected = compute_location_stats()
+    problems = []
+    for row in db.session.execute(sa.select(LocationStats)).scalars():
+        key = (row.kind, row.location_id)
+        counts = expected.pop(key, dict.fromkeys(STATS_COLUMNS, 0))
+        stored = {name: getattr(row, name) for name in STATS_COLUMNS}
+        if stored != counts:
+            problems.append(
+                f"{row.kind} {row.location_id} has {stored}, expected {counts}"
+            )
+    problems.extend(
+        f"{kind} {location_id} is missing, expected {counts}"
+        for (kind, location_id), counts in expected.items()
+    )
+    return problems
@@ -1,3 +1,5 @@
 from api.blueprints.common.routes import CustomAPIBlueprint
 
-posts = CustomAPIBlueprint("posts", __name__, tag="Posts operations", url_prefix="/")
+posts = CustomAPIBlueprint(
+    "posts", __name__, tag="Posts operations", url_prefix="/", cli_group="posts"
+)
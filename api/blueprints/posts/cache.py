@@ -0,0 +1,103 @@
+"""Tags of cached post responses and their invalidation after commits.
+
+- ``posts``: the unfiltered feed and the feed filtered by a state or country,
+- ``post:<id>``: a post and its solutions,
+- ``locality:<id>``: the feed filtered by a locality,
+- ``map``: map clusters and markers.
+
+The responses embed the names of the authors, renaming a user invalidates the
+feeds and the posts of the user and the posts the user solved.
+"""
+
+import sqlalchemy as sa
+from sqlalchemy import orm as so
+
+from api.blueprints.auth.models import User
+from api.blueprints.common.cache import invalidate_on_commit
+from api.blueprints.locations.models import Locality
+from api.blueprints.posts.models import Post, PostImage
+from api.blueprints.solutions.models import Solution, SolutionImage
+
+POSTS_TAG = "posts"
+MAP_TAG = "map"
+
+
+def post_tag(post_id: int) -> str:
+    return f"post:{post_id}"
+
+
+def locality_tag(locality_id: int) -> str:
+    return f"locality:{locality_id}"
+
+
+def _loaded_value(instance, attribute: str):
+    """Return the attribute without triggering a lazy load inside the flush."""
+    value = sa.inspect(instance).attrs[attribute].loaded_value
+    return None if value is so.NO_VALUE else value
+
+
+def _solution_post_id(image: SolutionImage) -> int | None:
+    """Find the post of the image's solution, querying it if it is not loaded."""
+    solution = _loaded_value(image, "solution")
+    if solution is not None:
+        return solution.post_id
+    session = so.object_session(image)
+    if session is None or image.solution_id is None:
+        return None
+    # autoflush is off while the session is flushing
+    return session.scalar(
+        sa.select(Solution.post_id).where(Solution.id == image.solution_id)
+    )
+
+
+def _author_tags(user: User) -> list[str]:
+    """Find the responses showing the user's name, querying the user's posts."""
+    session = so.object_session(user)
+    if session is None:
+        return []
+    tags = [POSTS_TAG]
+    for post_id, locality_id in session.execute(
+        sa.select(Post.id, Post.locality_id).where(Post.author_id == user.id)
+    ):
+        tags.append(post_tag(post_id))
+        if locality_id is not None:
+            tags.append(locality_tag(locality_id))
+    tags.extend(
+        post_tag(post_id)
+        for post_id in session.scalars(
+            sa.select(Solution.post_id).where(Solution.author_id == user.id)
+        )
+    )
+    return tags
+
+
+def _changed_tags(instance) -> list[str]:
+    if isinstance(instance, Post):
+        tags = [POSTS_TAG, MAP_TAG, post_tag(instance.id)]
+        locality_ids = {instance.locality_id}
+        locality_ids.update(so.attributes.get_history(instance, "locality_id").deleted)
+        tags.extend(
+            locality_tag(locality_id)
+            for locality_id in locality_ids
+            if locality_id is not None
+        )
+        return tags
+    if isinstance(instance, Locality):
+        return [POSTS_TAG]
+    if isinstance(instance, PostImage):
+        return [POSTS_TAG, MAP_TAG, post_tag(instance.post_id)]
+    if isinstance(instance, Solution):
+        return [post_tag(instance.post_id)]
+    if isinstance(instance, SolutionImage):
+        post_id = _solution_post_id(instance)
+        return [post_tag(post_id)] if post_id is not None else []
+    if isinstance(instance, User):
+        renamed = any(
+            so.attributes.get_history(instance, name).has_changes()
+            for name in ("firstname", "lastname")
+        )
+        return _author_tags(instance) if renamed else []
+    return []
+
+
+invalidate_on_commit(_changed_tags)
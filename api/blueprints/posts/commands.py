@@ -0,0 +1,54 @@
+import click
+import sqlalchemy as sa
+
+from api import db
+from api.blueprints.posts import posts
+from api.blueprints.posts.geocoding import resolve_post_locality
+from api.blueprints.posts.models import LOCALITY_PENDING, Post
+from api.blueprints.posts.services import (
+    check_cluster_pyramid,
+    rebuild_cluster_pyramid,
+)
+from api.services import NominatimService
+
+
+@posts.cli.command("rebuild-clusters")
+def rebuild_clusters():
+    """Rebuild the map cluster pyramid from scratch."""
+    cells = rebuild_cluster_pyramid()
+    click.echo(f"Cluster pyramid rebuilt with {cells} cells")
+
+
+@posts.cli.command("check-clusters")
+def check_clusters():
+    """Check the map cluster pyramid against the posts table."""
+    problems = check_cluster_pyramid()
+    for problem in problems:
+        click.echo(problem)
+    if problems:
+        raise click.ClickException(f"Found {len(problems)} inconsistent cells")
+    click.echo("Cluster pyramid is consistent")
+
+
+@posts.cli.command("resolve-localities")
+def resolve_localities():
+    """Look up the localities of posts left pending by geocoding errors."""
+    pending_posts = db.session.execute(
+        sa.select(Post.id, Post.pending_locality_id).where(
+            Post.locality_status == LOCALITY_PENDING
+        )
+    ).all()
+    post_ids = [post.id for post in pending_posts]
+    # looked up in batches, the posts are then resolved from the geocoding cache
+    NominatimService.get_latitude_longitude_many(
+        {
+            post.pending_locality_id
+            for post in pending_posts
+            if post.pending_locality_id is not None
+        }
+    )
+    statuses = [resolve_post_locality(post_id) for post_id in post_ids]
+    pending = statuses.count(LOCALITY_PENDING)
+    click.echo(f"Resolved {len(post_ids) - pending} of {len(post_ids)} pending posts")
+    if pending:
+        raise click.ClickException(f"{pending} posts are still pending")
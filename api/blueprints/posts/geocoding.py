@@ -0,0 +1,107 @@
+"""Background resolution of post localities.
+
+With ``ASYNC_GEOCODING`` enabled a post with a locality that is not in the
+database yet is stored at once with the ``pending`` locality status and the
+provider's id in ``pending_locality_id``. A pool of worker threads looks the
+locality up and sets ``locality_id``, or marks the locality ``invalid`` if the
+provider does not know the id. Posts left pending by provider errors are retried
+by ``flask posts resolve-localities``.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from flask import Flask, current_app
+
+from api import db
+from api.blueprints.posts.models import (
+    LOCALITY_INVALID,
+    LOCALITY_PENDING,
+    LOCALITY_RESOLVED,
+    Post,
+)
+from api.services import LocationService
+
+LOCALITY_PROVIDER = "nominatim"
+
+
+def resolve_post_locality(post_id: int) -> str | None:
+    """Resolve the pending locality of the post.
+
+    :return: The new locality status, None if the post is not pending anymore.
+    """
+    post = db.session.get(Post, post_id)
+    if post is None or post.locality_status != LOCALITY_PENDING:
+        return None
+    pending_locality_id = post.pending_locality_id
+    if pending_locality_id is None:  # nothing to look up
+        post.locality_status = LOCALITY_INVALID
+        db.session.commit()
+        return post.locality_status
+    try:
+        locality = LocationService.get_or_create_locality(
+            pending_locality_id, LOCALITY_PROVIDER, db.session
+        )
+    except ValueError:
+        locality = None
+    except requests.RequestException:
+        db.session.rollback()
+        return LOCALITY_PENDING
+    # the author may have changed the locality during the lookup
+    post = db.session.get(Post, post_id, with_for_update=True, populate_existing=True)
+    if (
+        post is None
+        or post.locality_status != LOCALITY_PENDING
+        or post.pending_locality_id != pending_locality_id
+    ):
+        db.session.commit()
+        return None
+    if locality is None:
+        post.locality_status = LOCALITY_INVALID
+    else:
+        post.locality = locality
+        post.locality_status = LOCALITY_RESOLVED
+        post.pending_locality_id = None
+    db.session.commit()
+    return post.locality_status
+
+
+class GeocodingWorker:
+    """Thread pool resolving post localities with its own application contexts."""
+
+    def __init__(self, app: Flask, max_workers: int):
+        self._app = app
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="geocoding"
+        )
+
+    def _run(self, post_id: int) -> str | None:
+        with self._app.app_context():
+            try:
+                return resolve_post_locality(post_id)
+            except Exception:
+                current_app.logger.exception(
+                    "Could not resolve the locality of post %s", post_id
+                )
+                raise
+            finally:
+                db.session.remove()
+
+    def submit(self, post_id: int) -> Future:
+        """Resolve the locality of a committed post in the background."""
+        return self._executor.submit(self._run, post_id)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+
+def get_geocoding_worker() -> GeocodingWorker:
+    """Return the geocoding worker of the current application."""
+    worker = current_app.extensions.get("geocoding_worker")
+    if worker is None:
+        worker = GeocodingWorker(
+            current_app._get_current_object(),  # type: ignore
+            current_app.config["GEOCODING_WORKERS"],
+        )
+        current_app.extensions["geocoding_worker"] = worker
+    return worker
@@ -5,7 +5,7 @@ from sqlalchemy import orm as so
 from sqlalchemy.ext.associationproxy import AssociationProxy, association_proxy
 
 from api import db
-from api.blueprints.common.models import TimestampMixin
+from api.blueprints.common.models import ImagePreviewMixin, TimestampMixin
 
 if TYPE_CHECKING:
     from api.blueprints.auth.models import User
@@ -14,6 +14,11 @@ if TYPE_CHECKING:
     from api.blueprints.uploads.models import Image
 
 
+LOCALITY_RESOLVED = "resolved"
+LOCALITY_PENDING = "pending"
+LOCALITY_INVALID = "invalid"
+
+
 class PostImage(db.Model):
     __tablename__ = "post_image"
     id: so.Mapped[int] = so.mapped_column(primary_key=True)
@@ -26,7 +31,16 @@ class PostImage(db.Model):
     image: so.Mapped["Image"] = so.relationship(backref="post_association")
 
 
-class Post(TimestampMixin, db.Model):
+class Post(TimestampMixin, ImagePreviewMixin, db.Model):
+    __table_args__ = (
+        # keyset pagination of the feed orders by (sort column, id)
+        sa.Index("ix_post_created_at_id", "created_at", "id"),
+        sa.Index("ix_post_edited_at_id", "edited_at", "id"),
+        # the feed filtered by a locality or the localities of a region
+        sa.Index("ix_post_locality_id", "locality_id"),
+        sa.Index("ix_post_pending_locality_id", "pending_locality_id"),
+    )
+    __edited_columns__ = ("title", "body", "latitude", "longitude")
     id: so.Mapped[int] = so.mapped_column(primary_key=True)
     title: so.Mapped[str] = so.mapped_column(sa.String(100), nullable=False)
     body: so.Mapped[str] = so.mapped_column(sa.String(10000), nullable=False)
@@ -36,10 +50,21 @@ class Post(TimestampMixin, db.Model):
         sa.ForeignKey("user.id"), nullable=False
     )
     author: so.Mapped["User"] = so.relationship(back_populates="posts")
-    locality_id: so.Mapped[int] = so.mapped_column(
-        sa.ForeignKey("locality.id"), nullable=False
+    # None while the locality is resolved in the background, see ``geocoding``
+    locality_id: so.Mapped[int | None] = so.mapped_column(
+        sa.ForeignKey("locality.id"), nullable=True
+    )
+    locality: so.Mapped["Locality | None"] = so.relationship(back_populates="posts")
+    locality_status: so.Mapped[str] = so.mapped_column(
+        sa.String(10),
+        default=LOCALITY_RESOLVED,
+        server_default=LOCALITY_RESOLVED,
+        nullable=False,
+    )
+    # provider's id of a pending locality
+    pending_locality_id: so.Mapped[int | None] = so.mapped_column(
+        sa.BigInteger, nullable=True
     )
-    locality: so.Mapped["Locality"] = so.relationship(back_populates="posts")
     solutions: so.Mapped[list["Solution"]] = so.relationship(
         back_populates="post", cascade="all, delete-orphan"
     )
@@ -52,3 +77,20 @@ class Post(TimestampMixin, db.Model):
 
     def __repr__(self):
         return f"<Post {self.id}: {self.title}>"
+
+
+class PostCluster(db.Model):
+    """Precomputed aggregate of the posts inside one map cell at one zoom level."""
+
+    __tablename__ = "post_cluster"
+    zoom: so.Mapped[int] = so.mapped_column(sa.SmallInteger, primary_key=True)
+    x: so.Mapped[int] = so.mapped_column(sa.Integer, primary_key=True)
+    y: so.Mapped[int] = so.mapped_column(sa.Integer, primary_key=True)
+    post_count: so.Mapped[int] = so.mapped_column(sa.Integer, nullable=False)
+    latitude_sum: so.Mapped[float] = so.mapped_column(sa.Float, nullable=False)
+    longitude_sum: so.Mapped[float] = so.mapped_column(sa.Float, nullable=False)
+    # equals the id of the only post in the cell when post_count is 1
+    post_id_sum: so.Mapped[int] = so.mapped_column(sa.BigInteger, nullable=False)
+
+    def __repr__(self):
+        return f"<PostCluster {self.zoom}/{self.x}/{self.y}: {self.post_count}>"
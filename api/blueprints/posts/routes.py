@@ -1,8 +1,7 @@
-from apiflask import abort
+from apiflask import FileSchema, abort
 from apiflask.views import MethodView
-from flask import url_for
+from flask import Response, current_app, url_for
 from flask_jwt_extended import get_jwt_identity, jwt_required
-from sqlalchemy.orm import joinedload
 
 from api import db
 from api.blueprints.comments.schemas import (
@@ -10,18 +9,44 @@ from api.blueprints.comments.schemas import (
     CommentOutSchema,
     CommentSortingSchema,
 )
-from api.blueprints.common.routes import create_pagination_response
+from api.blueprints.common.cache import add_cache_tags, cached_response
+from api.blueprints.common.routes import (
+    check_if_match,
+    create_pagination_response,
+    not_modified_response,
+    resource_version,
+    sparse_response,
+)
 from api.blueprints.common.schemas import (
     JSONPatchSchema,
     TextBodySchema,
+    loader_options,
     merge_schemas,
     pagination_query_schema,
+    sparse_fields_query_schema,
+    sparse_schema,
 )
 from api.blueprints.locations.models import Locality
-from api.blueprints.locations.routes import get_or_create_locality
+from api.blueprints.locations.routes import (
+    find_locality,
+    get_or_create_locality,
+    locality_at,
+)
 from api.blueprints.posts import posts
+from api.blueprints.posts.cache import (
+    MAP_TAG,
+    POSTS_TAG,
+    locality_tag,
+    post_tag,
+)
+from api.blueprints.posts.geocoding import get_geocoding_worker
+from api.blueprints.posts.models import (
+    LOCALITY_INVALID,
+    LOCALITY_PENDING,
+    LOCALITY_RESOLVED,
+    PostImage,
+)
 from api.blueprints.posts.models import Post as PostModel
-from api.blueprints.posts.models import PostImage
 from api.blueprints.posts.schemas import (
     MapBoundsQuerySchema,
     MapClustersOutSchema,
@@ -30,34 +55,110 @@ from api.blueprints.posts.schemas import (
     PostOutSchema,
     PostSortingFilteringSchema,
 )
+from api.blueprints.posts.services import (
+    CLUSTER_THRESHOLD_ZOOM,
+    cluster_posts_from_pyramid,
+    cluster_posts_in_grid,
+    map_post_item,
+    posts_in_bounds,
+)
+from api.blueprints.posts.tiles import MAX_TILE_ZOOM, TILE_MIMETYPE, get_tile
+from api.blueprints.search.index import get_search_index
 from api.blueprints.users.schemas import ReactionSchema
 
 
+def assign_locality(
+    post: PostModel,
+    locality_id: int | None,
+    locality_provider: str,
+    coordinates: tuple[float, float],
+) -> None:
+    """Set the locality of the post.
+
+    The locality is found from the post's coordinates with the local locality
+    boundaries when they are configured, the id is optional then. Otherwise with
+    ``ASYNC_GEOCODING`` a locality missing from the database is left pending
+    instead of being looked up, see ``geocoding``, and without it a new locality
+    is placed at the post's coordinates while the provider is unavailable.
+    """
+    locality = locality_at(*coordinates, locality_id, locality_provider)
+    if locality is None and locality_id is None:
+        abort(422, message="Locality id is required outside known localities")
+    if locality is None and current_app.config["ASYNC_GEOCODING"]:
+        locality = find_locality(locality_id, locality_provider)
+        if locality is None:
+            post.locality = None
+            post.locality_status = LOCALITY_PENDING
+            post.pending_locality_id = locality_id
+            return
+    if locality is None:
+        locality = get_or_create_locality(locality_id, locality_provider, coordinates)
+    post.locality = locality
+    post.locality_status = LOCALITY_RESOLVED
+    post.pending_locality_id = None
+
+
 class Posts(MethodView):
+    @cached_response()
     @posts.input(
         merge_schemas(
-            pagination_query_schema(default_per_page=50), PostSortingFilteringSchema
+            pagination_query_schema(default_per_page=50, cursor=True, count=True),
+            PostSortingFilteringSchema,
+            sparse_fields_query_schema(PostOutPaginationSchema),
         ),
         location="query",
     )
     @posts.output(PostOutPaginationSchema)
     def get(self, query_data):
         """Get all posts"""
-        query = PostModel.query
+        # posts with a locality unknown to the provider are not listed
+        query = PostModel.query.filter(PostModel.locality_status != LOCALITY_INVALID)
 
         locality_id = query_data.get("locality_id")
         locality_provider = query_data.get("locality_provider")
         if locality_id and locality_provider and locality_provider == "nominatim":
+            # posts waiting for the locality are listed by the provider's id
+            pending = db.and_(
+                PostModel.locality_status == LOCALITY_PENDING,
+                PostModel.pending_locality_id == int(locality_id),
+            )
             locality = Locality.query.filter_by(osm_id=int(locality_id)).first()
             if locality:
-                query = query.filter_by(locality_id=locality.id)
+                query = query.filter(
+                    db.or_(PostModel.locality_id == locality.id, pending)
+                )
+                add_cache_tags(locality_tag(locality.id))
             else:
-                # If locality not found, return an empty result by filtering for impossible ID
-                query = query.filter_by(locality_id=-1)
+                query = query.filter(pending)
+                add_cache_tags(POSTS_TAG)
+        else:
+            add_cache_tags(POSTS_TAG)
+        regions = [
+            (Locality.state_id, query_data.get("state_id")),
+            (Locality.country_id, query_data.get("country_id")),
+        ]
+        for column, region_id in regions:
+            if region_id is not None:
+                query = query.filter(
+                    PostModel.locality_id.in_(
+                        db.select(Locality.id).where(column == region_id)
+                    )
+                )
+                # localities are moved between regions without touching posts
+                add_cache_tags(POSTS_TAG)
+        if query_data.get("q"):
+            # a filter only, the feed keeps its order, /search ranks the matches
+            query = query.filter(get_search_index().matches(PostModel, query_data["q"]))
 
         if query_data.get("sort_by") in ["likes", "dislikes"]:
             query_data["sort_by"] = "created_at"  # until reactions are not implemented
-        return create_pagination_response(query, PostModel, "posts.posts", **query_data)
+        return create_pagination_response(
+            query,
+            PostModel,
+            "posts.posts",
+            schema=PostOutPaginationSchema,
+            **query_data,
+        )
 
     @jwt_required()
     @posts.input(PostInSchema)
@@ -68,9 +169,6 @@ class Posts(MethodView):
         from api.blueprints.uploads.models import Image
 
         user_id = int(get_jwt_identity())
-        locality = get_or_create_locality(
-            json_data["locality_id"], json_data["locality_provider"]
-        )
 
         post_data = {
             k: v
@@ -79,20 +177,28 @@ class Posts(MethodView):
         }
         new_post = PostModel(
             author_id=user_id,  # type: ignore
-            locality_id=locality.id,  # type: ignore
             **post_data,
         )
+        assign_locality(
+            new_post,
+            json_data.get("locality_id"),
+            json_data["locality_provider"],
+            (json_data["latitude"], json_data["longitude"]),
+        )
 
         db.session.add(new_post)
         db.session.flush()
 
         if json_data.get("images_ids"):
-            existing_image_ids = db.session.scalars(
-                db.select(Image.id).where(Image.id.in_(json_data["images_ids"]))
-            ).all()
-            non_existing_image_ids = set(json_data["images_ids"]) - set(
-                existing_image_ids
-            )
+            image_urls = {
+                row.id: row.url
+                for row in db.session.execute(
+                    db.select(Image.id, Image.url).where(
+                        Image.id.in_(json_data["images_ids"])
+                    )
+                )
+            }
+            non_existing_image_ids = set(json_data["images_ids"]) - set(image_urls)
             if non_existing_image_ids:
                 abort(
                     422,
@@ -104,42 +210,71 @@ class Posts(MethodView):
                 for order, image_id in enumerate(json_data["images_ids"])
             ]
             new_post.image_association = post_images
+            new_post.set_image_preview(
+                [image_urls[image_id] for image_id in json_data["images_ids"]]
+            )
 
         db.session.commit()
+        if new_post.locality_status == LOCALITY_PENDING:
+            get_geocoding_worker().submit(new_post.id)
 
         return new_post, 201, {"Location": url_for("posts.post", post_id=new_post.id)}
 
 
 class Post(MethodView):
+    @cached_response()
+    @posts.input(sparse_fields_query_schema(PostOutSchema), location="query")
     @posts.output(PostOutSchema)
-    def get(self, post_id):
+    @posts.doc(responses={304: "Post not modified"})
+    def get(self, post_id, query_data):
         """Get a post by ID"""
-        return PostModel.query.options(
-            joinedload(PostModel.locality), joinedload(PostModel.author)
-        ).get_or_404(post_id, description="Post not found")
+        add_cache_tags(post_tag(post_id))
+        fields = query_data.get("sparse_fields")
+        fields_schema = sparse_schema(PostOutSchema, fields) if fields else None
+        schema = fields_schema or PostOutSchema
+        post = PostModel.query.options(*loader_options(schema, PostModel)).get_or_404(
+            post_id, description="Post not found"
+        )
+        version = resource_version(post, *sorted(fields or ()))
+        not_modified = not_modified_response(version)
+        if not_modified is not None:
+            return not_modified
+        if fields_schema is not None:
+            response = sparse_response(fields_schema, post)
+            response.headers.update(version.headers)
+            return response
+        return post, 200, version.headers
 
     @jwt_required()
     @posts.input(PostInSchema)
     @posts.output(PostOutSchema)
     @posts.doc(
-        security="jwt_access_token", responses={403: "Forbidden", 200: "Post updated"}
+        security="jwt_access_token",
+        responses={
+            403: "Forbidden",
+            200: "Post updated",
+            412: "Post was modified since the version in If-Match",
+        },
     )
     def put(self, post_id, json_data):
         """Update a post by ID. Only the author can update the post."""
         from api.blueprints.uploads.models import Image
 
         user_id = int(get_jwt_identity())
-        post = PostModel.query.options(
-            joinedload(PostModel.locality), joinedload(PostModel.author)
-        ).get_or_404(post_id, description="Post not found")
+        post = PostModel.query.options(*loader_options(PostOutSchema)).get_or_404(
+            post_id, description="Post not found"
+        )
 
         if post.author_id != user_id:
             abort(403, message="You can only update your own posts")
+        check_if_match(resource_version(post))
 
-        locality = get_or_create_locality(
-            json_data["locality_id"], json_data["locality_provider"]
+        assign_locality(
+            post,
+            json_data.get("locality_id"),
+            json_data["locality_provider"],
+            (json_data["latitude"], json_data["longitude"]),
         )
-        post.locality = locality
 
         for key, value in json_data.items():
             if key not in [
@@ -149,13 +284,17 @@ class Post(MethodView):
             ] and hasattr(post, key):
                 setattr(post, key, value)
 
+        image_urls = {}
         if json_data.get("images_ids"):
-            existing_image_ids = db.session.scalars(
-                db.select(Image.id).where(Image.id.in_(json_data["images_ids"]))
-            ).all()
-            non_existing_image_ids = set(json_data["images_ids"]) - set(
-                existing_image_ids
-            )
+            image_urls = {
+                row.id: row.url
+                for row in db.session.execute(
+                    db.select(Image.id, Image.url).where(
+                        Image.id.in_(json_data["images_ids"])
+                    )
+                )
+            }
+            non_existing_image_ids = set(json_data["images_ids"]) - set(image_urls)
             if non_existing_image_ids:
                 abort(
                     422,
@@ -167,10 +306,15 @@ class Post(MethodView):
             for order, image_id in enumerate(json_data.get("images_ids") or [])
         ]
         post.image_association = post_images
+        post.set_image_preview(
+            [image_urls[image_id] for image_id in json_data.get("images_ids") or []]
+        )
 
         db.session.commit()
+        if post.locality_status == LOCALITY_PENDING:
+            get_geocoding_worker().submit(post.id)
 
-        return post
+        return post, 200, resource_version(post).headers
 
     @jwt_required()
     @posts.input(JSONPatchSchema)
@@ -246,10 +390,7 @@ class PostComments(MethodView):
 class MapClusters(MethodView):
     """Get posts clustered for map display based on zoom level and visible bounds."""
 
-    CLUSTER_THRESHOLD_ZOOM = (
-        16  # At this zoom level and above, show all posts without clustering
-    )
-
+    @cached_response(tags=[MAP_TAG])
     @posts.input(MapBoundsQuerySchema, location="query")
     @posts.output(MapClustersOutSchema)
     def get(self, query_data):
@@ -265,105 +406,32 @@ class MapClusters(MethodView):
         max_lng = query_data["max_lng"]
         zoom = query_data["zoom"]
 
-        posts_in_bounds = PostModel.query.filter(
-            PostModel.latitude.between(min_lat, max_lat),
-            PostModel.longitude.between(min_lng, max_lng),
-        ).all()
-
-        total_in_view = len(posts_in_bounds)
-
-        if zoom >= self.CLUSTER_THRESHOLD_ZOOM:
-            items = [
-                {
-                    "type": "post",
-                    "id": post.id,
-                    "latitude": post.latitude,
-                    "longitude": post.longitude,
-                    "title": post.title,
-                    "authorFirstName": post.author.firstname if post.author else None,
-                    "authorLastName": post.author.lastname if post.author else None,
-                    "createdAt": post.created_at.isoformat()
-                    if post.created_at
-                    else None,
-                    "thumbnailUrl": post.images[0].url if post.images else None,
-                }
-                for post in posts_in_bounds
-            ]
-            return {"items": items, "total_in_view": total_in_view}
+        if zoom >= CLUSTER_THRESHOLD_ZOOM:
+            markers = posts_in_bounds(min_lat, max_lat, min_lng, max_lng)
+            items = [map_post_item(marker) for marker in markers]
+            return {"items": items, "total_in_view": len(items)}
 
-        # Calculate grid size based on zoom level
-        # Lower zoom = fewer grid divisions, higher zoom = more divisions
-        grid_divisions = 25
+        if current_app.config["MAP_CLUSTERING"] == "pyramid":
+            return cluster_posts_from_pyramid(min_lat, max_lat, min_lng, max_lng, zoom)
+        return cluster_posts_in_grid(min_lat, max_lat, min_lng, max_lng)
 
-        lat_step = (max_lat - min_lat) / grid_divisions
-        lng_step = (max_lng - min_lng) / grid_divisions
 
-        # Create grid cells and assign posts to them
-        grid: dict[tuple[int, int], list] = {}
-        for post in posts_in_bounds:
-            if lat_step > 0 and lng_step > 0:
-                cell_row = min(
-                    int((post.latitude - min_lat) / lat_step), grid_divisions - 1
-                )
-                cell_col = min(
-                    int((post.longitude - min_lng) / lng_step), grid_divisions - 1
-                )
-            else:
-                cell_row, cell_col = 0, 0
-
-            key = (cell_row, cell_col)
-            if key not in grid:
-                grid[key] = []
-            grid[key].append(post)
-
-        # Build response items
-        items = []
-        for (row, col), cell_posts in grid.items():
-            cell_min_lat = min_lat + row * lat_step
-            cell_max_lat = min_lat + (row + 1) * lat_step
-            cell_min_lng = min_lng + col * lng_step
-            cell_max_lng = min_lng + (col + 1) * lng_step
-
-            if len(cell_posts) == 1:
-                # Single post - return as individual marker
-                post = cell_posts[0]
-                items.append(
-                    {
-                        "type": "post",
-                        "id": post.id,
-                        "latitude": post.latitude,
-                        "longitude": post.longitude,
-                        "title": post.title,
-                        "authorFirstName": post.author.firstname
-                        if post.author
-                        else None,
-                        "authorLastName": post.author.lastname if post.author else None,
-                        "createdAt": post.created_at.isoformat()
-                        if post.created_at
-                        else None,
-                        "thumbnailUrl": post.images[0].url if post.images else None,
-                    }
-                )
-            else:
-                # Multiple posts - return as cluster
-                center_lat = (cell_min_lat + cell_max_lat) / 2
-                center_lng = (cell_min_lng + cell_max_lng) / 2
-                items.append(
-                    {
-                        "type": "cluster",
-                        "latitude": center_lat,
-                        "longitude": center_lng,
-                        "count": len(cell_posts),
-                        "bounds": {
-                            "minLat": cell_min_lat,
-                            "maxLat": cell_max_lat,
-                            "minLng": cell_min_lng,
-                            "maxLng": cell_max_lng,
-                        },
-                    }
-                )
+class PostTiles(MethodView):
+    @posts.output(FileSchema, content_type=TILE_MIMETYPE)
+    @posts.doc(responses={404: "Tile not found"})
+    def get(self, z, x, y):
+        """
+        Get a Mapbox Vector Tile of posts.
 
-        return {"items": items, "total_in_view": total_in_view}
+        Below zoom level 16 the tile contains clusters and posts that are alone in
+        their cluster cell, at higher zoom levels it contains all individual posts.
+        """
+        if z > MAX_TILE_ZOOM or x >= 2**z or y >= 2**z:
+            abort(404, message="Tile not found")
+        response = Response(get_tile(z, x, y), mimetype=TILE_MIMETYPE)
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config["TILE_MAX_AGE"]
+        return response
 
 
 posts.add_url_rule("/posts", view_func=Posts.as_view("posts"))
@@ -379,3 +447,7 @@ posts.add_url_rule(
     "/posts/<int:post_id>/comments", view_func=PostComments.as_view("post_comments")
 )
 posts.add_url_rule("/posts/map-clusters", view_func=MapClusters.as_view("map_clusters"))
+posts.add_url_rule(
+    "/posts/tiles/<int:z>/<int:x>/<int:y>.mvt",
+    view_func=PostTiles.as_view("post_tiles"),
+)
@@ -1,3 +1,5 @@
+from typing import ClassVar
+
 from apiflask import Schema, validators
 from apiflask.fields import (
     UUID,
@@ -13,12 +15,14 @@ from apiflask.fields import (
 from apiflask.validators import Length, OneOf, Range
 from flask import url_for
 from marshmallow import ValidationError, validates_schema
+from sqlalchemy import orm as so
 
 from api.blueprints.common.schemas import (
     URL_METADATA,
     CamelCaseSchema,
     pagination_schema,
 )
+from api.blueprints.common.serialization import CompiledDumpSchema
 from api.blueprints.uploads.schemas import ImageLinkOutSchema
 
 
@@ -39,18 +43,48 @@ class PostBaseSchema(CamelCaseSchema):
 
 class PostInSchema(PostBaseSchema):
     locality_id = Integer(
-        metadata={"description": "provider's locality id", "example": 3167397},
-        required=True,
+        metadata={
+            "description": "provider's locality id, found from the coordinates "
+            "if omitted and locality boundaries are configured",
+            "example": 3167397,
+        },
     )
     locality_provider = String(
         validate=validators.OneOf(["google", "nominatim"]),
         metadata={"enum": ["google", "nominatim"], "example": "nominatim"},
-        required=True,
+        load_default="nominatim",
     )
     images_ids = List(UUID(), validate=Length(max=10))
 
 
-class PostOutSchema(PostBaseSchema):
+def _load_author():
+    from api.blueprints.posts.models import Post
+
+    return [so.joinedload(Post.author)]
+
+
+def _load_locality():
+    from api.blueprints.posts.models import Post
+
+    return [so.joinedload(Post.locality)]
+
+
+def _load_images():
+    from api.blueprints.posts.models import Post, PostImage
+
+    return [so.selectinload(Post.image_association).joinedload(PostImage.image)]
+
+
+class PostOutSchema(CompiledDumpSchema, PostBaseSchema):
+    field_loader_options: ClassVar = {
+        "author_first_name": _load_author,
+        "author_last_name": _load_author,
+        "locality_nominatim_id": _load_locality,
+        "images": _load_images,
+    }
+    # columns read by fields that are not loaded by their attribute
+    field_columns: ClassVar = {"author_link": ("author_id",)}
+
     id = Integer()
     author_id = Integer()
     author_link = Method("get_author_link", metadata=URL_METADATA)
@@ -62,12 +96,21 @@ class PostOutSchema(PostBaseSchema):
     )
     locality_nominatim_id = Integer(attribute="locality.osm_id")
     locality_google_id = Integer()
+    locality_status = String(
+        metadata={
+            "enum": ["resolved", "pending", "invalid"],
+            "description": "pending while the locality is looked up in the "
+            "background, invalid if the provider does not know it",
+        }
+    )
     created_at = DateTime(metadata={"x-faker": "date.past"})
     updated_at = DateTime(attribute="edited_at", metadata={"x-faker": "date.recent"})
     likes = Integer(load_default=0, dump_default=0)
     dislikes = Integer(load_default=0, dump_default=0)
     comments = Integer(load_default=0, dump_default=0)
     images = Nested(ImageLinkOutSchema, many=True, attribute="images")
+    thumbnail_url = String(metadata=URL_METADATA)
+    image_count = Integer()
 
     def get_author_link(self, obj):
         return url_for("users.user", user_id=obj.author_id)
@@ -88,6 +131,14 @@ class PostSortingSchema(Schema):
 
 
 class PostSortingFilteringSchema(PostSortingSchema):
+    q = String(
+        validate=Length(max=200),
+        metadata={
+            "description": "Only posts with all these words in the title or body, "
+            "the last word matches as a prefix. The posts keep the sort_by order, "
+            "use /search for results ranked by relevance"
+        },
+    )
     locality_id = String(
         data_key="localityId",
         metadata={"description": "should be used together with localityProvider"},
@@ -100,6 +151,14 @@ class PostSortingFilteringSchema(PostSortingSchema):
             "description": "should be used together with localityId",
         },
     )
+    state_id = Integer(
+        data_key="stateId",
+        metadata={"description": "Only posts in the localities of the state"},
+    )
+    country_id = Integer(
+        data_key="countryId",
+        metadata={"description": "Only posts in the localities of the country"},
+    )
 
     @validates_schema
     def validate_locality_fields(self, data, **kwargs):
@@ -147,7 +206,7 @@ class ClusterBoundsSchema(CamelCaseSchema):
     max_lng = Float()
 
 
-class MapPostItemSchema(CamelCaseSchema):
+class MapPostItemSchema(CompiledDumpSchema, CamelCaseSchema):
     """Schema for a single post marker on the map"""
 
     type = String(dump_default="post")
@@ -161,7 +220,7 @@ class MapPostItemSchema(CamelCaseSchema):
     thumbnail_url = String(allow_none=True)
 
 
-class MapClusterItemSchema(CamelCaseSchema):
+class MapClusterItemSchema(CompiledDumpSchema, CamelCaseSchema):
     """Schema for a cluster of posts on the map"""
 
     type = String(dump_default="cluster")
@@ -174,7 +233,7 @@ class MapClusterItemSchema(CamelCaseSchema):
     )
 
 
-class MapClustersOutSchema(CamelCaseSchema):
+class MapClustersOutSchema(CompiledDumpSchema, CamelCaseSchema):
     """Schema for map clusters response"""
 
     items = List(
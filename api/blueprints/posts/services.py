@@ -0,0 +1,374 @@
+"""Map clustering services for posts."""
+
+import math
+from collections import defaultdict
+from collections.abc import Iterator, Sequence
+
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy import orm as so
+
+from api import db
+from api.blueprints.auth.models import User
+from api.blueprints.common.models import dialect_insert, table_of
+from api.blueprints.posts.models import Post, PostCluster
+from api.blueprints.posts.spatial import get_spatial_index
+
+# At this zoom level and above, show all posts without clustering
+CLUSTER_THRESHOLD_ZOOM = 16
+GRID_DIVISIONS = 25
+# Pyramid cells of zoom z are the XYZ tiles of zoom z + CLUSTER_CELL_ZOOM_OFFSET,
+# so every map tile is split into 8x8 cells of 32x32 pixels
+CLUSTER_CELL_ZOOM_OFFSET = 3
+MAX_MERCATOR_LATITUDE = 85.0511287798
+
+
+def map_post_item(marker: sa.Row) -> dict:
+    """Serialize a row of ``map_markers`` as an individual map marker."""
+    return {
+        "type": "post",
+        "id": marker.id,
+        "latitude": marker.latitude,
+        "longitude": marker.longitude,
+        "title": marker.title,
+        "authorFirstName": marker.author_firstname,
+        "authorLastName": marker.author_lastname,
+        "createdAt": marker.created_at.isoformat() if marker.created_at else None,
+        "thumbnailUrl": marker.thumbnail_url,
+    }
+
+
+def map_markers(*conditions: sa.ColumnElement[bool]) -> Sequence[sa.Row]:
+    """Load the columns map markers need for the posts matching the conditions.
+
+    Author names come from a join and the thumbnail from the denormalized
+    ``Post.thumbnail_url``, so any number of markers is loaded with a single query.
+    """
+    query = (
+        sa.select(
+            Post.id,
+            Post.latitude,
+            Post.longitude,
+            Post.title,
+            User.firstname.label("author_firstname"),
+            User.lastname.label("author_lastname"),
+            Post.created_at,
+            Post.thumbnail_url,
+        )
+        .outerjoin(User, Post.author_id == User.id)
+        .where(*conditions)
+    )
+    return db.session.execute(query).all()
+
+
+def posts_in_bounds(
+    min_lat: float, max_lat: float, min_lng: float, max_lng: float
+) -> Sequence[sa.Row]:
+    """Load map markers of all posts inside the bounding box."""
+    return map_markers(
+        get_spatial_index().within_bounds(min_lat, max_lat, min_lng, max_lng)
+    )
+
+
+def _cell_index(column, origin: float, step: float) -> sa.ColumnElement[int]:
+    """SQL expression for the grid cell index of ``column``, clamped to the grid."""
+    if step <= 0:
+        return sa.literal(0, sa.Integer)
+    offset = (column - origin) / step
+    if db.session.get_bind().dialect.name == "sqlite":
+        # offsets are never negative inside the bounds, so truncation is floor
+        index = sa.cast(offset, sa.Integer)
+    else:
+        index = sa.cast(sa.func.floor(offset), sa.Integer)
+    return sa.case((index > GRID_DIVISIONS - 1, GRID_DIVISIONS - 1), else_=index)
+
+
+def cluster_posts_in_grid(
+    min_lat: float, max_lat: float, min_lng: float, max_lng: float
+) -> dict:
+    """Cluster posts inside the bounding box on a fixed grid.
+
+    The database assigns every post to a grid cell and returns one aggregated row
+    per non-empty cell, so memory use depends on the grid size rather than on the
+    number of posts in view. Only posts that are alone in their cell are loaded.
+
+    :return: A dictionary matching ``MapClustersOutSchema``.
+    """
+    lat_step = (max_lat - min_lat) / GRID_DIVISIONS
+    lng_step = (max_lng - min_lng) / GRID_DIVISIONS
+
+    cells = (
+        sa.select(
+            Post.id.label("id"),
+            Post.latitude.label("latitude"),
+            Post.longitude.label("longitude"),
+            _cell_index(Post.latitude, min_lat, lat_step).label("row"),
+            _cell_index(Post.longitude, min_lng, lng_step).label("col"),
+        )
+        .where(get_spatial_index().within_bounds(min_lat, max_lat, min_lng, max_lng))
+        .subquery()
+    )
+    aggregates = db.session.execute(
+        sa.select(
+            cells.c.row,
+            cells.c.col,
+            sa.func.count().label("post_count"),
+            sa.func.avg(cells.c.latitude).label("latitude"),
+            sa.func.avg(cells.c.longitude).label("longitude"),
+            sa.func.min(cells.c.id).label("post_id"),
+        ).group_by(cells.c.row, cells.c.col)
+    ).all()
+
+    single_post_ids = [cell.post_id for cell in aggregates if cell.post_count == 1]
+    single_posts = {
+        marker.id: marker for marker in map_markers(Post.id.in_(single_post_ids))
+    }
+
+    items = []
+    total_in_view = 0
+    for cell in aggregates:
+        total_in_view += cell.post_count
+        if cell.post_count == 1:
+            items.append(map_post_item(single_posts[cell.post_id]))
+            continue
+        cell_min_lat = min_lat + cell.row * lat_step
+        cell_min_lng = min_lng + cell.col * lng_step
+        items.append(
+            {
+                "type": "cluster",
+                "latitude": cell.latitude,
+                "longitude": cell.longitude,
+                "count": cell.post_count,
+                "bounds": {
+                    "minLat": cell_min_lat,
+                    "maxLat": cell_min_lat + lat_step,
+                    "minLng": cell_min_lng,
+                    "maxLng": cell_min_lng + lng_step,
+                },
+            }
+        )
+    return {"items": items, "total_in_view": total_in_view}
+
+
+def tile_xy(latitude: float, longitude: float, zoom: int) -> tuple[int, int]:
+    """Return the x and y of the XYZ (slippy map) tile containing the point."""
+    n = 2**zoom
+    latitude = max(min(latitude, MAX_MERCATOR_LATITUDE), -MAX_MERCATOR_LATITUDE)
+    x = int((longitude + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_bounds(x: int, y: int, zoom: int) -> tuple[float, float, float, float]:
+    """Return min_lat, max_lat, min_lng and max_lng of the XYZ tile."""
+    n = 2**zoom
+
+    def tile_latitude(tile_y: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * tile_y / n))))
+
+    return (
+        tile_latitude(y + 1),
+        tile_latitude(y),
+        x / n * 360.0 - 180.0,
+        (x + 1) / n * 360.0 - 180.0,
+    )
+
+
+def cluster_cells(latitude: float, longitude: float) -> Iterator[tuple[int, int, int]]:
+    """Yield the (zoom, x, y) pyramid cell of the point for every clustered zoom."""
+    for zoom in range(CLUSTER_THRESHOLD_ZOOM):
+        yield zoom, *tile_xy(latitude, longitude, zoom + CLUSTER_CELL_ZOOM_OFFSET)
+
+
+def _update_pyramid(
+    connection: sa.Connection,
+    post_id: int,
+    latitude: float,
+    longitude: float,
+    sign: int,
+) -> None:
+    """Add (sign=1) or remove (sign=-1) a post from every cell containing it."""
+    cells = list(cluster_cells(latitude, longitude))
+    table = table_of(PostCluster)
+    insert = dialect_insert(connection, table)
+    insert = insert.values(
+        [
+            {
+                "zoom": zoom,
+                "x": x,
+                "y": y,
+                "post_count": sign,
+                "latitude_sum": sign * latitude,
+                "longitude_sum": sign * longitude,
+                "post_id_sum": sign * post_id,
+            }
+            for zoom, x, y in cells
+        ]
+    )
+    aggregates = ("post_count", "latitude_sum", "longitude_sum", "post_id_sum")
+    connection.execute(
+        insert.on_conflict_do_update(
+            index_elements=[table.c.zoom, table.c.x, table.c.y],
+            set_={name: table.c[name] + insert.excluded[name] for name in aggregates},
+        )
+    )
+    if sign < 0:
+        connection.execute(
+            sa.delete(table).where(
+                sa.tuple_(table.c.zoom, table.c.x, table.c.y).in_(cells),
+                table.c.post_count <= 0,
+            )
+        )
+
+
+@event.listens_for(Post, "after_insert")
+def add_post_to_pyramid(mapper, connection, target):
+    _update_pyramid(connection, target.id, target.latitude, target.longitude, 1)
+
+
+@event.listens_for(Post, "after_update")
+def move_post_in_pyramid(mapper, connection, target):
+    latitude = so.attributes.get_history(target, "latitude")
+    longitude = so.attributes.get_history(target, "longitude")
+    if not (latitude.has_changes() or longitude.has_changes()):
+        return
+    old_latitude = latitude.deleted[0] if latitude.deleted else target.latitude
+    old_longitude = longitude.deleted[0] if longitude.deleted else target.longitude
+    _update_pyramid(connection, target.id, old_latitude, old_longitude, -1)
+    _update_pyramid(connection, target.id, target.latitude, target.longitude, 1)
+
+
+@event.listens_for(Post, "after_delete")
+def remove_post_from_pyramid(mapper, connection, target):
+    _update_pyramid(connection, target.id, target.latitude, target.longitude, -1)
+
+
+def cluster_posts_from_pyramid(
+    min_lat: float, max_lat: float, min_lng: float, max_lng: float, zoom: int
+) -> dict:
+    """Read the precomputed clusters of the zoom level covering the bounding box.
+
+    Cells on the edge of the view may contain posts just outside of it, they are
+    counted in ``total_in_view`` as well.
+
+    :return: A dictionary matching ``MapClustersOutSchema``.
+    """
+    cell_zoom = zoom + CLUSTER_CELL_ZOOM_OFFSET
+    min_x, min_y = tile_xy(max_lat, min_lng, cell_zoom)
+    max_x, max_y = tile_xy(min_lat, max_lng, cell_zoom)
+    cells = PostCluster.query.filter(
+        PostCluster.zoom == zoom,
+        PostCluster.x.between(min_x, max_x),
+        PostCluster.y.between(min_y, max_y),
+    ).all()
+
+    single_post_ids = [cell.post_id_sum for cell in cells if cell.post_count == 1]
+    single_posts = {
+        marker.id: marker for marker in map_markers(Post.id.in_(single_post_ids))
+    }
+
+    items = []
+    total_in_view = 0
+    for cell in cells:
+        total_in_view += cell.post_count
+        if cell.post_count == 1:
+            items.append(map_post_item(single_posts[cell.post_id_sum]))
+            continue
+        cell_min_lat, cell_max_lat, cell_min_lng, cell_max_lng = tile_bounds(
+            cell.x, cell.y, cell_zoom
+        )
+        items.append(
+            {
+                "type": "cluster",
+                "latitude": cell.latitude_sum / cell.post_count,
+                "longitude": cell.longitude_sum / cell.post_count,
+                "count": cell.post_count,
+                "bounds": {
+                    "minLat": cell_min_lat,
+                    "maxLat": cell_max_lat,
+                    "minLng": cell_min_lng,
+                    "maxLng": cell_max_lng,
+                },
+            }
+        )
+    return {"items": items, "total_in_view": total_in_view}
+
+
+def _compute_pyramid() -> dict[tuple[int, int, int], list]:
+    """Aggregate all posts into pyramid cells, streaming the post table."""
+    cells: dict[tuple[int, int, int], list] = defaultdict(lambda: [0, 0.0, 0.0, 0])
+    rows = db.session.execute(
+        sa.select(Post.id, Post.latitude, Post.longitude).execution_options(
+            yield_per=1000
+        )
+    )
+    for post_id, latitude, longitude in rows:
+        for cell in cluster_cells(latitude, longitude):
+            aggregate = cells[cell]
+            aggregate[0] += 1
+            aggregate[1] += latitude
+            aggregate[2] += longitude
+            aggregate[3] += post_id
+    return cells
+
+
+def rebuild_cluster_pyramid(batch_size: int = 1000) -> int:
+    """Recompute the whole cluster pyramid from the post table.
+
+    :return: The number of stored cells.
+    """
+    cells = _compute_pyramid()
+    db.session.execute(sa.delete(PostCluster))
+    rows = [
+        {
+            "zoom": zoom,
+            "x": x,
+            "y": y,
+            "post_count": post_count,
+            "latitude_sum": latitude_sum,
+            "longitude_sum": longitude_sum,
+            "post_id_sum": post_id_sum,
+        }
+        for (zoom, x, y), (
+            post_count,
+            latitude_sum,
+            longitude_sum,
+            post_id_sum,
+        ) in cells.items()
+    ]
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(sa.insert(PostCluster), rows[start : start + batch_size])
+    db.session.commit()
+    from api.blueprints.posts.tiles import get_tile_cache
+
+    # clustered tiles were rendered from the replaced cells
+    get_tile_cache().clear()
+    return len(rows)
+
+
+def check_cluster_pyramid() -> list[str]:
+    """Compare the stored cluster pyramid with one computed from the post table.
+
+    :return: A description of every inconsistent cell, empty if the pyramid is valid.
+    """
+    expected = _compute_pyramid()
+    problems = []
+    stored_cells = db.session.execute(sa.select(PostCluster)).scalars()
+    for cell in stored_cells:
+        key = (cell.zoom, cell.x, cell.y)
+        aggregate = expected.pop(key, None)
+        if aggregate is None:
+            problems.append(f"Cell {key} should not exist")
+            continue
+        post_count, latitude_sum, longitude_sum, post_id_sum = aggregate
+        if (
+            cell.post_count != post_count
+            or cell.post_id_sum != post_id_sum
+            or not math.isclose(cell.latitude_sum, latitude_sum, abs_tol=1e-6)
+            or not math.isclose(cell.longitude_sum, longitude_sum, abs_tol=1e-6)
+        ):
+            problems.append(
+                f"Cell {key} has {cell.post_count} posts, expected {post_count}"
+            )
+    problems.extend(f"Cell {key} is missing" for key in expected)
+    return problems
@@ -0,0 +1,252 @@
+"""Spatial indexes for post locations.
+
+Every bounding box query over posts goes through a ``SpatialIndex``.
+The backend is chosen from the ``SPATIAL_INDEX`` setting:
+
+- ``rtree``: an SQLite R*Tree virtual table kept in sync by triggers,
+- ``gist``: a PostgreSQL GiST index on ``point(longitude, latitude)``,
+- ``memory``: a grid of post locations held by the worker process,
+- ``auto``: the index matching the database, ``memory`` if there is none.
+"""
+
+import abc
+import math
+import threading
+import time
+from collections import defaultdict
+
+import sqlalchemy as sa
+from flask import current_app
+from sqlalchemy import event
+
+from api import db
+from api.blueprints.common.models import on_commit, table_of
+from api.blueprints.posts.models import Post
+
+post_rtree = sa.table(
+    "post_rtree",
+    sa.column("id", sa.Integer),
+    sa.column("min_lat", sa.Float),
+    sa.column("max_lat", sa.Float),
+    sa.column("min_lng", sa.Float),
+    sa.column("max_lng", sa.Float),
+)
+
+SQLITE_RTREE_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS post_rtree "
+    "USING rtree(id, min_lat, max_lat, min_lng, max_lng)",
+    "CREATE TRIGGER IF NOT EXISTS post_rtree_insert AFTER INSERT ON post BEGIN "
+    "INSERT INTO post_rtree VALUES "
+    "(new.id, new.latitude, new.latitude, new.longitude, new.longitude); END",
+    "CREATE TRIGGER IF NOT EXISTS post_rtree_update "
+    "AFTER UPDATE OF latitude, longitude ON post BEGIN "
+    "UPDATE post_rtree SET min_lat = new.latitude, max_lat = new.latitude, "
+    "min_lng = new.longitude, max_lng = new.longitude WHERE id = new.id; END",
+    "CREATE TRIGGER IF NOT EXISTS post_rtree_delete AFTER DELETE ON post BEGIN "
+    "DELETE FROM post_rtree WHERE id = old.id; END",
+)
+POSTGRESQL_GIST_DDL = (
+    "CREATE INDEX IF NOT EXISTS ix_post_location ON post "
+    "USING gist (point(longitude, latitude))",
+)
+
+for statement in SQLITE_RTREE_DDL:
+    event.listen(
+        table_of(Post), "after_create", sa.DDL(statement).execute_if(dialect="sqlite")
+    )
+event.listen(
+    table_of(Post),
+    "before_drop",
+    sa.DDL("DROP TABLE IF EXISTS post_rtree").execute_if(dialect="sqlite"),
+)
+for statement in POSTGRESQL_GIST_DDL:
+    event.listen(
+        table_of(Post),
+        "after_create",
+        sa.DDL(statement).execute_if(dialect="postgresql"),
+    )
+
+
+class SpatialIndex(abc.ABC):
+    @abc.abstractmethod
+    def within_bounds(
+        self, min_lat: float, max_lat: float, min_lng: float, max_lng: float
+    ) -> sa.ColumnElement[bool]:
+        """Return an SQL condition selecting posts inside the bounding box."""
+        pass
+
+
+def _exact_bounds(
+    min_lat: float, max_lat: float, min_lng: float, max_lng: float
+) -> sa.ColumnElement[bool]:
+    return sa.and_(
+        Post.latitude.between(min_lat, max_lat),
+        Post.longitude.between(min_lng, max_lng),
+    )
+
+
+class SQLiteRTreeIndex(SpatialIndex):
+    """Uses the ``post_rtree`` virtual table maintained by triggers on ``post``."""
+
+    def within_bounds(self, min_lat, max_lat, min_lng, max_lng):
+        # R*Tree coordinates are 32-bit floats rounded outwards, so the exact
+        # comparison removes the few candidates just outside the box
+        candidates = sa.select(post_rtree.c.id).where(
+            post_rtree.c.max_lat >= min_lat,
+            post_rtree.c.min_lat <= max_lat,
+            post_rtree.c.max_lng >= min_lng,
+            post_rtree.c.min_lng <= max_lng,
+        )
+        return sa.and_(
+            Post.id.in_(candidates), _exact_bounds(min_lat, max_lat, min_lng, max_lng)
+        )
+
+
+class PostgresGistIndex(SpatialIndex):
+    """Uses the ``ix_post_location`` GiST index on ``point(longitude, latitude)``."""
+
+    def within_bounds(self, min_lat, max_lat, min_lng, max_lng):
+        box = sa.func.box(
+            sa.func.point(min_lng, min_lat), sa.func.point(max_lng, max_lat)
+        )
+        return sa.func.point(Post.longitude, Post.latitude).op("<@")(box)
+
+
+class InMemorySpatialIndex(SpatialIndex):
+    """Grid of post locations loaded lazily and refreshed after every commit.
+
+    Last resort for databases without a spatial index. Every worker process holds
+    its own copy, which sees the writes made by that process at once and is
+    reloaded after ``ttl`` seconds to see the writes of other processes. The ids
+    found are selected by an IN list.
+    """
+
+    CELL_SIZE = 0.1  # degrees
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._expires = 0.0
+        self._locations: dict[int, tuple[float, float]] = {}
+        self._cells: dict[tuple[int, int], set[int]] = defaultdict(set)
+        self._stale: set[int] = set()
+
+    def _cell(self, latitude: float, longitude: float) -> tuple[int, int]:
+        return (
+            math.floor(latitude / self.CELL_SIZE),
+            math.floor(longitude / self.CELL_SIZE),
+        )
+
+    def _add(self, post_id: int, latitude: float, longitude: float) -> None:
+        self._locations[post_id] = (latitude, longitude)
+        self._cells[self._cell(latitude, longitude)].add(post_id)
+
+    def _remove(self, post_id: int) -> None:
+        location = self._locations.pop(post_id, None)
+        if location is not None:
+            self._cells[self._cell(*location)].discard(post_id)
+
+    def _load(self, post_ids: set[int] | None = None) -> None:
+        query = sa.select(Post.id, Post.latitude, Post.longitude)
+        if post_ids is not None:
+            query = query.where(Post.id.in_(post_ids))
+            for post_id in post_ids:
+                self._remove(post_id)
+        else:
+            self._locations.clear()
+            self._cells.clear()
+        rows = db.session.execute(query.execution_options(yield_per=1000))
+        for post_id, latitude, longitude in rows:
+            self._add(post_id, latitude, longitude)
+
+    def invalidate(self, post_ids: set[int]) -> None:
+        """Mark posts as changed, their locations are reloaded by the next query."""
+        with self._lock:
+            self._stale.update(post_ids)
+
+    def within_bounds(self, min_lat, max_lat, min_lng, max_lng):
+        with self._lock:
+            if time.monotonic() >= self._expires:
+                self._load()
+                self._expires = time.monotonic() + self.ttl
+                self._stale.clear()
+            elif self._stale:
+                self._load(self._stale)
+                self._stale = set()
+            min_row, min_col = self._cell(min_lat, min_lng)
+            max_row, max_col = self._cell(max_lat, max_lng)
+            if (max_row - min_row + 1) * (max_col - min_col + 1) <= len(self._cells):
+                cells = [
+                    (row, col)
+                    for row in range(min_row, max_row + 1)
+                    for col in range(min_col, max_col + 1)
+                ]
+            else:  # zoomed out views cover more cells than there are posts
+                cells = [
+                    (row, col)
+                    for row, col in self._cells
+                    if min_row <= row <= max_row and min_col <= col <= max_col
+                ]
+            post_ids = [
+                post_id
+                for cell in cells
+                for post_id in self._cells.get(cell, ())
+                if min_lat <= self._locations[post_id][0] <= max_lat
+                and min_lng <= self._locations[post_id][1] <= max_lng
+            ]
+        # the ids are rendered inline, a bound parameter per id could exceed the
+        # limit of SQLite for zoomed out views
+        return Post.id.in_(
+            sa.bindparam(None, post_ids, expanding=True, literal_execute=True)
+        )
+
+
+def _has_sqlite_rtree() -> bool:
+    return (
+        db.session.execute(
+            sa.text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'post_rtree'"
+            )
+        ).first()
+        is not None
+    )
+
+
+def create_spatial_index(name: str) -> SpatialIndex:
+    dialect_name = db.session.get_bind().dialect.name
+    if name == "auto":
+        if dialect_name == "sqlite" and _has_sqlite_rtree():
+            name = "rtree"
+        elif dialect_name == "postgresql":
+            name = "gist"
+        else:
+            name = "memory"
+    if name == "rtree":
+        return SQLiteRTreeIndex()
+    if name == "gist":
+        return PostgresGistIndex()
+    if name == "memory":
+        return InMemorySpatialIndex(current_app.config["SPATIAL_INDEX_TTL"])
+    raise ValueError(f"Unknown spatial index {name}")
+
+
+def get_spatial_index() -> SpatialIndex:
+    """Return the spatial index of the current application."""
+    index = current_app.extensions.get("spatial_index")
+    if index is None:
+        index = create_spatial_index(current_app.config["SPATIAL_INDEX"])
+        current_app.extensions["spatial_index"] = index
+    return index
+
+
+def _changed_post_ids(instance) -> list[int]:
+    return [instance.id] if isinstance(instance, Post) else []
+
+
+def _invalidate_in_memory_index(post_ids) -> None:
+    index = current_app.extensions.get("spatial_index")
+    if isinstance(index, InMemorySpatialIndex):
+        index.invalidate(post_ids)
+
+
+on_commit(_changed_post_ids, _invalidate_in_memory_index)
@@ -0,0 +1,339 @@
+"""Mapbox Vector Tiles of posts with an on-disk tile cache."""
+
+import contextlib
+import math
+import os
+import shutil
+import struct
+import tempfile
+import uuid
+from collections.abc import Iterable
+from typing import NamedTuple
+
+import sqlalchemy as sa
+from flask import current_app
+from sqlalchemy import orm as so
+
+from api.blueprints.common.models import on_commit
+from api.blueprints.posts.models import Post, PostCluster
+from api.blueprints.posts.services import (
+    CLUSTER_CELL_ZOOM_OFFSET,
+    CLUSTER_THRESHOLD_ZOOM,
+    MAX_MERCATOR_LATITUDE,
+    cluster_posts_in_grid,
+    map_markers,
+    map_post_item,
+    posts_in_bounds,
+    tile_bounds,
+    tile_xy,
+)
+
+MAX_TILE_ZOOM = 20
+TILE_EXTENT = 4096
+TILE_LAYER_NAME = "posts"
+TILE_MIMETYPE = "application/vnd.mapbox-vector-tile"
+
+# protobuf wire types
+_VARINT = 0
+_FIXED64 = 1
+_LENGTH_DELIMITED = 2
+_MOVE_TO_ONE_POINT = 1 | (1 << 3)  # MoveTo command with a count of 1
+_POINT = 1
+
+
+class TileFeature(NamedTuple):
+    id: int | None
+    latitude: float
+    longitude: float
+    properties: dict
+
+
+def _varint(value: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        bits = value & 0x7F
+        value >>= 7
+        if not value:
+            encoded.append(bits)
+            return bytes(encoded)
+        encoded.append(bits | 0x80)
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def _key(field_number: int, wire_type: int) -> bytes:
+    return _varint(field_number << 3 | wire_type)
+
+
+def _varint_field(field_number: int, value: int) -> bytes:
+    return _key(field_number, _VARINT) + _varint(value)
+
+
+def _bytes_field(field_number: int, payload: bytes) -> bytes:
+    return _key(field_number, _LENGTH_DELIMITED) + _varint(len(payload)) + payload
+
+
+def _packed_field(field_number: int, values: Iterable[int]) -> bytes:
+    return _bytes_field(field_number, b"".join(_varint(value) for value in values))
+
+
+def _encode_value(value) -> bytes:
+    if isinstance(value, bool):
+        return _varint_field(7, int(value))
+    if isinstance(value, int):
+        return _varint_field(6, _zigzag(value))
+    if isinstance(value, float):
+        return _key(3, _FIXED64) + struct.pack("<d", value)
+    return _bytes_field(1, str(value).encode())
+
+
+def _tile_pixel(
+    latitude: float, longitude: float, z: int, x: int, y: int
+) -> tuple[int, int]:
+    """Project the point to the integer coordinate space of the tile."""
+    n = 2**z
+    latitude = max(min(latitude, MAX_MERCATOR_LATITUDE), -MAX_MERCATOR_LATITUDE)
+    world_x = (longitude + 180.0) / 360.0 * n
+    world_y = (1.0 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2.0 * n
+    return (
+        round((world_x - x) * TILE_EXTENT),
+        round((world_y - y) * TILE_EXTENT),
+    )
+
+
+def encode_tile(features: Iterable[TileFeature], z: int, x: int, y: int) -> bytes:
+    """Encode point features into a single-layer Mapbox Vector Tile (spec 2.1)."""
+    keys: dict[str, int] = {}
+    values: dict[tuple[type, object], int] = {}
+    encoded_features = []
+    for feature in features:
+        tags = []
+        for key, value in feature.properties.items():
+            if value is None:
+                continue
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault((type(value), value), len(values)))
+        pixel_x, pixel_y = _tile_pixel(feature.latitude, feature.longitude, z, x, y)
+        encoded_feature = b""
+        if feature.id is not None:
+            encoded_feature += _varint_field(1, feature.id)
+        encoded_feature += (
+            _packed_field(2, tags)
+            + _varint_field(3, _POINT)
+            + _packed_field(4, (_MOVE_TO_ONE_POINT, _zigzag(pixel_x), _zigzag(pixel_y)))
+        )
+        encoded_features.append(_bytes_field(2, encoded_feature))
+
+    layer = (
+        _varint_field(15, 2)
+        + _bytes_field(1, TILE_LAYER_NAME.encode())
+        + b"".join(encoded_features)
+        + b"".join(_bytes_field(3, key.encode()) for key in keys)
+        + b"".join(_bytes_field(4, _encode_value(value)) for _, value in values)
+        + _varint_field(5, TILE_EXTENT)
+    )
+    return _bytes_field(3, layer)
+
+
+def _post_feature(marker: sa.Row) -> TileFeature:
+    properties = map_post_item(marker)
+    properties.pop("id")
+    return TileFeature(marker.id, marker.latitude, marker.longitude, properties)
+
+
+def _cluster_feature(
+    latitude: float, longitude: float, count: int, bounds: dict
+) -> TileFeature:
+    return TileFeature(
+        None, latitude, longitude, {"type": "cluster", "count": count, **bounds}
+    )
+
+
+def _grid_features(z: int, x: int, y: int) -> list[TileFeature]:
+    """Cluster the posts of the tile on the grid of ``cluster_posts_in_grid``."""
+    features = []
+    for item in cluster_posts_in_grid(*tile_bounds(x, y, z))["items"]:
+        if item["type"] == "cluster":
+            features.append(
+                _cluster_feature(
+                    item["latitude"], item["longitude"], item["count"], item["bounds"]
+                )
+            )
+        else:
+            properties = dict(item)
+            post_id = properties.pop("id")
+            features.append(
+                TileFeature(
+                    post_id, properties["latitude"], properties["longitude"], properties
+                )
+            )
+    return features
+
+
+def _tile_features(z: int, x: int, y: int) -> list[TileFeature]:
+    if z >= CLUSTER_THRESHOLD_ZOOM:
+        min_lat, max_lat, min_lng, max_lng = tile_bounds(x, y, z)
+        return [
+            _post_feature(marker)
+            for marker in posts_in_bounds(min_lat, max_lat, min_lng, max_lng)
+            # posts on the tile edge belong to one tile only
+            if tile_xy(marker.latitude, marker.longitude, z) == (x, y)
+        ]
+    # the same clusters as /posts/map-clusters
+    if current_app.config["MAP_CLUSTERING"] != "pyramid":
+        return _grid_features(z, x, y)
+
+    cells_per_tile = 2**CLUSTER_CELL_ZOOM_OFFSET
+    cell_zoom = z + CLUSTER_CELL_ZOOM_OFFSET
+    cells = PostCluster.query.filter(
+        PostCluster.zoom == z,
+        PostCluster.x.between(x * cells_per_tile, (x + 1) * cells_per_tile - 1),
+        PostCluster.y.between(y * cells_per_tile, (y + 1) * cells_per_tile - 1),
+    ).all()
+    single_posts = map_markers(
+        Post.id.in_([cell.post_id_sum for cell in cells if cell.post_count == 1])
+    )
+    features = [_post_feature(marker) for marker in single_posts]
+    for cell in cells:
+        if cell.post_count == 1:
+            continue
+        min_lat, max_lat, min_lng, max_lng = tile_bounds(cell.x, cell.y, cell_zoom)
+        features.append(
+            _cluster_feature(
+                cell.latitude_sum / cell.post_count,
+                cell.longitude_sum / cell.post_count,
+                cell.post_count,
+                {
+                    "minLat": min_lat,
+                    "maxLat": max_lat,
+                    "minLng": min_lng,
+                    "maxLng": max_lng,
+                },
+            )
+        )
+    return features
+
+
+class TileCache:
+    """Encoded tiles stored on disk as ``<directory>/<z>/<x>/<y>.mvt``.
+
+    Every rendered tile has a generation token next to it, created before its first
+    render. Invalidating a tile writes a new token before removing the tile, and a
+    render drops its tile if the token changed since it started, so a tile rendered
+    from data read before a write is never kept after the write is committed,
+    whichever process renders it. Tiles that were never rendered have no token and
+    are skipped by invalidations, so the tokens grow with the tiles served.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, z: int, x: int, y: int) -> str:
+        return os.path.join(self.directory, str(z), str(x), f"{y}.mvt")
+
+    @staticmethod
+    def _write(path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file first so readers never see a partial file
+        with tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(path), suffix=".tmp", delete=False
+        ) as file:
+            file.write(data)
+        os.replace(file.name, path)
+
+    def get(self, z: int, x: int, y: int) -> bytes | None:
+        try:
+            with open(self._path(z, x, y), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def generation(self, z: int, x: int, y: int) -> bytes | None:
+        """Return the token of the last invalidation of the tile, if any."""
+        try:
+            with open(self._path(z, x, y) + ".generation", "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def start_render(self, z: int, x: int, y: int) -> bytes:
+        """Return the generation to pass to ``set``, creating it on the first render.
+
+        Must be called before reading the posts of the tile.
+        """
+        generation = self.generation(z, x, y)
+        if generation is None:
+            generation = uuid.uuid4().bytes
+            self._write(self._path(z, x, y) + ".generation", generation)
+        return generation
+
+    def set(
+        self, z: int, x: int, y: int, tile: bytes, generation: bytes | None
+    ) -> None:
+        """Store a tile rendered after reading the ``generation`` of the tile."""
+        path = self._path(z, x, y)
+        self._write(path, tile)
+        # invalidated during the render, the invalidation may have run before the
+        # tile was stored
+        if self.generation(z, x, y) != generation:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+    def invalidate(self, latitude: float, longitude: float) -> None:
+        """Remove every cached tile containing the point."""
+        for z in range(MAX_TILE_ZOOM + 1):
+            x, y = tile_xy(latitude, longitude, z)
+            path = self._path(z, x, y)
+            # without a token the tile is neither cached nor being rendered, a
+            # render starting now reads the committed data
+            if not os.path.exists(path + ".generation"):
+                continue
+            self._write(path + ".generation", uuid.uuid4().bytes)
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+    def clear(self) -> None:
+        """Remove all tiles, renders in progress drop their tiles as well."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def get_tile_cache() -> TileCache:
+    return TileCache(current_app.config["TILE_CACHE_DIR"])
+
+
+def get_tile(z: int, x: int, y: int) -> bytes:
+    """Return the encoded tile, rendering and caching it if needed."""
+    cache = get_tile_cache()
+    tile = cache.get(z, x, y)
+    if tile is None:
+        generation = cache.start_render(z, x, y)
+        tile = encode_tile(_tile_features(z, x, y), z, x, y)
+        cache.set(z, x, y, tile, generation)
+    return tile
+
+
+def _changed_post_locations(instance) -> list[tuple[float, float]]:
+    if not isinstance(instance, Post):
+        return []
+    locations = [(instance.latitude, instance.longitude)]
+    latitude = so.attributes.get_history(instance, "latitude")
+    longitude = so.attributes.get_history(instance, "longitude")
+    if latitude.deleted or longitude.deleted:
+        locations.append(
+            (
+                latitude.deleted[0] if latitude.deleted else instance.latitude,
+                longitude.deleted[0] if longitude.deleted else instance.longitude,
+            )
+        )
+    return locations
+
+
+def _invalidate_tiles(locations) -> None:
+    cache = get_tile_cache()
+    for latitude, longitude in locations:
+        cache.invalidate(latitude, longitude)
+
+
+on_commit(_changed_post_locations, _invalidate_tiles)
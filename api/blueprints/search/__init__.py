@@ -0,0 +1,3 @@
+from api.blueprints.common.routes import CustomAPIBlueprint
+
+search = CustomAPIBlueprint("search", __name__, tag="Search operations", url_prefix="/")
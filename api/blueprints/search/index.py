@@ -0,0 +1,253 @@
+"""Full-text indexes for posts and solutions.
+
+The index is chosen from the database dialect:
+
+- SQLite: FTS5 external-content tables ``post_fts`` and ``solution_fts`` kept in
+  sync with the ``title`` and ``body`` columns by triggers, ranked with ``bm25``,
+- PostgreSQL: GIN indexes on the weighted ``tsvector`` of the title and body,
+  ranked with ``ts_rank_cd``.
+
+Search text is split into words which must all match, the last word as a prefix.
+Matched words in titles and snippets are wrapped in ``<mark>`` tags, the rest of
+the text is HTML escaped.
+"""
+
+import abc
+import html
+import re
+
+import sqlalchemy as sa
+from flask import current_app
+from sqlalchemy import event
+
+from api import db
+from api.blueprints.common.models import table_of
+from api.blueprints.posts.models import Post
+from api.blueprints.solutions.models import Solution
+
+# private use characters marking matches, replaced by tags after escaping the text
+MATCH_START = "\ue000"
+MATCH_END = "\ue001"
+SNIPPET_WORDS = 16
+TITLE_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+
+_WORD = re.compile(r"\w+")
+
+SEARCHABLE_MODELS = (Post, Solution)
+SearchableModel = type[Post] | type[Solution]
+
+
+# templates of ``sa.DDL``, ``%(table)s`` is replaced by the name of the indexed table
+SQLITE_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS %(table)s_fts USING fts5(title, body, "
+    "content='%(table)s', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS %(table)s_fts_insert AFTER INSERT ON %(table)s "
+    "BEGIN INSERT INTO %(table)s_fts(rowid, title, body) "
+    "VALUES (new.id, new.title, new.body); END",
+    "CREATE TRIGGER IF NOT EXISTS %(table)s_fts_update "
+    "AFTER UPDATE OF title, body ON %(table)s BEGIN "
+    "INSERT INTO %(table)s_fts(%(table)s_fts, rowid, title, body) "
+    "VALUES ('delete', old.id, old.title, old.body); "
+    "INSERT INTO %(table)s_fts(rowid, title, body) "
+    "VALUES (new.id, new.title, new.body); END",
+    "CREATE TRIGGER IF NOT EXISTS %(table)s_fts_delete AFTER DELETE ON %(table)s "
+    "BEGIN INSERT INTO %(table)s_fts(%(table)s_fts, rowid, title, body) "
+    "VALUES ('delete', old.id, old.title, old.body); END",
+)
+
+
+def _postgresql_tsvector(qualifier: str = "") -> str:
+    return (
+        f"setweight(to_tsvector('simple', {qualifier}title), 'A') || "
+        f"setweight(to_tsvector('simple', {qualifier}body), 'B')"
+    )
+
+
+POSTGRESQL_GIN_DDL = (
+    "CREATE INDEX IF NOT EXISTS ix_%(table)s_search ON %(table)s "
+    f"USING gin (({_postgresql_tsvector()}))",
+)
+
+for model in SEARCHABLE_MODELS:
+    for statement in SQLITE_FTS_DDL:
+        event.listen(
+            table_of(model),
+            "after_create",
+            sa.DDL(statement).execute_if(dialect="sqlite"),
+        )
+    event.listen(
+        table_of(model),
+        "before_drop",
+        sa.DDL("DROP TABLE IF EXISTS %(table)s_fts").execute_if(dialect="sqlite"),
+    )
+    for statement in POSTGRESQL_GIN_DDL:
+        event.listen(
+            table_of(model),
+            "after_create",
+            sa.DDL(statement).execute_if(dialect="postgresql"),
+        )
+
+
+def search_words(text: str) -> list[str]:
+    """Split search text into words, dropping punctuation and query operators."""
+    return _WORD.findall(text.lower())
+
+
+def highlight(text: str | None) -> str | None:
+    """Escape text marked by the index and turn the match markers into tags."""
+    if text is None:
+        return None
+    return (
+        html.escape(text).replace(MATCH_START, "<mark>").replace(MATCH_END, "</mark>")
+    )
+
+
+class SearchIndex(abc.ABC):
+    @abc.abstractmethod
+    def matches(self, model: SearchableModel, text: str) -> sa.ColumnElement[bool]:
+        """Return an SQL condition selecting rows of the model matching the text."""
+        pass
+
+    @abc.abstractmethod
+    def ranked(self, model: SearchableModel, text: str) -> sa.Select:
+        """Return a select of the rows matching the text.
+
+        The columns are ``id``, ``post_id`` and ``score``, higher for better matches.
+        The text must contain at least one word, see ``search_words``.
+        """
+        pass
+
+    @abc.abstractmethod
+    def headlines(self, model: SearchableModel, text: str) -> sa.Select:
+        """Return a select of ``id``, ``title`` and ``snippet`` with the matches marked.
+
+        Highlighting is costly, join the select to the page of ``ranked`` rows so
+        only the returned rows are highlighted.
+        """
+        pass
+
+
+class SQLiteFTSIndex(SearchIndex):
+    """Uses the ``<table>_fts`` FTS5 tables maintained by triggers."""
+
+    @staticmethod
+    def _query(text: str) -> str:
+        words = search_words(text)
+        # quoted words are matched literally, FTS5 operators are not interpreted
+        return " ".join(f'"{word}"' for word in words) + "*"
+
+    @staticmethod
+    def _fts(model: SearchableModel) -> sa.TableClause:
+        return sa.table(f"{table_of(model).name}_fts", sa.column("rowid"))
+
+    def _match(self, model, query: str) -> sa.ColumnElement[bool]:
+        fts = self._fts(model)
+        return sa.literal_column(fts.name).op("MATCH")(query)
+
+    def matches(self, model, text):
+        if not search_words(text):
+            return sa.false()
+        fts = self._fts(model)
+        return model.id.in_(
+            sa.select(fts.c.rowid).where(self._match(model, self._query(text)))
+        )
+
+    def ranked(self, model, text):
+        fts = self._fts(model)
+        table = sa.literal_column(fts.name)
+        post_id = model.id if issubclass(model, Post) else model.post_id
+        return (
+            sa.select(
+                model.id.label("id"),
+                post_id.label("post_id"),
+                (-sa.func.bm25(table, TITLE_WEIGHT, BODY_WEIGHT)).label("score"),
+            )
+            .select_from(fts)
+            .join(model, model.id == fts.c.rowid)
+            .where(self._match(model, self._query(text)))
+        )
+
+    def headlines(self, model, text):
+        fts = self._fts(model)
+        table = sa.literal_column(fts.name)
+        # the auxiliary functions need the MATCH on the FTS table
+        return (
+            sa.select(
+                model.id.label("id"),
+                sa.func.highlight(table, 0, MATCH_START, MATCH_END).label("title"),
+                sa.func.snippet(
+                    table, 1, MATCH_START, MATCH_END, "…", SNIPPET_WORDS
+                ).label("snippet"),
+            )
+            .select_from(fts)
+            .join(model, model.id == fts.c.rowid)
+            .where(self._match(model, self._query(text)))
+        )
+
+
+class PostgresFullTextIndex(SearchIndex):
+    """Uses the ``ix_<table>_search`` GIN indexes on the weighted ``tsvector``."""
+
+    @staticmethod
+    def _query(text: str) -> sa.ColumnElement:
+        words = search_words(text)
+        # words contain no tsquery operators
+        return sa.func.to_tsquery(
+            sa.literal_column("'simple'"), " & ".join(words) + ":*"
+        )
+
+    @staticmethod
+    def _vector(model: SearchableModel) -> sa.ColumnElement:
+        # must match the indexed expression for the GIN index to be used
+        return sa.literal_column(_postgresql_tsvector(f"{table_of(model).name}."))
+
+    def matches(self, model, text):
+        if not search_words(text):
+            return sa.false()
+        return self._vector(model).op("@@")(self._query(text))
+
+    def ranked(self, model, text):
+        query = self._query(text)
+        post_id = model.id if issubclass(model, Post) else model.post_id
+        return sa.select(
+            model.id.label("id"),
+            post_id.label("post_id"),
+            sa.func.ts_rank_cd(self._vector(model), query).label("score"),
+        ).where(self._vector(model).op("@@")(query))
+
+    def headlines(self, model, text):
+        query = self._query(text)
+        options = f"StartSel={MATCH_START}, StopSel={MATCH_END}"
+        simple = sa.literal_column("'simple'")
+        return sa.select(
+            model.id.label("id"),
+            sa.func.ts_headline(
+                simple, model.title, query, f"{options}, HighlightAll=true"
+            ).label("title"),
+            sa.func.ts_headline(
+                simple,
+                model.body,
+                query,
+                f"{options}, MaxWords={SNIPPET_WORDS}, MinWords={SNIPPET_WORDS // 2}, "
+                "FragmentDelimiter=…, MaxFragments=1",
+            ).label("snippet"),
+        )
+
+
+def create_search_index(dialect_name: str) -> SearchIndex:
+    if dialect_name == "sqlite":
+        return SQLiteFTSIndex()
+    if dialect_name == "postgresql":
+        return PostgresFullTextIndex()
+    raise ValueError(f"No full-text index for the {dialect_name} dialect")
+
+
+def get_search_index() -> SearchIndex:
+    """Return the full-text index of the current application."""
+    index = current_app.extensions.get("search_index")
+    if index is None:
+        index = create_search_index(db.session.get_bind().dialect.name)
+        current_app.extensions["search_index"] = index
+    return index
@@ -0,0 +1,121 @@
+import typing as t
+
+import sqlalchemy as sa
+from apiflask.views import MethodView
+from flask_sqlalchemy.pagination import Pagination
+
+from api import db
+from api.blueprints.common.routes import pagination_links
+from api.blueprints.common.schemas import merge_schemas, pagination_query_schema
+from api.blueprints.posts.models import LOCALITY_INVALID, Post
+from api.blueprints.search import search
+from api.blueprints.search.index import get_search_index, highlight
+from api.blueprints.search.schemas import (
+    SearchQuerySchema,
+    SearchResultPaginationSchema,
+)
+from api.blueprints.solutions.models import Solution
+
+SEARCH_TYPES = {"posts": (Post,), "solutions": (Solution,), "all": (Post, Solution)}
+RESULT_TYPES = {Post: "post", Solution: "solution"}
+
+
+def _listed(model) -> sa.ColumnElement[bool]:
+    """Posts with a locality unknown to the provider are not listed, nor their
+    solutions."""
+    if model is Post:
+        return Post.locality_status != LOCALITY_INVALID
+    return model.post_id.not_in(
+        sa.select(Post.id).where(Post.locality_status == LOCALITY_INVALID)
+    )
+
+
+class SearchPagination(Pagination):
+    """Pagination of the ranked matches of posts and solutions."""
+
+    def _query_items(self) -> list[t.Any]:
+        index = get_search_index()
+        text = self._query_args["text"]
+        models = self._query_args["models"]
+        # rank without highlighting, so only the rows of the page are highlighted
+        page = (
+            sa.union_all(
+                *(
+                    index.ranked(model, text)
+                    .where(_listed(model))
+                    .add_columns(sa.literal(RESULT_TYPES[model]).label("type"))
+                    for model in models
+                )
+            )
+            .order_by(sa.desc("score"), sa.desc("id"))
+            .limit(self.per_page)
+            .offset(self._query_offset)
+            .cte("page")
+        )
+        select = sa.union_all(
+            *(
+                index.headlines(model, text)
+                .join(
+                    page,
+                    sa.and_(page.c.id == model.id, page.c.type == RESULT_TYPES[model]),
+                )
+                .add_columns(page.c.post_id, page.c.score, page.c.type)
+                for model in models
+            )
+        ).order_by(sa.desc("score"), sa.desc("id"))
+        return [
+            {
+                **row,
+                "title": highlight(row["title"]),
+                "snippet": highlight(row["snippet"]),
+            }
+            for row in db.session.execute(select).mappings()
+        ]
+
+    def _query_count(self) -> int:
+        index = get_search_index()
+        text = self._query_args["text"]
+        return sum(
+            db.session.scalar(
+                sa.select(sa.func.count())
+                .select_from(model)
+                .where(index.matches(model, text), _listed(model))
+            )
+            or 0
+            for model in self._query_args["models"]
+        )
+
+
+class Search(MethodView):
+    @search.input(
+        merge_schemas(pagination_query_schema(), SearchQuerySchema), location="query"
+    )
+    @search.output(SearchResultPaginationSchema)
+    def get(self, query_data):
+        """Search posts and solutions
+
+        Results are ordered by relevance, matches in titles rank above matches in
+        bodies.
+        """
+        pagination = SearchPagination(
+            page=query_data["page"],
+            per_page=query_data["per_page"],
+            text=query_data["q"],
+            models=SEARCH_TYPES[query_data["type"]],
+        )
+        return {
+            "has_next": pagination.has_next,
+            "has_prev": pagination.has_prev,
+            "items": pagination.items,
+            "items_per_page": pagination.per_page,
+            "links": pagination_links(
+                pagination, "search.search", q=query_data["q"], type=query_data["type"]
+            ),
+            "page": pagination.page,
+            "total_items": pagination.total,
+            "total_pages": pagination.pages,
+            "count_mode": "exact",
+        }
+
+
+search.add_url_rule("/search", view_func=Search.as_view("search"))
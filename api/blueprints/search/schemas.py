@@ -0,0 +1,54 @@
+from apiflask.fields import Float, Integer, Method, String
+from apiflask.validators import Length, OneOf
+from flask import url_for
+from marshmallow import ValidationError, validates
+
+from api.blueprints.common.schemas import (
+    URL_METADATA,
+    CamelCaseSchema,
+    pagination_schema,
+)
+from api.blueprints.search.index import search_words
+
+
+class SearchQuerySchema(CamelCaseSchema):
+    q = String(
+        required=True,
+        validate=Length(min=1, max=200),
+        metadata={
+            "description": "Words to search for in titles and bodies, "
+            "the last word matches as a prefix"
+        },
+    )
+    type = String(
+        load_default="all",
+        validate=OneOf(["all", "posts", "solutions"]),
+        metadata={"enum": ["all", "posts", "solutions"]},
+    )
+
+    @validates("q")
+    def validate_q(self, value, **kwargs):
+        if not search_words(value):
+            raise ValidationError("Search text must contain at least one word.")
+
+
+class SearchResultSchema(CamelCaseSchema):
+    type = String(metadata={"enum": ["post", "solution"]})
+    id = Integer()
+    post_id = Integer()
+    title = String(
+        metadata={"description": "HTML escaped title with matches in <mark> tags"}
+    )
+    snippet = String(
+        metadata={"description": "HTML escaped excerpt with matches in <mark> tags"}
+    )
+    score = Float(metadata={"description": "Relevance, higher is better"})
+    link = Method("get_link", metadata=URL_METADATA)
+
+    def get_link(self, obj):
+        if obj["type"] == "solution":
+            return url_for("solutions.solution", solution_id=obj["id"])
+        return url_for("posts.post", post_id=obj["id"])
+
+
+SearchResultPaginationSchema = pagination_schema(SearchResultSchema)
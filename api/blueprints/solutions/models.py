@@ -6,7 +6,7 @@ from sqlalchemy import orm as so
 from sqlalchemy.ext.associationproxy import AssociationProxy, association_proxy
 
 from api import db
-from api.blueprints.common.models import TimestampMixin
+from api.blueprints.common.models import ImagePreviewMixin, TimestampMixin
 
 if TYPE_CHECKING:
     from api.blueprints.auth.models import User
@@ -28,7 +28,13 @@ class SolutionImage(db.Model):
     image: so.Mapped["Image"] = so.relationship(backref="solution_association")
 
 
-class Solution(TimestampMixin, db.Model):
+class Solution(TimestampMixin, ImagePreviewMixin, db.Model):
+    __table_args__ = (
+        # keyset pagination of post solutions orders by (sort column, id)
+        sa.Index("ix_solution_post_id_created_at_id", "post_id", "created_at", "id"),
+        sa.Index("ix_solution_post_id_edited_at_id", "post_id", "edited_at", "id"),
+    )
+    __edited_columns__ = ("title", "body")
     id: so.Mapped[int] = so.mapped_column(primary_key=True)
     title: so.Mapped[str] = so.mapped_column(sa.String(100), nullable=False)
     body: so.Mapped[str] = so.mapped_column(sa.String(10000), nullable=False)
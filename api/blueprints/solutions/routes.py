@@ -11,13 +11,22 @@ from api.blueprints.comments.schemas import (
     CommentOutSchema,
     CommentSortingSchema,
 )
-from api.blueprints.common.routes import create_pagination_response
+from api.blueprints.common.cache import add_cache_tags, cached_response
+from api.blueprints.common.routes import (
+    check_if_match,
+    create_pagination_response,
+    not_modified_response,
+    resource_version,
+)
 from api.blueprints.common.schemas import (
     JSONPatchSchema,
     TextBodySchema,
+    loader_options,
     merge_schemas,
     pagination_query_schema,
+    sparse_fields_query_schema,
 )
+from api.blueprints.posts.cache import post_tag
 from api.blueprints.posts.models import Post as PostModel
 from api.blueprints.solutions import solutions
 from api.blueprints.solutions.models import Solution as SolutionModel
@@ -32,15 +41,19 @@ from api.blueprints.users.schemas import ReactionSchema
 
 
 class PostSolutions(MethodView):
+    @cached_response()
     @solutions.input(
         merge_schemas(
-            pagination_query_schema(default_per_page=5), SolutionSortingFilteringSchema
+            pagination_query_schema(default_per_page=5, cursor=True, count=True),
+            SolutionSortingFilteringSchema,
+            sparse_fields_query_schema(SolutionOutPaginationSchema),
         ),
         location="query",
     )
     @solutions.output(SolutionOutPaginationSchema)
     def get(self, post_id, query_data):
         """Get solutions for post"""
+        add_cache_tags(post_tag(post_id))
         PostModel.query.get_or_404(post_id, description="Post not found")
 
         query = SolutionModel.query.filter_by(post_id=post_id)
@@ -54,6 +67,7 @@ class PostSolutions(MethodView):
             query,
             SolutionModel,
             "solutions.post_solutions",
+            schema=SolutionOutPaginationSchema,
             post_id=post_id,
             **query_data,
         )
@@ -81,12 +95,15 @@ class PostSolutions(MethodView):
         db.session.flush()
 
         if json_data.get("images_ids"):
-            existing_image_ids = db.session.scalars(
-                db.select(Image.id).where(Image.id.in_(json_data["images_ids"]))
-            ).all()
-            non_existing_image_ids = set(json_data["images_ids"]) - set(
-                existing_image_ids
-            )
+            image_urls = {
+                row.id: row.url
+                for row in db.session.execute(
+                    db.select(Image.id, Image.url).where(
+                        Image.id.in_(json_data["images_ids"])
+                    )
+                )
+            }
+            non_existing_image_ids = set(json_data["images_ids"]) - set(image_urls)
             if non_existing_image_ids:
                 abort(
                     422,
@@ -102,6 +119,9 @@ class PostSolutions(MethodView):
                 for order, image_id in enumerate(json_data["images_ids"])
             ]
             new_solution.image_association = solution_images
+            new_solution.set_image_preview(
+                [image_urls[image_id] for image_id in json_data["images_ids"]]
+            )
 
         db.session.commit()
 
@@ -114,18 +134,28 @@ class PostSolutions(MethodView):
 
 class Solution(MethodView):
     @solutions.output(SolutionOutSchema)
+    @solutions.doc(responses={304: "Solution not modified"})
     def get(self, solution_id):
         """Get the solution by ID"""
-        return SolutionModel.query.get_or_404(
-            solution_id, description="Solution not found"
-        )
+        solution = SolutionModel.query.options(
+            *loader_options(SolutionOutSchema)
+        ).get_or_404(solution_id, description="Solution not found")
+        version = resource_version(solution)
+        not_modified = not_modified_response(version)
+        if not_modified is not None:
+            return not_modified
+        return solution, 200, version.headers
 
     @jwt_required()
     @solutions.input(SolutionInSchema)
     @solutions.output(SolutionOutSchema)
     @solutions.doc(
         security="jwt_access_token",
-        responses={200: "Solution updated", 403: "Forbidden"},
+        responses={
+            200: "Solution updated",
+            403: "Forbidden",
+            412: "Solution was modified since the version in If-Match",
+        },
     )
     def put(self, solution_id, json_data):
         """Update solution. Only the author of the solution can update it"""
@@ -138,18 +168,23 @@ class Solution(MethodView):
 
         if solution.author_id != user_id:
             abort(403, message="You can only update your own solutions")
+        check_if_match(resource_version(solution))
 
         for key, value in json_data.items():
             if key not in ["images_ids"] and hasattr(solution, key):
                 setattr(solution, key, value)
 
+        image_urls = {}
         if json_data.get("images_ids"):
-            existing_image_ids = db.session.scalars(
-                db.select(Image.id).where(Image.id.in_(json_data["images_ids"]))
-            ).all()
-            non_existing_image_ids = set(json_data["images_ids"]) - set(
-                existing_image_ids
-            )
+            image_urls = {
+                row.id: row.url
+                for row in db.session.execute(
+                    db.select(Image.id, Image.url).where(
+                        Image.id.in_(json_data["images_ids"])
+                    )
+                )
+            }
+            non_existing_image_ids = set(json_data["images_ids"]) - set(image_urls)
             if non_existing_image_ids:
                 abort(
                     422,
@@ -161,10 +196,13 @@ class Solution(MethodView):
             for order, image_id in enumerate(json_data.get("images_ids") or [])
         ]
         solution.image_association = solution_images
+        solution.set_image_preview(
+            [image_urls[image_id] for image_id in json_data.get("images_ids") or []]
+        )
 
         db.session.commit()
 
-        return solution
+        return solution, 200, resource_version(solution).headers
 
     @jwt_required()
     @solutions.input(JSONPatchSchema)
@@ -1,3 +1,5 @@
+from typing import ClassVar
+
 from apiflask import Schema
 from apiflask.fields import (
     UUID,
@@ -11,12 +13,14 @@ from apiflask.fields import (
 )
 from apiflask.validators import Length, OneOf
 from flask import url_for
+from sqlalchemy import orm as so
 
 from api.blueprints.common.schemas import (
     URL_METADATA,
     CamelCaseSchema,
     pagination_schema,
 )
+from api.blueprints.common.serialization import CompiledDumpSchema
 from api.blueprints.uploads.schemas import ImageLinkOutSchema
 
 
@@ -37,7 +41,27 @@ class SolutionInSchema(SolutionBaseSchema):
     images_ids = List(UUID(), validate=Length(max=10))
 
 
-class SolutionOutSchema(SolutionBaseSchema):
+def _load_author():
+    from api.blueprints.solutions.models import Solution
+
+    return [so.joinedload(Solution.author)]
+
+
+def _load_images():
+    from api.blueprints.solutions.models import Solution, SolutionImage
+
+    return [so.selectinload(Solution.image_association).joinedload(SolutionImage.image)]
+
+
+class SolutionOutSchema(CompiledDumpSchema, SolutionBaseSchema):
+    field_loader_options: ClassVar = {
+        "author_first_name": _load_author,
+        "author_last_name": _load_author,
+        "images": _load_images,
+    }
+    # columns read by fields that are not loaded by their attribute
+    field_columns: ClassVar = {"author_link": ("author_id",)}
+
     id = Integer()
     author_id = Integer()
     author_link = Method("get_author_link", metadata=URL_METADATA)
@@ -55,6 +79,8 @@ class SolutionOutSchema(SolutionBaseSchema):
     approved = Boolean(load_default=False, dump_default=False)
     approved_at = DateTime(metadata={"x-faker": "date.recent"})
     images = Nested(ImageLinkOutSchema, many=True, attribute="images")
+    thumbnail_url = String(metadata=URL_METADATA)
+    image_count = Integer()
 
     def get_author_link(self, obj):
         return url_for("users.user", user_id=obj.author_id)
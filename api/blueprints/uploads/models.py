@@ -4,8 +4,8 @@ import sqlalchemy as sa
 from sqlalchemy import orm as so
 
 from api import db
-from api.blueprints.posts.models import PostImage
-from api.blueprints.solutions.models import SolutionImage
+from api.blueprints.posts.models import Post, PostImage
+from api.blueprints.solutions.models import Solution, SolutionImage
 
 
 class Image(db.Model):
@@ -16,9 +16,39 @@ class Image(db.Model):
         return f"<Image {self.url}>"
 
 
+def _refresh_image_preview(connection, target):
+    """Recompute the preview columns of the post or solution owning the image."""
+    if isinstance(target, PostImage):
+        owner, association, owner_id = Post, PostImage, target.post_id
+        owner_column = PostImage.post_id
+    else:
+        owner, association, owner_id = Solution, SolutionImage, target.solution_id
+        owner_column = SolutionImage.solution_id
+    thumbnail_url = (
+        sa.select(Image.url)
+        .join(association, association.image_id == Image.id)
+        .where(owner_column == owner_id)
+        .order_by(association.order)
+        .limit(1)
+        .scalar_subquery()
+    )
+    image_count = (
+        sa.select(sa.func.count())
+        .select_from(association)
+        .where(owner_column == owner_id)
+        .scalar_subquery()
+    )
+    connection.execute(
+        sa.update(owner)
+        .where(owner.id == owner_id)
+        .values(thumbnail_url=thumbnail_url, image_count=image_count)
+    )
+
+
 @sa.event.listens_for(PostImage, "after_delete")
 @sa.event.listens_for(SolutionImage, "after_delete")
 def delete_orphaned_image(mapper, connection, target):
+    _refresh_image_preview(connection, target)
     image_id = target.image_id
     has_post_associations = (
         connection.scalar(
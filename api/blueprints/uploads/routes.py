@@ -5,7 +5,11 @@ from flask_jwt_extended import jwt_required
 from api import db, get_app
 from api.blueprints.uploads import uploads_bp
 from api.blueprints.uploads.schemas import ImageLinkOutSchema, ImageSchema
-from api.blueprints.uploads.services import StorageService, UploadError
+from api.blueprints.uploads.services import (
+    FileTooLargeError,
+    StorageService,
+    UploadError,
+)
 
 
 class Images(MethodView):
@@ -14,7 +18,11 @@ class Images(MethodView):
     @uploads_bp.output(ImageLinkOutSchema, status_code=201)
     @uploads_bp.doc(
         security="jwt_access_token",
-        responses={201: "Image uploaded", 500: "Failed to upload image"},
+        responses={
+            201: "Image uploaded",
+            413: "Image is too large",
+            500: "Failed to upload image",
+        },
     )
     def post(self, files_data):
         """Upload image. Activated account required."""
@@ -23,6 +31,8 @@ class Images(MethodView):
             image = storage.upload_image(files_data["image"], db.session)
         except UploadError:
             return abort(500, message="Failed to upload image")
+        except FileTooLargeError:
+            return abort(413, message="Image is too large")
         except ValueError:
             return abort(422, message="File is not a valid image")
         return image, 201, {"Location": image.url}
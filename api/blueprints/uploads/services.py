@@ -1,9 +1,18 @@
-"""Storage service implementations for file uploads."""
+"""Storage service implementations for file uploads.
+
+Uploads are read once in chunks through ``ImageUpload``, which checks the type,
+size and hash of the file while a backend writes the chunks, so memory use does
+not depend on the size of the file.
+"""
 
 import abc
+import contextlib
+import hashlib
 import os
+import tempfile
 import uuid
-from typing import TYPE_CHECKING
+from collections.abc import Callable, Iterator
+from typing import IO, TYPE_CHECKING, Protocol, cast
 
 import filetype
 from flask import send_from_directory, url_for
@@ -15,6 +24,12 @@ from werkzeug.utils import secure_filename
 if TYPE_CHECKING:
     from api.blueprints.uploads.models import Image
 
+UPLOAD_FOLDER = "uploaded_images"
+CHUNK_SIZE = 64 * 1024
+MAX_IMAGE_SIZE = 5 * 1024 * 1024
+# bytes filetype needs to recognize every type it supports
+HEADER_SIZE = 261
+
 
 class StorageError(Exception):
     """Base exception for storage operations"""
@@ -28,41 +43,123 @@ class UploadError(StorageError):
     pass
 
 
+class FileTooLargeError(ValueError):
+    """Exception raised when an upload exceeds the maximum size"""
+
+    pass
+
+
+def guess_image_type(header: bytes) -> str | None:
+    """Return the MIME type of an image from the first bytes of the file
+    :param header: at least the first ``HEADER_SIZE`` bytes, or the whole file
+    :return: the MIME type, None if the file is not an image
+    """
+    kind = filetype.guess(header)
+    if kind is None or kind.mime.split("/")[0] != "image":
+        return None
+    return kind.mime
+
+
+class ReadintoStream(Protocol):
+    """A binary stream reading into a caller's buffer, like ``io.BufferedIOBase``"""
+
+    def readinto(self, buffer: memoryview, /) -> int | None: ...
+
+
+class ImageUpload:
+    """A single pass over an uploaded image with a fixed size buffer.
+
+    Iterating reads the stream into the buffer and yields views of it, a chunk is
+    only valid until the next one is read. The type is checked on the first chunk
+    before anything is yielded, the size and the SHA-256 hash are updated with
+    every chunk. The stream can be iterated only once.
+    """
+
+    def __init__(
+        self,
+        stream: ReadintoStream,
+        chunk_size: int = CHUNK_SIZE,
+        max_size: int = MAX_IMAGE_SIZE,
+        guess_type: Callable[[bytes], str | None] = guess_image_type,
+    ):
+        self.stream = stream
+        self.max_size = max_size
+        self.guess_type = guess_type
+        self.mime: str | None = None
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._buffer = bytearray(max(chunk_size, HEADER_SIZE))
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
+    def _fill(self, view: memoryview) -> int:
+        """Read until the view is full or the stream ends, return the bytes read."""
+        filled = 0
+        while filled < len(view):
+            read = self.stream.readinto(view[filled:])
+            if not read:
+                break
+            filled += read
+        return filled
+
+    def __iter__(self) -> Iterator[memoryview]:
+        view = memoryview(self._buffer)
+        filled = self._fill(view)
+        self.mime = self.guess_type(bytes(view[: min(filled, HEADER_SIZE)]))
+        if self.mime is None:
+            raise ValueError("File is not a valid image")
+        while filled:
+            self.size += filled
+            if self.size > self.max_size:
+                raise FileTooLargeError(f"File is larger than {self.max_size} bytes")
+            chunk = view[:filled]
+            self._hash.update(chunk)
+            yield chunk
+            filled = self._fill(view)
+
+    def write_to(self, target: IO[bytes]) -> None:
+        """Write the whole upload to the binary file object"""
+        for chunk in self:
+            target.write(chunk)
+
+
 class StorageService(abc.ABC):
+    chunk_size = CHUNK_SIZE
+    max_size = MAX_IMAGE_SIZE
+    # backends may override how the type of an image is recognized
+    guess_image_type = staticmethod(guess_image_type)
+
     @abc.abstractmethod
-    def _upload(self, file: FileStorage) -> str:
-        """Upload a file to storage and return its URL
-        :param file: werkzeug's FileStorage object
+    def _upload(self, upload: ImageUpload, filename: str) -> str:
+        """Write the chunks of an upload to storage and return its URL
+        :param upload: the upload, validated while its chunks are read
+        :param filename: name of the file sent by the client
         :return: URL of the uploaded file
+        :raises ValueError: If the file is not an image or too large, nothing is
+            stored then
         :raises UploadError: If the upload failed
         """
         pass
 
-    @staticmethod
-    def _check_file_is_image(file: FileStorage) -> bool:
-        """Check if the provided file is an image
-        :param file: werkzeug's FileStorage object
-        :return: True if the file is an image, False otherwise
-        """
-        header = file.read(261)
-        kind = filetype.guess(header)
-        file.seek(0)
-        return kind is not None and kind.mime.split("/")[0] == "image"
-
     def upload_image(self, image_file: FileStorage, db_session) -> "Image":
         """Upload an image to storage and return the Image model instance
         :param image_file: werkzeug's FileStorage object
         :param db_session: Database session for adding the image record
         :return: Image model instance
         :raises ValueError: If the file is not an image
+        :raises FileTooLargeError: If the file is larger than ``max_size``
         :raises UploadError: If the upload failed
         """
         from api.blueprints.uploads.models import Image
 
-        if not self._check_file_is_image(image_file):
-            raise ValueError("File is not a valid image")
-
-        url = self._upload(image_file)
+        # werkzeug types the stream as IO[bytes], its files support readinto
+        stream = cast(ReadintoStream, image_file.stream)
+        upload = ImageUpload(
+            stream, self.chunk_size, self.max_size, self.guess_image_type
+        )
+        url = self._upload(upload, image_file.filename or "")
         image = Image(url=url)  # type: ignore
         db_session.add(image)
         db_session.commit()
@@ -82,24 +179,35 @@ class StorageService(abc.ABC):
 
 
 class LocalFolderStorageService(StorageService):
-    def _upload(self, file: FileStorage) -> str:
+    def _upload(self, upload: ImageUpload, filename: str) -> str:
         """Upload a file to a local folder and return its URL"""
-        filename = uuid.uuid4().hex + secure_filename(file.filename or "")
+        filename = uuid.uuid4().hex + secure_filename(filename)
         try:
-            self._save_file(file, filename)
+            self._save_file(upload, filename)
+        except ValueError:
+            raise
         except Exception as e:
             raise UploadError("Failed to save file") from e
         return url_for("uploads.image", filename=filename)
 
-    def _save_file(self, file: FileStorage, filename: str):
-        file_path = os.path.join("uploaded_images", filename)
-        file.save(file_path)
+    def _save_file(self, upload: ImageUpload, filename: str):
+        """Write a temporary file in the folder and rename it to the filename,
+        a file is never seen partially written."""
+        fd, temporary_path = tempfile.mkstemp(dir=UPLOAD_FOLDER, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as target:
+                upload.write_to(target)
+            os.replace(temporary_path, os.path.join(UPLOAD_FOLDER, filename))
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(temporary_path)
+            raise
 
     def send_file(self, filename: str):
         """Send a file from the local folder to the client
         raises FileNotFoundError if the file is not found"""
         try:
-            return send_from_directory("uploaded_images", filename)
+            return send_from_directory(UPLOAD_FOLDER, filename)
         except NotFound as e:
             raise FileNotFoundError(f"File {filename} not found") from e
 
@@ -109,7 +217,7 @@ class LocalFolderStorageService(StorageService):
         self._delete_file(filename)
 
     def _delete_file(self, filename: str):
-        filename = os.path.join("uploaded_images", filename)
+        filename = os.path.join(UPLOAD_FOLDER, filename)
         os.remove(filename)
 
 
@@ -118,25 +226,38 @@ class SupabaseStorageService(StorageService):
         self.supabase = create_client(supabase_url, supabase_key)
         self.bucket_name = bucket_name
 
-    def _upload(self, file: FileStorage) -> str:
-        """Upload a file to Supabase bucket and return its public URL (CDN)."""
+    def _upload(self, upload: ImageUpload, filename: str) -> str:
+        """Upload a file to Supabase bucket and return its public URL (CDN).
+
+        The upload is spooled to a temporary file, the client streams it from there.
+        """
         filename = (
-            uuid.uuid4().hex + secure_filename(file.filename or "unnamed_file") + ".jpg"
+            uuid.uuid4().hex + secure_filename(filename or "unnamed_file") + ".jpg"
         )
-
-        try:
-            file_bytes = file.read()
-            self.supabase.storage.from_(self.bucket_name).upload(
-                filename,
-                file_bytes,
-                file_options={  # type: ignore
-                    "cacheControl": "public, max-age=31536000",
-                },
-            )
-            url = self.supabase.storage.from_(self.bucket_name).get_public_url(filename)
-            return url
-        except Exception as e:
-            raise UploadError("Failed to save file") from e
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, filename)
+            try:
+                with open(path, "wb") as target:
+                    upload.write_to(target)
+            except OSError as e:
+                raise UploadError("Failed to save file") from e
+            try:
+                with open(path, "rb") as stream:
+                    self.supabase.storage.from_(self.bucket_name).upload(
+                        filename,
+                        stream,
+                        file_options={  # type: ignore
+                            "cacheControl": "public, max-age=31536000",
+                            "content-type": upload.mime,
+                            "metadata": {"sha256": upload.sha256},
+                        },
+                    )
+                url = self.supabase.storage.from_(self.bucket_name).get_public_url(
+                    filename
+                )
+                return url
+            except Exception as e:
+                raise UploadError("Failed to save file") from e
 
     def send_file(self, filename: str):
         return None  # interfaces should be refactored
@@ -2,6 +2,7 @@ import datetime
 import os
 import re
 
+from api.blueprints.common.cache import CacheBackend, LRUCacheBackend
 from api.blueprints.uploads.services import (
     LocalFolderStorageService,
     StorageService,
@@ -28,6 +29,58 @@ class Config:
     JWT_REFRESH_COOKIE_PATH = "/auth/refresh"
     JWT_REFRESH_CSRF_COOKIE_PATH = "/auth/refresh"
     STORAGE_SERVICE: StorageService
+    # "grid" clusters the visible area on every request,
+    # "pyramid" reads precomputed clusters (run `flask posts rebuild-clusters` first)
+    MAP_CLUSTERING = os.environ.get("MAP_CLUSTERING") or "grid"
+    # "auto", "rtree" (SQLite), "gist" (PostgreSQL) or "memory"
+    SPATIAL_INDEX = os.environ.get("SPATIAL_INDEX") or "auto"
+    # seconds the "memory" index of a worker may miss the writes of other workers
+    SPATIAL_INDEX_TTL = int(os.environ.get("SPATIAL_INDEX_TTL") or 60)
+    TILE_CACHE_DIR = os.environ.get("TILE_CACHE_DIR") or os.path.join(
+        basedir, "tile_cache"
+    )
+    # seconds browsers, CDNs and proxies may reuse a vector tile
+    TILE_MAX_AGE = int(os.environ.get("TILE_MAX_AGE") or 60)
+    # seconds a cached total of a paginated listing is reused if nothing is written
+    COUNT_CACHE_TTL = int(os.environ.get("COUNT_CACHE_TTL") or 60)
+    # cache of anonymous GET responses, None disables it
+    RESPONSE_CACHE: CacheBackend | None = None
+    # seconds a cached response is reused, writes made through the ORM invalidate it
+    RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL") or 60)
+    # gzip (and brotli if installed) responses for clients accepting them
+    COMPRESS_RESPONSES = os.environ.get("COMPRESS_RESPONSES", "1") == "1"
+    # bytes, smaller bodies are not worth compressing
+    COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE") or 1024)
+    # seconds geocoding answers are reused, unknown locality ids are retried sooner
+    GEOCODE_CACHE_TTL = int(os.environ.get("GEOCODE_CACHE_TTL") or 30 * 24 * 3600)
+    GEOCODE_NEGATIVE_CACHE_TTL = int(
+        os.environ.get("GEOCODE_NEGATIVE_CACHE_TTL") or 3600
+    )
+    # seconds to connect to and to wait for the geocoding provider
+    GEOCODING_TIMEOUT = float(os.environ.get("GEOCODING_TIMEOUT") or 5)
+    GEOCODING_RETRIES = int(os.environ.get("GEOCODING_RETRIES") or 2)
+    # connections kept open to the geocoding provider per worker process
+    GEOCODING_POOL_SIZE = int(os.environ.get("GEOCODING_POOL_SIZE") or 10)
+    # localities per Nominatim lookup request, its limit is 50 object ids, and
+    # seconds a lookup waits for the lookups of concurrent requests to join it
+    GEOCODING_BATCH_SIZE = int(os.environ.get("GEOCODING_BATCH_SIZE") or 50)
+    GEOCODING_BATCH_WINDOW = float(os.environ.get("GEOCODING_BATCH_WINDOW") or 0.05)
+    # consecutive failed lookups opening the circuit breaker, and seconds it stays
+    # open before a probe lookup is let through
+    GEOCODING_FAILURE_THRESHOLD = int(
+        os.environ.get("GEOCODING_FAILURE_THRESHOLD") or 5
+    )
+    GEOCODING_RESET_TIMEOUT = float(os.environ.get("GEOCODING_RESET_TIMEOUT") or 30)
+    # GeoJSON file of locality boundaries for reverse geocoding without Nominatim
+    LOCALITY_BOUNDARIES = os.environ.get("LOCALITY_BOUNDARIES")
+    # store posts with unknown localities at once and look them up in the background
+    ASYNC_GEOCODING = os.environ.get("ASYNC_GEOCODING") == "1"
+    # threads per worker process looking up pending localities
+    GEOCODING_WORKERS = int(os.environ.get("GEOCODING_WORKERS") or 4)
+    # "json" (standard library) or "orjson", both write the same bytes
+    JSON_PROVIDER = os.environ.get("JSON_PROVIDER") or "json"
+    # dump hot output schemas with precompiled functions instead of marshmallow
+    COMPILED_SCHEMAS = os.environ.get("COMPILED_SCHEMAS") == "1"
 
 
 class DevConfig(Config):
@@ -38,6 +91,9 @@ class DevConfig(Config):
     # Allow localhost, 127.0.0.1, and Docker 'frontend' service
     CORS_ORIGINS = re.compile(r"^https?://(localhost|127\.0\.0\.1|frontend):4200$")
     STORAGE_SERVICE = LocalFolderStorageService()
+    RESPONSE_CACHE = (
+        LRUCacheBackend() if os.environ.get("RESPONSE_CACHE") == "1" else None
+    )
 
 
 class TestConfig(Config):
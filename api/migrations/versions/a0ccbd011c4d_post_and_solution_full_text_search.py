@@ -0,0 +1,71 @@
+"""post and solution full-text search
+
+Revision ID: a0ccbd011c4d
+Revises: 04d04aed5b53
+Create Date: 2026-10-18 12:41:09.318254
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a0ccbd011c4d'
+down_revision = '04d04aed5b53'
+branch_labels = None
+depends_on = None
+
+TABLES = ('post', 'solution')
+
+
+def upgrade():
+    dialect_name = op.get_bind().dialect.name
+    if dialect_name == 'sqlite':
+        for table in TABLES:
+            fts = f'{table}_fts'
+            op.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(title, body, '
+                f"content='{table}', content_rowid='id', "
+                "tokenize='unicode61 remove_diacritics 2')"
+            )
+            op.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} '
+                f'BEGIN INSERT INTO {fts}(rowid, title, body) '
+                'VALUES (new.id, new.title, new.body); END'
+            )
+            op.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {fts}_update '
+                f'AFTER UPDATE OF title, body ON {table} BEGIN '
+                f'INSERT INTO {fts}({fts}, rowid, title, body) '
+                "VALUES ('delete', old.id, old.title, old.body); "
+                f'INSERT INTO {fts}(rowid, title, body) '
+                'VALUES (new.id, new.title, new.body); END'
+            )
+            op.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} '
+                f'BEGIN INSERT INTO {fts}({fts}, rowid, title, body) '
+                "VALUES ('delete', old.id, old.title, old.body); END"
+            )
+            # index existing rows
+            op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+    elif dialect_name == 'postgresql':
+        for table in TABLES:
+            op.execute(
+                f'CREATE INDEX IF NOT EXISTS ix_{table}_search ON {table} USING gin '
+                "((setweight(to_tsvector('simple', title), 'A') || "
+                "setweight(to_tsvector('simple', body), 'B')))"
+            )
+
+
+def downgrade():
+    dialect_name = op.get_bind().dialect.name
+    if dialect_name == 'sqlite':
+        for table in TABLES:
+            fts = f'{table}_fts'
+            op.execute(f'DROP TRIGGER IF EXISTS {fts}_delete')
+            op.execute(f'DROP TRIGGER IF EXISTS {fts}_update')
+            op.execute(f'DROP TRIGGER IF EXISTS {fts}_insert')
+            op.execute(f'DROP TABLE IF EXISTS {fts}')
+    elif dialect_name == 'postgresql':
+        for table in TABLES:
+            op.execute(f'DROP INDEX IF EXISTS ix_{table}_search')
@@ -0,0 +1,61 @@
+"""post spatial index
+
+Revision ID: cd52b4aac857
+Revises: eea93edeafab
+Create Date: 2026-10-18 09:12:41.228113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cd52b4aac857'
+down_revision = 'eea93edeafab'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect_name = op.get_bind().dialect.name
+    if dialect_name == 'sqlite':
+        op.execute(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS post_rtree '
+            'USING rtree(id, min_lat, max_lat, min_lng, max_lng)'
+        )
+        op.execute(
+            'CREATE TRIGGER IF NOT EXISTS post_rtree_insert AFTER INSERT ON post BEGIN '
+            'INSERT INTO post_rtree VALUES '
+            '(new.id, new.latitude, new.latitude, new.longitude, new.longitude); END'
+        )
+        op.execute(
+            'CREATE TRIGGER IF NOT EXISTS post_rtree_update '
+            'AFTER UPDATE OF latitude, longitude ON post BEGIN '
+            'UPDATE post_rtree SET min_lat = new.latitude, max_lat = new.latitude, '
+            'min_lng = new.longitude, max_lng = new.longitude WHERE id = new.id; END'
+        )
+        op.execute(
+            'CREATE TRIGGER IF NOT EXISTS post_rtree_delete AFTER DELETE ON post BEGIN '
+            'DELETE FROM post_rtree WHERE id = old.id; END'
+        )
+        # backfill existing posts
+        op.execute(
+            'INSERT INTO post_rtree '
+            'SELECT id, latitude, latitude, longitude, longitude FROM post'
+        )
+    elif dialect_name == 'postgresql':
+        op.execute(
+            'CREATE INDEX IF NOT EXISTS ix_post_location ON post '
+            'USING gist (point(longitude, latitude))'
+        )
+
+
+def downgrade():
+    dialect_name = op.get_bind().dialect.name
+    if dialect_name == 'sqlite':
+        op.execute('DROP TRIGGER IF EXISTS post_rtree_delete')
+        op.execute('DROP TRIGGER IF EXISTS post_rtree_update')
+        op.execute('DROP TRIGGER IF EXISTS post_rtree_insert')
+        op.execute('DROP TABLE IF EXISTS post_rtree')
+    elif dialect_name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_post_location')
@@ -1,9 +1,234 @@
+import datetime
+import functools
 import os
+import threading
+import time
+from collections.abc import Callable, Collection, Hashable, Mapping
+from concurrent.futures import Future
+from typing import Generic, NamedTuple, TypeVar
 
 import requests
+import sqlalchemy as sa
+from flask import current_app
+from requests.adapters import HTTPAdapter
+from sqlalchemy import orm as so
+from sqlalchemy.exc import SQLAlchemyError
+from urllib3.util import Retry
 
+from api import db
 from api.blueprints.auth.models import User
-from api.blueprints.locations.models import Locality
+from api.blueprints.common.models import dialect_insert
+from api.blueprints.locations.gazetteer import NAME_LENGTH
+from api.blueprints.locations.models import (
+    LOCATION_COUNTRY,
+    Country,
+    GeocodeCache,
+    Locality,
+    State,
+)
+from api.blueprints.locations.reverse import Boundary
+from api.blueprints.locations.stats import add_stats
+
+T = TypeVar("T")
+K = TypeVar("K", bound=Hashable)
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one call.
+
+    The first caller runs the function, callers arriving while it runs wait for it
+    and get the same result or exception. Only calls within the worker process
+    are coalesced.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, function: Callable[[], T]) -> T:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+        if not leader:
+            return call.result()
+        try:
+            result = function()
+        except BaseException as error:
+            call.set_exception(error)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class BatchResolver(Generic[K, T]):
+    """Resolves the keys requested by concurrent callers with one call.
+
+    The first caller of a batch waits up to ``window`` seconds for other callers,
+    or until ``max_size`` keys are collected, then calls ``resolve_many`` with the
+    keys of the batch on behalf of all of them. Every caller gets the value of
+    its key or the exception of the call, ``KeyError`` if its key is missing
+    from the result. Only calls within the worker process are batched.
+    """
+
+    def __init__(
+        self,
+        resolve_many: Callable[[list[K]], Mapping[K, T]],
+        max_size: int,
+        window: float,
+    ):
+        self._resolve_many = resolve_many
+        self.max_size = max_size
+        self.window = window
+        self._condition = threading.Condition()
+        self._batch: dict[K, Future] | None = None
+
+    def resolve(self, key: K) -> T:
+        with self._condition:
+            batch = self._batch
+            leader = batch is None
+            if leader:
+                batch = self._batch = {}
+            call = batch.get(key)
+            if call is None:
+                call = batch[key] = Future()
+            if len(batch) >= self.max_size:
+                # full, later callers start a new batch
+                self._batch = None
+                self._condition.notify_all()
+            if leader:
+                self._condition.wait_for(
+                    lambda: self._batch is not batch, timeout=self.window
+                )
+                if self._batch is batch:
+                    self._batch = None
+        if leader:
+            self._run(batch)
+        return call.result()
+
+    def _run(self, batch: dict[K, Future]) -> None:
+        try:
+            values = self._resolve_many(list(batch))
+        except BaseException as error:
+            for call in batch.values():
+                call.set_exception(error)
+            return
+        for key, call in batch.items():
+            if key in values:
+                call.set_result(values[key])
+            else:
+                call.set_exception(KeyError(key))
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of calling a service while its circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Fails fast while a service keeps failing.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and calls
+    raise ``CircuitOpenError`` without reaching the service. ``reset_timeout``
+    seconds later the circuit is half-open: one probe call is let through, its
+    success closes the circuit and its failure opens it again. Exceptions other
+    than ``failure_exceptions`` mean that the service answered.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int,
+        reset_timeout: float,
+        failure_exceptions: tuple[type[BaseException], ...] = (Exception,),
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failure_exceptions = failure_exceptions
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._calls = 0
+        self._failures = 0
+        self._rejected_calls = 0
+        self._times_opened = 0
+
+    def _current_state(self) -> str:
+        if (
+            self._state == self.OPEN
+            and self._clock() - self._opened_at >= self.reset_timeout
+        ):
+            return self.HALF_OPEN
+        return self._state
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def call(self, function: Callable[[], T]) -> T:
+        with self._lock:
+            state = self._current_state()
+            if state == self.OPEN or (state == self.HALF_OPEN and self._probing):
+                self._rejected_calls += 1
+                raise CircuitOpenError("Circuit breaker is open")
+            self._probing = state == self.HALF_OPEN
+            self._calls += 1
+        try:
+            result = function()
+        except self.failure_exceptions:
+            self._record(success=False)
+            raise
+        except BaseException:
+            self._record(success=True)
+            raise
+        self._record(success=True)
+        return result
+
+    def _record(self, success: bool) -> None:
+        with self._lock:
+            probe = self._probing
+            self._probing = False
+            if success:
+                self._state = self.CLOSED
+                self._consecutive_failures = 0
+                return
+            self._failures += 1
+            self._consecutive_failures += 1
+            if probe or self._consecutive_failures >= self.failure_threshold:
+                if probe or self._state != self.OPEN:
+                    self._times_opened += 1
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+
+    def metrics(self) -> dict:
+        """Return the state and the counters since the breaker was created."""
+        with self._lock:
+            state = self._current_state()
+            return {
+                "state": state,
+                "consecutive_failures": self._consecutive_failures,
+                "calls": self._calls,
+                "failures": self._failures,
+                "rejected_calls": self._rejected_calls,
+                "times_opened": self._times_opened,
+                "retry_in": (
+                    max(0.0, self._opened_at + self.reset_timeout - self._clock())
+                    if state == self.OPEN
+                    else 0.0
+                ),
+            }
 
 
 class EmailService:  # replace with flask-mail?
@@ -23,65 +248,466 @@ class EmailService:  # replace with flask-mail?
         )
 
 
+class Place(NamedTuple):
+    latitude: float
+    longitude: float
+    name: str | None = None
+    state: str | None = None
+    country: str | None = None
+
+
 class NominatimService:
+    """Coordinates of OpenStreetMap localities from Nominatim.
+
+    Answers, including unknown ids and the names of the locality, its state and
+    country, are cached in the ``geocode_cache`` table and
+    requests share a pooled session retrying failed connections and 429 and 5xx
+    responses with backoff. Up to ``GEOCODING_BATCH_SIZE`` localities are looked
+    up per request, concurrent lookups are batched with ``batch_resolver``.
+    """
+
+    PROVIDER = "nominatim"
+    LOOKUP_URL = "https://nominatim.openstreetmap.org/lookup"
+    # a locality id may be a node, a way or a relation, in this order of preference
+    OSM_TYPES = ("N", "W", "R")
+
     @staticmethod
-    def get_latitude_longitude(locality_id: int) -> tuple[float, float]:
-        url = "https://nominatim.openstreetmap.org/lookup?osm_ids=N{},W{},R{}&format=geocodejson"
-        url = url.format(locality_id, locality_id, locality_id)
-        headers = {
-            "User-Agent": os.environ.get("NOMINATIM_USER_AGENT") or "City Report",
-            "Accept-language": "en",
-            "Referer": os.environ.get("NOMINATIM_REFERER"),
-        }
-        r = requests.get(url, timeout=10, headers=headers)
+    def http_session() -> requests.Session:
+        """Return the HTTP session of the current application."""
+        session = current_app.extensions.get("nominatim_session")
+        if session is None:
+            retry = Retry(
+                total=current_app.config["GEOCODING_RETRIES"],
+                backoff_factor=0.25,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset({"GET"}),
+                # a long Retry-After would hold the request that needs the locality
+                respect_retry_after_header=False,
+            )
+            session = requests.Session()
+            session.mount(
+                "https://",
+                HTTPAdapter(
+                    pool_maxsize=current_app.config["GEOCODING_POOL_SIZE"],
+                    max_retries=retry,
+                ),
+            )
+            session.headers.update(
+                {
+                    "User-Agent": os.environ.get("NOMINATIM_USER_AGENT")
+                    or "City Report",
+                    "Accept-language": "en",
+                }
+            )
+            if os.environ.get("NOMINATIM_REFERER"):
+                session.headers["Referer"] = os.environ["NOMINATIM_REFERER"]
+            current_app.extensions["nominatim_session"] = session
+        return session
+
+    @staticmethod
+    def circuit_breaker() -> CircuitBreaker:
+        """Return the circuit breaker guarding the calls of the current application."""
+        breaker = current_app.extensions.get("nominatim_circuit_breaker")
+        if breaker is None:
+            breaker = CircuitBreaker(
+                current_app.config["GEOCODING_FAILURE_THRESHOLD"],
+                current_app.config["GEOCODING_RESET_TIMEOUT"],
+                failure_exceptions=(requests.RequestException,),
+            )
+            current_app.extensions["nominatim_circuit_breaker"] = breaker
+        return breaker
+
+    @staticmethod
+    def batch_resolver() -> BatchResolver[int, Place | None]:
+        """Return the resolver batching concurrent lookups of the current application."""
+        resolver = current_app.extensions.get("nominatim_batch_resolver")
+        if resolver is None:
+            resolver = BatchResolver(
+                NominatimService._lookup_and_cache,
+                current_app.config["GEOCODING_BATCH_SIZE"],
+                current_app.config["GEOCODING_BATCH_WINDOW"],
+            )
+            current_app.extensions["nominatim_batch_resolver"] = resolver
+        return resolver
+
+    @staticmethod
+    def lookup(locality_id: int) -> Place | None:
+        """Ask Nominatim for the place, None if the locality does not exist.
+
+        Raises ``CircuitOpenError`` without a request while Nominatim is failing.
+        """
+        return NominatimService.lookup_batch([locality_id])[locality_id]
+
+    @staticmethod
+    def lookup_batch(
+        locality_ids: Collection[int],
+    ) -> dict[int, Place | None]:
+        """Ask Nominatim for the places of up to ``GEOCODING_BATCH_SIZE`` ids.
+
+        Every id is asked for as a node, a way and a relation in one request when
+        they fit, otherwise nodes are asked for first and ways and relations only
+        for the ids not found. Unknown ids map to None.
+
+        Raises ``CircuitOpenError`` without a request while Nominatim is failing.
+        """
+        limit = current_app.config["GEOCODING_BATCH_SIZE"]
+        pending = list(dict.fromkeys(locality_ids))
+        if len(pending) > limit:
+            raise ValueError(f"At most {limit} localities are looked up at once")
+        if len(pending) * len(NominatimService.OSM_TYPES) <= limit:
+            rounds = [NominatimService.OSM_TYPES]
+        else:
+            rounds = [(osm_type,) for osm_type in NominatimService.OSM_TYPES]
+        places = {}
+        breaker = NominatimService.circuit_breaker()
+        for osm_types in rounds:
+            if not pending:
+                break
+            osm_ids = [f"{t}{i}" for i in pending for t in osm_types]
+            answers = breaker.call(
+                functools.partial(NominatimService._request, osm_ids)
+            )
+            for locality_id in pending:
+                for osm_type in osm_types:
+                    if (osm_type, locality_id) in answers:
+                        places[locality_id] = answers[osm_type, locality_id]
+                        break
+            pending = [i for i in pending if i not in places]
+        return places | dict.fromkeys(pending)
+
+    @staticmethod
+    def _request(osm_ids: list[str]) -> dict[tuple[str, int], Place]:
+        """Return the found places by OSM type letter and id."""
+        r = NominatimService.http_session().get(
+            NominatimService.LOOKUP_URL,
+            params={"osm_ids": ",".join(osm_ids), "format": "geocodejson"},
+            timeout=current_app.config["GEOCODING_TIMEOUT"],
+        )
         r.raise_for_status()
-        json = r.json()
-        if len(json["features"]) == 0:
+        answers = {}
+        for feature in r.json()["features"]:
+            geocoding = feature["properties"]["geocoding"]
+            longitude, latitude = feature["geometry"]["coordinates"][:2]
+            key = (geocoding["osm_type"][0].upper(), int(geocoding["osm_id"]))
+            answers[key] = Place(
+                latitude,
+                longitude,
+                *(
+                    str(geocoding[name])[:NAME_LENGTH] if geocoding.get(name) else None
+                    for name in ("name", "state", "country")
+                ),
+            )
+        return answers
+
+    @staticmethod
+    def _cache(answers: Mapping[int, Place | None]) -> None:
+        now = datetime.datetime.now(datetime.UTC)
+        config = current_app.config
+        entries = []
+        for locality_id, place in answers.items():
+            ttl = config["GEOCODE_CACHE_TTL" if place else "GEOCODE_NEGATIVE_CACHE_TTL"]
+            entries.append(
+                GeocodeCache(
+                    provider=NominatimService.PROVIDER,  # type: ignore
+                    external_id=locality_id,  # type: ignore
+                    latitude=place.latitude if place else None,  # type: ignore
+                    longitude=place.longitude if place else None,  # type: ignore
+                    name=place.name if place else None,  # type: ignore
+                    state=place.state if place else None,  # type: ignore
+                    country=place.country if place else None,  # type: ignore
+                    expires_at=now + datetime.timedelta(seconds=ttl),  # type: ignore
+                )
+            )
+        # committed on its own, the request is rolled back for invalid ids
+        try:
+            with so.Session(db.engine) as session:
+                for entry in entries:
+                    session.merge(entry)
+                session.commit()
+        except SQLAlchemyError:
+            current_app.logger.warning(
+                "Could not cache the locations of %s", list(answers), exc_info=True
+            )
+
+    @staticmethod
+    def _lookup_and_cache(locality_ids: list[int]) -> dict[int, Place | None]:
+        answers = NominatimService.lookup_batch(locality_ids)
+        NominatimService._cache(answers)
+        return answers
+
+    @staticmethod
+    def _cached(locality_ids: Collection[int]) -> dict[int, tuple[GeocodeCache, bool]]:
+        """Return the cache entries of the ids and whether they are unexpired."""
+        rows = db.session.execute(
+            sa.select(
+                GeocodeCache,
+                (GeocodeCache.expires_at > datetime.datetime.now(datetime.UTC)).label(
+                    "fresh"
+                ),
+            ).where(
+                GeocodeCache.provider == NominatimService.PROVIDER,
+                GeocodeCache.external_id.in_(locality_ids),
+            )
+        )
+        return {
+            row.GeocodeCache.external_id: (row.GeocodeCache, row.fresh) for row in rows
+        }
+
+    @staticmethod
+    def _coordinates(entry: GeocodeCache) -> tuple[float, float] | None:
+        """Return the coordinates of a cache entry, None for an unknown id."""
+        if entry.latitude is None or entry.longitude is None:
+            return None
+        return entry.latitude, entry.longitude
+
+    @staticmethod
+    def get_latitude_longitude(locality_id: int) -> tuple[float, float]:
+        """Return cached or looked up coordinates of the locality.
+
+        Expired coordinates are returned when Nominatim fails.
+
+        Raises:
+            ValueError: If Nominatim does not know the locality
+            requests.RequestException: If Nominatim fails and nothing is cached
+        """
+        entry = NominatimService._cached([locality_id]).get(locality_id)
+        if entry is not None and entry[1]:
+            coordinates = NominatimService._coordinates(entry[0])
+        else:
+            try:
+                # looked up together with the localities of concurrent requests
+                place = NominatimService.batch_resolver().resolve(locality_id)
+            except requests.RequestException:
+                stale = (
+                    None if entry is None else NominatimService._coordinates(entry[0])
+                )
+                if stale is None:
+                    raise
+                return stale
+            coordinates = None if place is None else (place.latitude, place.longitude)
+        if coordinates is None:
             raise ValueError("Invalid locality id")
-        latitude = json["features"][0]["geometry"]["coordinates"][1]
-        longitude = json["features"][0]["geometry"]["coordinates"][0]
-        return latitude, longitude
+        return coordinates
+
+    @staticmethod
+    def cached_place(locality_id: int) -> Place | None:
+        """Return the cached place of the locality, expired or not, without a lookup."""
+        entry = db.session.get(GeocodeCache, (NominatimService.PROVIDER, locality_id))
+        coordinates = None if entry is None else NominatimService._coordinates(entry)
+        if entry is None or coordinates is None:
+            return None
+        return Place(*coordinates, entry.name, entry.state, entry.country)
+
+    @staticmethod
+    def get_latitude_longitude_many(
+        locality_ids: Collection[int],
+    ) -> dict[int, tuple[float, float] | None]:
+        """Return cached or looked up coordinates of many localities.
+
+        Localities missing from the cache are looked up ``GEOCODING_BATCH_SIZE``
+        at a time, for imports and backfills. Unknown ids map to None, ids whose
+        lookup failed map to their expired coordinates or are left out.
+        """
+        locality_ids = list(dict.fromkeys(locality_ids))
+        cached = NominatimService._cached(locality_ids)
+        coordinates = {
+            locality_id: NominatimService._coordinates(entry)
+            for locality_id, (entry, fresh) in cached.items()
+            if fresh
+        }
+        missing = [i for i in locality_ids if i not in coordinates]
+        size = current_app.config["GEOCODING_BATCH_SIZE"]
+        for start in range(0, len(missing), size):
+            batch = missing[start : start + size]
+            try:
+                places = NominatimService._lookup_and_cache(batch)
+            except requests.RequestException:
+                current_app.logger.warning(
+                    "Could not look up the locations of %s", batch, exc_info=True
+                )
+                for locality_id in batch:
+                    entry = cached.get(locality_id)
+                    stale = (
+                        None
+                        if entry is None
+                        else NominatimService._coordinates(entry[0])
+                    )
+                    if stale is not None:
+                        coordinates[locality_id] = stale
+                continue
+            coordinates.update(
+                (
+                    locality_id,
+                    None if place is None else (place.latitude, place.longitude),
+                )
+                for locality_id, place in places.items()
+            )
+        return coordinates
 
 
 class LocationService:
     """Service for handling locality operations across different providers."""
 
+    geocoding = SingleFlight()
+
+    @staticmethod
+    def _get_or_create_id(db_session, model, **values) -> tuple[int, bool]:
+        """Return the id of the row with the values and whether it was created."""
+        created = db_session.scalar(
+            dialect_insert(db_session, model)
+            .values(**values)
+            .on_conflict_do_nothing(index_elements=list(values))
+            .returning(model.id)
+        )
+        if created is not None:
+            return created, True
+        return db_session.scalar(sa.select(model.id).filter_by(**values)), False
+
+    @staticmethod
+    def link_region(
+        locality: Locality, state: str | None, country: str | None, db_session
+    ) -> None:
+        """Link a locality without a region to its state and country by name.
+
+        Missing countries and states are created. The ids are set on the instance,
+        so the flush updates the stats of the locality.
+        """
+        if country is None or locality.country_id is not None:
+            return
+        country_id, _ = LocationService._get_or_create_id(
+            db_session, Country, name=country
+        )
+        state_id = None
+        if state is not None:
+            state_id, created = LocationService._get_or_create_id(
+                db_session, State, country_id=country_id, name=state
+            )
+            if created:  # the insert bypasses the events counting states
+                add_stats(
+                    db_session.connection(), [(LOCATION_COUNTRY, country_id)], states=1
+                )
+        locality.country_id, locality.state_id = country_id, state_id
+
+    @staticmethod
+    def find_locality(locality_id: int, locality_provider: str) -> Locality | None:
+        """
+        Find a known locality without asking the provider.
+
+        Raises:
+            NotImplementedError: If the provider is not supported
+        """
+
+        if locality_provider == "nominatim":
+            return Locality.query.filter_by(osm_id=locality_id).first()
+        elif locality_provider == "google":
+            raise NotImplementedError("Google location provider not yet implemented")
+        else:
+            raise NotImplementedError("Unsupported locality provider")
+
     @staticmethod
     def get_or_create_locality(
-        locality_id: int, locality_provider: str, db_session
+        locality_id: int,
+        locality_provider: str,
+        db_session,
+        fallback_coordinates: tuple[float, float] | None = None,
     ) -> Locality:
         """
         Get or create a locality based on provider and ID.
 
+        When the external service fails or its circuit breaker is open, a new
+        locality is created at ``fallback_coordinates`` and marked approximate,
+        the next successful lookup replaces them with the provider's coordinates.
+
         Args:
             locality_id: The ID of the locality in the provider's system
             locality_provider: The provider name (e.g., "nominatim", "google")
             db_session: The database session to use for queries and commits
+            fallback_coordinates: Latitude and longitude to use without the service
 
         Returns:
             Locality: The locality object
 
         Raises:
             ValueError: If locality_id is invalid
-            requests.RequestException: If the external service is unavailable
+            requests.RequestException: If the external service is unavailable and
+                there are neither cached nor fallback coordinates
             NotImplementedError: If the provider is not supported
         """
 
-        if locality_provider == "nominatim":
-            locality = Locality.query.filter_by(osm_id=locality_id).first()
-            if not locality:
-                latitude, longitude = NominatimService.get_latitude_longitude(
-                    locality_id
-                )
-                locality = Locality(
-                    osm_id=locality_id,  # type: ignore
-                    latitude=latitude,  # type: ignore
-                    longitude=longitude,  # type: ignore
-                )
-                db_session.add(locality)
-                db_session.flush()
+        locality = LocationService.find_locality(locality_id, locality_provider)
+        if locality is not None and not locality.approximate:
             return locality
-        elif locality_provider == "google":
-            raise NotImplementedError("Google location provider not yet implemented")
+        try:
+            # concurrent requests for a new locality share one lookup
+            latitude, longitude = LocationService.geocoding.do(
+                (locality_provider, locality_id),
+                lambda: NominatimService.get_latitude_longitude(locality_id),
+            )
+            approximate = False
+        except requests.RequestException:
+            if locality is not None:
+                return locality
+            if fallback_coordinates is None:
+                raise
+            latitude, longitude = fallback_coordinates
+            approximate = True
+        if locality is not None:
+            locality.latitude, locality.longitude = latitude, longitude
+            locality.approximate = False
         else:
-            raise NotImplementedError("Unsupported locality provider")
+            insert = dialect_insert(db_session, Locality).values(
+                osm_id=locality_id,
+                latitude=latitude,
+                longitude=longitude,
+                approximate=approximate,
+            )
+            locality = db_session.scalar(
+                insert.on_conflict_do_nothing(
+                    index_elements=[Locality.osm_id]
+                ).returning(Locality)
+            )
+            if locality is None:  # created by a concurrent request
+                locality = Locality.query.filter_by(osm_id=locality_id).one()
+        place = None if approximate else NominatimService.cached_place(locality_id)
+        if place is not None:
+            if locality.name is None:
+                locality.name = place.name
+                locality.state, locality.country = place.state, place.country
+            LocationService.link_region(
+                locality, place.state, place.country, db_session
+            )
+        return locality
+
+    @staticmethod
+    def get_or_create_boundary_locality(boundary: Boundary, db_session) -> Locality:
+        """Get or create the Nominatim locality of a boundary without a lookup.
+
+        A new locality is placed at the label point of the boundary, an existing
+        approximate one is moved there. Localities without a region are linked to
+        the state and country of the boundary.
+        """
+        locality = LocationService.find_locality(boundary.osm_id, "nominatim")
+        if locality is None:
+            insert = dialect_insert(db_session, Locality).values(
+                osm_id=boundary.osm_id,
+                latitude=boundary.latitude,
+                longitude=boundary.longitude,
+                name=boundary.name,
+                state=boundary.state,
+                country=boundary.country,
+            )
+            locality = db_session.scalar(
+                insert.on_conflict_do_nothing(
+                    index_elements=[Locality.osm_id]
+                ).returning(Locality)
+            )
+            if locality is None:  # created by a concurrent request
+                locality = Locality.query.filter_by(osm_id=boundary.osm_id).one()
+        elif locality.approximate:
+            locality.latitude = boundary.latitude
+            locality.longitude = boundary.longitude
+            locality.approximate = False
+        LocationService.link_region(
+            locality, boundary.state, boundary.country, db_session
+        )
+        return locality
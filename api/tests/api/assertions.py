@@ -1,5 +1,8 @@
 from typing import Any
 
+from api import db
+from api.tests.api.helpers import count_queries
+
 
 def assert_pagination_response(response, total, page, total_pages, items_count):
     """Verify pagination metadata."""
@@ -62,3 +65,24 @@ def assert_resource_images(
 
         assert actual_image["id"] == expected_id
         assert actual_image["url"] == expected_url
+
+    assert response.json["imageCount"] == len(expected_images)
+    assert response.json["thumbnailUrl"] == (
+        response.json["images"][0]["url"] if expected_images else None
+    )
+
+
+def assert_constant_query_count(client, *urls):
+    """Assert that all URLs are served with the same number of SQL queries.
+
+    Used with listings of different page sizes to detect lazy loading per item.
+    """
+    query_counts = []
+    for url in urls:
+        # requests share the session of the test, start each with an empty one
+        db.session.expunge_all()
+        with count_queries() as queries:
+            response = client.get(url)
+        assert response.status_code == 200
+        query_counts.append(len(queries))
+    assert len(set(query_counts)) == 1, f"Query counts differ: {query_counts}"
@@ -1,11 +1,13 @@
+from io import BytesIO
+
 import email_validator
 import pytest
 from flask import Response
-from werkzeug.datastructures import FileStorage
 
 from api import create_app
 from api import db as _db
-from api.blueprints.uploads.services import LocalFolderStorageService
+from api.blueprints.common.cache import LRUCacheBackend
+from api.blueprints.uploads.services import ImageUpload, LocalFolderStorageService
 from api.config import TestConfig
 from api.tests.api.helpers import (
     create_post,
@@ -17,7 +19,7 @@ from api.tests.api.helpers import (
 
 
 @pytest.fixture(autouse=True, scope="session")
-def app():
+def app(tmp_path_factory):
     """
     Application instantiator for each unit test session.
 
@@ -26,6 +28,7 @@ def app():
     3) Final tear down logic at the end of the session
     """
     TestConfig.STORAGE_SERVICE = TestStorageService()
+    TestConfig.TILE_CACHE_DIR = str(tmp_path_factory.mktemp("tile_cache"))
     app = create_app(TestConfig)
 
     with app.app_context():
@@ -46,6 +49,10 @@ def db(app):
         _db.session.execute(table.delete())
     _db.session.expunge_all()
     _db.session.commit()
+    # bulk deletes do not invalidate cached totals
+    app.extensions.pop("count_cache", None)
+    app.extensions.pop("nominatim_circuit_breaker", None)
+    app.extensions.pop("nominatim_batch_resolver", None)
 
 
 @pytest.fixture
@@ -54,6 +61,14 @@ def client(app, db):
     return app.test_client()
 
 
+@pytest.fixture
+def response_cache(app):
+    """Cache anonymous GET responses during the test."""
+    app.config["RESPONSE_CACHE"] = LRUCacheBackend()
+    yield app.config["RESPONSE_CACHE"]
+    app.config["RESPONSE_CACHE"] = None
+
+
 class AuthenticatedClient:
     def __init__(self, client, first_name, last_name, email, password):
         self.client = client
@@ -175,8 +190,10 @@ class TestStorageService(LocalFolderStorageService):
     def __init__(self):
         self.uploaded_images = {}
 
-    def _save_file(self, file: FileStorage, filename: str):
-        self.uploaded_images[filename] = file.read()
+    def _save_file(self, upload: ImageUpload, filename: str):
+        content = BytesIO()
+        upload.write_to(content)
+        self.uploaded_images[filename] = content.getvalue()
 
     def send_file(self, filename: str):
         try:
@@ -186,10 +203,8 @@ class TestStorageService(LocalFolderStorageService):
         return Response(image_data, mimetype="image/jpeg")
 
     @staticmethod
-    def _check_file_is_image(file: FileStorage) -> bool:
-        result = file.read() != b"not an image"
-        file.seek(0)
-        return result
+    def guess_image_type(header: bytes) -> str | None:
+        return None if header == b"not an image" else "image/png"
 
     def _delete_file(self, filename: str):
         self.uploaded_images.pop(filename, None)
@@ -1,6 +1,8 @@
 from types import MappingProxyType
+from typing import Any
 
-post_data = MappingProxyType(  # immutable dict view to ensure test isolation
+# immutable dict view to ensure test isolation
+post_data: MappingProxyType[str, Any] = MappingProxyType(
     {
         "title": "Test Post",
         "body": "This is a test post",
@@ -1,7 +1,11 @@
+import contextlib
+from collections.abc import Iterator
 from types import MappingProxyType
 
 from pytest_lazy_fixtures import lf as _lf
+from sqlalchemy import event
 
+from api import db
 from api.tests.api.data import post_data, solution_data
 
 
@@ -55,3 +59,68 @@ def create_solution_with_images(
     data = dict(solution_data)
     data["imagesIds"] = images_ids
     return create_solution(client, post_url, data)
+
+
+@contextlib.contextmanager
+def count_queries() -> Iterator[list[str]]:
+    """Collect the SQL statements executed inside the block."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+
+
+class FakeRedis:
+    """Implements the subset of the Redis client used by the response cache."""
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    def sadd(self, key, *members):
+        self.values.setdefault(key, set()).update(members)
+
+    def smembers(self, key):
+        return set(self.values.get(key, ()))
+
+    def expire(self, key, seconds):
+        pass
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+    def scan_iter(self, match):
+        prefix = match.rstrip("*")
+        return [key for key in list(self.values) if key.startswith(prefix)]
+
+    def pipeline(self):
+        return FakeRedisPipeline(self)
+
+
+class FakeRedisPipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+
+        return queue
+
+    def execute(self):
+        for name, args, kwargs in self.commands:
+            getattr(self.client, name)(*args, **kwargs)
+        self.commands = []
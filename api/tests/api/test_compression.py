@@ -0,0 +1,68 @@
+import gzip
+import json
+
+import pytest
+
+from api.blueprints.common import compression
+from api.tests.api.helpers import create_post
+
+
+@pytest.fixture
+def compress_everything(app):
+    min_size = app.config["COMPRESS_MIN_SIZE"]
+    app.config["COMPRESS_MIN_SIZE"] = 0
+    yield
+    app.config["COMPRESS_MIN_SIZE"] = min_size
+
+
+def test_large_responses_are_compressed(authenticated_client):
+    for _ in range(5):
+        create_post(authenticated_client)
+
+    response = authenticated_client.get("/posts", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    expected = authenticated_client.get("/posts").json["items"]
+    assert json.loads(gzip.decompress(response.data))["items"] == expected
+
+
+def test_small_responses_are_not_compressed(authenticated_client, post):
+    response = authenticated_client.get(post, headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+
+
+def test_images_are_not_compressed(authenticated_client, image, compress_everything):
+    _, url = image
+    response = authenticated_client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+
+
+def test_cached_responses_store_compressed_variants(
+    response_cache, client, post, compress_everything, mocker
+):
+    response = client.get(post, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["X-Cache"] == "MISS"
+    compress = mocker.spy(compression, "compress")
+
+    response = client.get(post, headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["X-Cache"] == "HIT"
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(response.data))["id"]
+    compress.assert_not_called()
+    response = client.get(post)
+    assert "Content-Encoding" not in response.headers
+
+
+def test_compressed_response_etag(authenticated_client, post, compress_everything):
+    response = authenticated_client.get(post, headers={"Accept-Encoding": "gzip"})
+    etag = response.headers["ETag"]
+    assert etag.endswith('-gzip"')
+    assert etag != authenticated_client.get(post).headers["ETag"]
+
+    response = authenticated_client.get(
+        post, headers={"Accept-Encoding": "gzip", "If-None-Match": etag}
+    )
+
+    assert response.status_code == 304
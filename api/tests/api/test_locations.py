@@ -0,0 +1,863 @@
+import gzip
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock
+
+import pytest
+import requests
+import sqlalchemy as sa
+from requests.adapters import HTTPAdapter
+from sqlalchemy import orm as so
+
+from api import db
+from api.blueprints.locations.models import Country, Locality, LocationStats, State
+from api.blueprints.locations.reverse import STRTree, parse_boundary
+from api.blueprints.locations.stats import check_location_stats
+from api.services import (
+    BatchResolver,
+    CircuitBreaker,
+    CircuitOpenError,
+    NominatimService,
+    Place,
+    SingleFlight,
+)
+from api.tests.api.data import post_data
+from api.tests.api.helpers import count_queries
+
+
+def feature(osm_id, latitude=50.45, longitude=30.52, osm_type="node", **names):
+    return {
+        "properties": {"geocoding": {"osm_type": osm_type, "osm_id": osm_id, **names}},
+        "geometry": {"type": "Point", "coordinates": [longitude, latitude]},
+    }
+
+
+FOUND = {"features": [feature(3167397)]}
+NOT_FOUND = {"features": []}
+
+
+@pytest.fixture
+def nominatim_get(mock_nominatim, mocker):
+    """Stop the NominatimService mock and answer its HTTP requests instead."""
+    mocker.stop(mock_nominatim)
+    return mocker.patch.object(requests.Session, "get")
+
+
+def test_geocoding_answers_are_cached(app, db, nominatim_get):
+    nominatim_get.return_value.json.return_value = FOUND
+
+    assert NominatimService.get_latitude_longitude(3167397) == (50.45, 30.52)
+    assert NominatimService.get_latitude_longitude(3167397) == (50.45, 30.52)
+
+    nominatim_get.assert_called_once()
+    assert nominatim_get.call_args.kwargs["params"]["osm_ids"] == (
+        "N3167397,W3167397,R3167397"
+    )
+
+
+def test_unknown_locality_ids_are_cached(authenticated_client, nominatim_get):
+    nominatim_get.return_value.json.return_value = NOT_FOUND
+    data = {**post_data, "localityId": 1}
+
+    for _ in range(2):
+        response = authenticated_client.post("/posts", json=data)
+        assert response.status_code == 400
+
+    nominatim_get.assert_called_once()
+
+
+def test_expired_answers_are_refreshed(app, db, nominatim_get):
+    ttl = app.config["GEOCODE_NEGATIVE_CACHE_TTL"]
+    app.config["GEOCODE_NEGATIVE_CACHE_TTL"] = 0
+    nominatim_get.return_value.json.return_value = NOT_FOUND
+    try:
+        with pytest.raises(ValueError, match="Invalid locality id"):
+            NominatimService.get_latitude_longitude(3167397)
+        nominatim_get.return_value.json.return_value = FOUND
+
+        assert NominatimService.get_latitude_longitude(3167397) == (50.45, 30.52)
+    finally:
+        app.config["GEOCODE_NEGATIVE_CACHE_TTL"] = ttl
+    assert nominatim_get.call_count == 2
+
+
+def test_geocoding_errors_are_not_cached(app, db, nominatim_get):
+    nominatim_get.side_effect = requests.ConnectionError
+    with pytest.raises(requests.ConnectionError):
+        NominatimService.get_latitude_longitude(3167397)
+
+    nominatim_get.side_effect = None
+    nominatim_get.return_value.json.return_value = FOUND
+    assert NominatimService.get_latitude_longitude(3167397) == (50.45, 30.52)
+
+
+def test_posts_use_their_coordinates_while_geocoding_fails(
+    authenticated_client, nominatim_get
+):
+    nominatim_get.side_effect = requests.ConnectionError
+    data = {**post_data, "latitude": 50.4, "longitude": 30.5}
+
+    response = authenticated_client.post("/posts", json=data)
+
+    assert response.status_code == 201
+    locality = Locality.query.filter_by(osm_id=post_data["localityId"]).one()
+    assert (locality.latitude, locality.longitude, locality.approximate) == (
+        50.4,
+        30.5,
+        True,
+    )
+
+    nominatim_get.side_effect = None
+    nominatim_get.return_value.json.return_value = FOUND
+    response = authenticated_client.post("/posts", json=dict(post_data))
+
+    assert response.status_code == 201
+    db.session.refresh(locality)
+    assert (locality.latitude, locality.longitude, locality.approximate) == (
+        50.45,
+        30.52,
+        False,
+    )
+
+
+def test_registration_fails_while_geocoding_fails(client, nominatim_get):
+    nominatim_get.side_effect = requests.ConnectionError
+    response = client.post(
+        "/auth/register",
+        json={
+            "firstName": "Test",
+            "lastName": "User",
+            "email": "test@gmail.com",
+            "password": "SecurePassw0rd!",
+            "localityId": 3167397,
+            "localityProvider": "nominatim",
+        },
+    )
+    assert response.status_code == 500
+
+
+def test_expired_answers_are_used_while_geocoding_fails(app, db, nominatim_get):
+    ttl = app.config["GEOCODE_CACHE_TTL"]
+    app.config["GEOCODE_CACHE_TTL"] = 0
+    nominatim_get.return_value.json.return_value = FOUND
+    try:
+        NominatimService.get_latitude_longitude(3167397)
+    finally:
+        app.config["GEOCODE_CACHE_TTL"] = ttl
+    nominatim_get.side_effect = requests.ConnectionError
+
+    assert NominatimService.get_latitude_longitude(3167397) == (50.45, 30.52)
+    assert nominatim_get.call_count == 2
+
+
+def test_circuit_breaker_fails_fast(app, db, nominatim_get):
+    threshold = app.config["GEOCODING_FAILURE_THRESHOLD"]
+    nominatim_get.side_effect = requests.Timeout
+    for _ in range(threshold):
+        with pytest.raises(requests.Timeout):
+            NominatimService.lookup(3167397)
+
+    with pytest.raises(CircuitOpenError):
+        NominatimService.lookup(3167397)
+
+    assert nominatim_get.call_count == threshold
+    metrics = NominatimService.circuit_breaker().metrics()
+    assert metrics["state"] == CircuitBreaker.OPEN
+    assert metrics["rejected_calls"] == 1
+    assert metrics["times_opened"] == 1
+
+
+def test_circuit_breaker_probes_after_reset_timeout():
+    now = [0.0]
+    breaker = CircuitBreaker(2, reset_timeout=10, clock=lambda: now[0])
+
+    def fail():
+        raise requests.ConnectionError
+
+    for _ in range(2):
+        with pytest.raises(requests.ConnectionError):
+            breaker.call(fail)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    now[0] = 10
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(requests.ConnectionError):
+        breaker.call(fail)
+    # a failed probe opens the circuit again at once
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: "not called")
+
+    now[0] = 20
+    assert breaker.call(lambda: "probe") == "probe"
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.metrics()["times_opened"] == 2
+
+
+def test_circuit_breaker_lets_one_probe_through():
+    now = [0.0]
+    breaker = CircuitBreaker(1, reset_timeout=10, clock=lambda: now[0])
+    with pytest.raises(ValueError):
+        breaker.call(lambda: int("x"))
+    now[0] = 10
+
+    def probe():
+        # calls made while the probe runs are rejected
+        with pytest.raises(CircuitOpenError):
+            breaker.call(lambda: "not called")
+        return "probe"
+
+    assert breaker.call(probe) == "probe"
+    assert breaker.metrics()["rejected_calls"] == 1
+
+
+def test_circuit_breaker_ignores_other_exceptions(app, db, nominatim_get):
+    nominatim_get.return_value.json.side_effect = KeyError
+    for _ in range(app.config["GEOCODING_FAILURE_THRESHOLD"]):
+        with pytest.raises(KeyError):
+            NominatimService.lookup(3167397)
+    assert NominatimService.circuit_breaker().state == CircuitBreaker.CLOSED
+
+
+def test_geocoding_status(authenticated_client, nominatim_get):
+    nominatim_get.side_effect = requests.ConnectionError
+    NominatimService.circuit_breaker()
+    with pytest.raises(requests.ConnectionError):
+        NominatimService.lookup(3167397)
+
+    response = authenticated_client.get("/geocoding")
+
+    assert response.status_code == 200
+    assert response.json["provider"] == "nominatim"
+    assert response.json["circuitBreaker"]["state"] == "closed"
+    assert response.json["circuitBreaker"]["consecutiveFailures"] == 1
+    assert response.json["circuitBreaker"]["failures"] == 1
+
+
+def test_geocoding_session_is_reused(app):
+    session = NominatimService.http_session()
+    assert NominatimService.http_session() is session
+    adapter = session.get_adapter(NominatimService.LOOKUP_URL)
+    assert isinstance(adapter, HTTPAdapter)
+    assert adapter.max_retries.total == app.config["GEOCODING_RETRIES"]
+    assert 429 in adapter.max_retries.status_forcelist
+
+
+def answer_lookups(nominatim_get, features):
+    """Answer lookups with the features of the requested OSM ids."""
+    by_osm_id = {}
+    for f in features:
+        geocoding = f["properties"]["geocoding"]
+        by_osm_id[f"{geocoding['osm_type'][0].upper()}{geocoding['osm_id']}"] = f
+
+    def get(url, params, timeout):
+        response = Mock()
+        response.json.return_value = {
+            "features": [
+                by_osm_id[osm_id]
+                for osm_id in params["osm_ids"].split(",")
+                if osm_id in by_osm_id
+            ]
+        }
+        return response
+
+    nominatim_get.side_effect = get
+
+
+def test_lookup_batch_maps_answers_to_ids(app, db, nominatim_get):
+    answer_lookups(
+        nominatim_get,
+        [
+            feature(1, 1, 1, "relation"),
+            feature(2, 2, 2),
+            # the node is preferred to the relation with the same id
+            feature(3, 3, 3, "relation"),
+            feature(3, 30, 30),
+        ],
+    )
+
+    assert NominatimService.lookup_batch([3, 1, 2, 4, 3]) == {
+        1: Place(1, 1),
+        2: Place(2, 2),
+        3: Place(30, 30),
+        4: None,
+    }
+    nominatim_get.assert_called_once()
+
+
+def test_large_batches_ask_for_nodes_first(app, db, nominatim_get):
+    answer_lookups(
+        nominatim_get,
+        [feature(i, i, i) for i in range(40)] + [feature(40, 0, 0, "way")],
+    )
+
+    coordinates = NominatimService.lookup_batch(range(50))
+
+    assert coordinates[39] == Place(39, 39)
+    assert coordinates[40] == Place(0, 0)
+    assert coordinates[49] is None
+    requested = [call.kwargs["params"]["osm_ids"] for call in nominatim_get.mock_calls]
+    assert [ids.split(",")[0][0] for ids in requested] == ["N", "W", "R"]
+    assert len(requested[0].split(",")) == 50
+    assert len(requested[1].split(",")) == 10
+
+
+def test_many_localities_are_looked_up_in_batches(app, db, nominatim_get):
+    answer_lookups(nominatim_get, [feature(i, i % 90, i % 180) for i in range(120)])
+    NominatimService._cache({0: Place(1.0, 1.0)})
+
+    coordinates = NominatimService.get_latitude_longitude_many(range(120))
+
+    assert coordinates[0] == (1.0, 1.0)
+    assert coordinates[119] == (29, 119)
+    # 119 ids, 50 per node request
+    assert nominatim_get.call_count == 3
+    nominatim_get.side_effect = requests.ConnectionError
+    assert NominatimService.get_latitude_longitude(119) == (29, 119)
+
+
+def test_concurrent_lookups_are_batched(app, db, nominatim_get):
+    answer_lookups(nominatim_get, [feature(i, i, i) for i in range(1, 6)])
+    resolver = NominatimService.batch_resolver()
+    resolver.window = 0.2
+
+    def get_latitude_longitude(locality_id):
+        with app.app_context():
+            return NominatimService.get_latitude_longitude(locality_id)
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        results = list(executor.map(get_latitude_longitude, range(1, 6)))
+
+    assert results == [(i, i) for i in range(1, 6)]
+    nominatim_get.assert_called_once()
+
+
+def test_batch_resolver_starts_a_new_batch_when_full():
+    batches = []
+
+    def resolve_many(keys):
+        batches.append(sorted(keys))
+        return {key: key * 2 for key in keys if key != 3}
+
+    resolver = BatchResolver(resolve_many, max_size=2, window=0.5)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(resolver.resolve, key) for key in (1, 2, 3, 3)]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except KeyError as e:
+                results.append(e)
+
+    assert results[:2] == [2, 4]
+    assert all(isinstance(result, KeyError) for result in results[2:])
+    assert batches == [[1, 2], [3]]
+
+
+def test_refine_localities_command(app, client, nominatim_get):
+    db.session.add_all(
+        [
+            Locality(osm_id=1, latitude=0, longitude=0, approximate=True),  # type: ignore
+            Locality(osm_id=2, latitude=0, longitude=0, approximate=True),  # type: ignore
+            Locality(osm_id=3, latitude=3, longitude=3),  # type: ignore
+        ]
+    )
+    db.session.commit()
+    answer_lookups(nominatim_get, [feature(1, 10, 10)])
+
+    result = app.test_cli_runner().invoke(args=["locations", "refine-localities"])
+
+    assert result.exit_code != 0
+    assert "Refined 1 of 2 approximate localities" in result.output
+    db.session.expire_all()
+    localities = localities_by_osm_id()
+    assert (localities[1].latitude, localities[1].approximate) == (10, False)
+    assert localities[2].approximate
+    nominatim_get.assert_called_once()
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def lookup():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 50.45, 30.52
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        leader = executor.submit(flights.do, 3167397, lookup)
+        started.wait(5)
+        followers = [executor.submit(flights.do, 3167397, lookup) for _ in range(3)]
+        time.sleep(0.05)
+        release.set()
+        results = [leader.result(), *(future.result() for future in followers)]
+
+    assert calls == [1]
+    assert results == [(50.45, 30.52)] * 4
+    assert flights.do(3167397, lambda: "new call") == "new call"
+
+
+def test_single_flight_shares_exceptions():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def lookup():
+        started.set()
+        release.wait(5)
+        raise ValueError("Invalid locality id")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(flights.do, 1, lookup)
+        started.wait(5)
+        follower = executor.submit(flights.do, 1, lookup)
+        time.sleep(0.05)
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(ValueError, match="Invalid locality id"):
+                future.result()
+
+
+def test_locality_created_concurrently_is_reused(authenticated_client, mock_nominatim):
+    def create_concurrently(locality_id):
+        with so.Session(db.engine) as session:
+            session.add(
+                Locality(
+                    osm_id=locality_id,  # type: ignore
+                    latitude=1.0,  # type: ignore
+                    longitude=2.0,  # type: ignore
+                )
+            )
+            session.commit()
+        return 50.45, 30.52
+
+    mock_nominatim.side_effect = create_concurrently
+
+    response = authenticated_client.post("/posts", json=dict(post_data))
+
+    assert response.status_code == 201
+    assert (
+        db.session.scalar(
+            sa.select(sa.func.count()).where(Locality.osm_id == post_data["localityId"])
+        )
+        == 1
+    )
+
+
+GAZETTEER_CSV = """osm_id,name,latitude,longitude,state,country
+3167397,Kyiv,50.45,30.52,,Ukraine
+26150422,Lviv,49.84,24.03,Lviv Oblast,Ukraine
+not-an-id,Nowhere,0,0,,
+30.5,Odesa,46.48,30.72,,Ukraine
+"""
+OSM_EXTRACT = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="12000000001" lat="50.45" lon="30.52">
+    <tag k="place" v="city"/><tag k="name" v="Київ"/><tag k="name:en" v="Kyiv"/>
+    <tag k="is_in:country" v="Ukraine"/>
+  </node>
+  <node id="2" lat="50.0" lon="30.0"><tag k="amenity" v="cafe"/></node>
+  <node id="3" lat="49.84" lon="24.03"/>
+  <way id="4"><nd ref="2"/><tag k="place" v="town"/></way>
+</osm>
+"""
+
+
+def localities_by_osm_id():
+    return {locality.osm_id: locality for locality in Locality.query.all()}
+
+
+def test_import_gazetteer_csv(app, authenticated_client, tmp_path, mock_nominatim):
+    path = tmp_path / "localities.csv"
+    path.write_text(GAZETTEER_CSV)
+
+    result = app.test_cli_runner().invoke(
+        args=["locations", "import-gazetteer", str(path), "--batch-size", "2"]
+    )
+
+    assert result.exit_code == 0, result.output
+    assert "Imported 2 localities, skipped 2 invalid records" in result.output
+    localities = localities_by_osm_id()
+    assert set(localities) == {3167397, 26150422}
+    assert localities[26150422].name == "Lviv"
+    assert localities[26150422].state == "Lviv Oblast"
+    assert localities[3167397].state is None
+    assert not (tmp_path / "localities.csv.checkpoint").exists()
+    # imported localities are resolved without Nominatim
+    response = authenticated_client.post("/posts", json=dict(post_data))
+    assert response.status_code == 201
+    mock_nominatim.assert_not_called()
+    # and linked to their countries and states
+    ukraine = authenticated_client.get("/countries").json["items"][0]
+    assert ukraine["name"] == "Ukraine"
+    assert ukraine["states"] == 1
+    assert ukraine["posts"] == 1
+    states = authenticated_client.get(f"/countries/{ukraine['id']}/states").json
+    assert states["items"][0]["localities"] == 1
+    assert localities[26150422].state_id == states["items"][0]["id"]
+    response = authenticated_client.get(f"/posts?stateId={states['items'][0]['id']}")
+    assert response.json["totalItems"] == 0
+    response = authenticated_client.get(f"/posts?countryId={ukraine['id']}")
+    assert response.json["totalItems"] == 1
+    assert check_location_stats() == []
+
+
+def test_import_gazetteer_resumes_from_checkpoint(app, client, tmp_path):
+    path = tmp_path / "localities.ndjson"
+    path.write_text(
+        '{"osm_id": 1, "latitude": 1, "longitude": 1}\n'
+        "\n"
+        '{"osm_id": 2, "latitude": 2, "longitude": 2, "name": "Second"}\n'
+    )
+    stat = path.stat()
+    checkpoint = tmp_path / "progress.json"
+    checkpoint.write_text(
+        json.dumps(
+            {
+                "file": {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns},
+                "records": 1,
+            }
+        )
+    )
+
+    result = app.test_cli_runner().invoke(
+        args=[
+            "locations",
+            "import-gazetteer",
+            str(path),
+            "--checkpoint",
+            str(checkpoint),
+        ]
+    )
+
+    assert result.exit_code == 0, result.output
+    assert "Resuming after 1 records" in result.output
+    assert set(localities_by_osm_id()) == {2}
+
+    result = app.test_cli_runner().invoke(
+        args=["locations", "import-gazetteer", str(path), "--restart"]
+    )
+
+    assert result.exit_code == 0, result.output
+    assert set(localities_by_osm_id()) == {1, 2}
+
+
+def test_import_gazetteer_osm_extract(app, client, tmp_path):
+    path = tmp_path / "extract.osm.gz"
+    path.write_bytes(gzip.compress(OSM_EXTRACT.encode()))
+
+    result = app.test_cli_runner().invoke(
+        args=["locations", "import-gazetteer", str(path)]
+    )
+
+    assert result.exit_code == 0, result.output
+    localities = localities_by_osm_id()
+    assert set(localities) == {12000000001}
+    assert localities[12000000001].name == "Kyiv"
+    assert localities[12000000001].country == "Ukraine"
+
+
+def square(min_lng, min_lat, max_lng, max_lat):
+    return [
+        [min_lng, min_lat],
+        [max_lng, min_lat],
+        [max_lng, max_lat],
+        [min_lng, max_lat],
+        [min_lng, min_lat],
+    ]
+
+
+def boundary_feature(osm_id, geometry_type, coordinates, **properties):
+    return {
+        "type": "Feature",
+        "properties": {"osm_id": osm_id, **properties},
+        "geometry": {"type": geometry_type, "coordinates": coordinates},
+    }
+
+
+@pytest.fixture
+def locality_boundaries(app, tmp_path):
+    path = tmp_path / "boundaries.geojson.gz"
+    features = [
+        boundary_feature(
+            3167397, "Polygon", [square(-75, 40, -73, 41.5)], name="New York"
+        ),
+        # nested in the previous one
+        boundary_feature(
+            175905,
+            "Polygon",
+            [square(-74.1, 40.6, -73.9, 40.8)],
+            name="Manhattan",
+            state="New York",
+            country="United States",
+            latitude=40.78,
+            longitude=-73.97,
+        ),
+        boundary_feature(1, "Point", [0, 0]),
+    ]
+    path.write_bytes(
+        gzip.compress(
+            json.dumps({"type": "FeatureCollection", "features": features}).encode()
+        )
+    )
+    app.config["LOCALITY_BOUNDARIES"] = str(path)
+    yield
+    app.config["LOCALITY_BOUNDARIES"] = None
+    app.extensions.pop("reverse_geocoder", None)
+
+
+def test_str_tree_finds_the_boxes_containing_a_point():
+    rng = random.Random(1)  # noqa: S311 -- reproducible test data
+    boxes = []
+    for i in range(500):
+        x, y = rng.uniform(-180, 170), rng.uniform(-90, 80)
+        boxes.append(((x, y, x + rng.uniform(0, 10), y + rng.uniform(0, 10)), i))
+    tree = STRTree(boxes, node_capacity=4)
+
+    for _ in range(200):
+        x, y = rng.uniform(-180, 180), rng.uniform(-90, 90)
+        expected = {
+            i for (x1, y1, x2, y2), i in boxes if x1 <= x <= x2 and y1 <= y <= y2
+        }
+        assert set(tree.query_point(x, y)) == expected
+    assert list(STRTree([]).query_point(0, 0)) == []
+
+
+def test_boundary_contains_points_outside_holes():
+    boundary = parse_boundary(
+        boundary_feature(
+            1,
+            "MultiPolygon",
+            [
+                [square(0, 0, 10, 10), square(4, 4, 6, 6)],
+                # a triangle, inside its bounding box only partly
+                [[[20, 0], [30, 0], [20, 10]]],
+            ],
+        )
+    )
+    assert boundary is not None
+
+    assert boundary.contains(1, 1)
+    assert not boundary.contains(5, 5)
+    assert boundary.contains(2, 21)
+    assert not boundary.contains(9, 29)
+    assert not boundary.contains(-1, 5)
+    # areas of the exteriors, nested boundaries are compared by their extent
+    assert boundary.area == 100 + 50
+    # centroid of the largest exterior
+    assert (boundary.latitude, boundary.longitude) == (5, 5)
+
+
+def test_reverse_geocoding(client, locality_boundaries, nominatim_get):
+    response = client.get("/localities/reverse?lat=40.7128&lng=-74.006")
+
+    assert response.status_code == 200
+    assert response.json["localityId"] == 175905
+    assert response.json["name"] == "Manhattan"
+    assert (response.json["latitude"], response.json["longitude"]) == (40.78, -73.97)
+    response = client.get("/localities/reverse?lat=41&lng=-74.5")
+    assert response.json["localityId"] == 3167397
+    assert response.json["latitude"] == 40.75
+    assert client.get("/localities/reverse?lat=0&lng=0").status_code == 404
+    assert Locality.query.count() == 0
+    nominatim_get.assert_not_called()
+
+
+def test_reverse_geocoding_returns_the_stored_locality_id(
+    authenticated_client, locality_boundaries, nominatim_get
+):
+    url = "/localities/reverse?lat=40.7128&lng=-74.006"
+    assert authenticated_client.get(url).json["id"] is None
+
+    data = {key: value for key, value in post_data.items() if key != "localityId"}
+    authenticated_client.post("/posts", json=data)
+
+    locality = Locality.query.filter_by(osm_id=175905).one()
+    assert authenticated_client.get(url).json["id"] == locality.id
+
+
+def test_reverse_geocoding_without_boundaries(client):
+    response = client.get("/localities/reverse?lat=0&lng=0")
+    assert response.status_code == 501
+
+
+def test_post_locality_is_found_from_coordinates(
+    authenticated_client, locality_boundaries, nominatim_get
+):
+    data = {key: value for key, value in post_data.items() if key != "localityId"}
+
+    response = authenticated_client.post("/posts", json=data)
+
+    assert response.status_code == 201
+    post = authenticated_client.get(response.headers["Location"]).json
+    assert post["localityNominatimId"] == 175905
+    response = authenticated_client.post("/posts", json={**data, "latitude": 0})
+    assert response.status_code == 422
+    nominatim_get.assert_not_called()
+
+
+def test_post_locality_is_verified(
+    authenticated_client, locality_boundaries, mock_nominatim
+):
+    response = authenticated_client.post("/posts", json=dict(post_data))
+    assert response.status_code == 201
+    mock_nominatim.assert_not_called()
+
+    response = authenticated_client.post(
+        "/posts", json={**post_data, "latitude": 0, "longitude": 0}
+    )
+    assert response.status_code == 400
+
+    # localities without a known boundary are looked up
+    response = authenticated_client.post(
+        "/posts", json={**post_data, "localityId": 99, "latitude": 0}
+    )
+    assert response.status_code == 201
+    mock_nominatim.assert_called_once_with(99)
+
+
+def test_boundary_localities_are_linked_to_their_region(
+    authenticated_client, locality_boundaries
+):
+    data = {key: value for key, value in post_data.items() if key != "localityId"}
+
+    response = authenticated_client.post("/posts", json=data)
+
+    assert response.status_code == 201
+    country = authenticated_client.get("/countries").json["items"][0]
+    assert country["name"] == "United States"
+    assert (country["states"], country["posts"]) == (1, 1)
+    states = authenticated_client.get(f"/countries/{country['id']}/states").json
+    assert states["items"][0]["name"] == "New York"
+    assert (states["items"][0]["localities"], states["items"][0]["posts"]) == (1, 1)
+    assert check_location_stats() == []
+
+
+def test_posts_of_boundary_localities_are_in_their_region_feed(
+    authenticated_client, locality_boundaries
+):
+    data = {key: value for key, value in post_data.items() if key != "localityId"}
+    # Manhattan is in a state, its enclosing boundary is not
+    assert authenticated_client.post("/posts", json=data).status_code == 201
+    response = authenticated_client.post("/posts", json=dict(post_data))
+    assert response.status_code == 201
+
+    country = authenticated_client.get("/countries").json["items"][0]
+    state = authenticated_client.get(f"/countries/{country['id']}/states").json
+    response = authenticated_client.get(f"/posts?stateId={state['items'][0]['id']}")
+    assert response.json["totalItems"] == 1
+    assert response.json["items"][0]["localityNominatimId"] == 175905
+    response = authenticated_client.get(f"/posts?countryId={country['id']}")
+    assert response.json["totalItems"] == 1
+
+
+def test_looked_up_localities_are_linked_to_their_region(
+    authenticated_client, nominatim_get
+):
+    nominatim_get.return_value.json.return_value = {
+        "features": [feature(3167397, name="Kyiv", state="Kyiv", country="Ukraine")]
+    }
+
+    response = authenticated_client.post("/posts", json=dict(post_data))
+
+    assert response.status_code == 201
+    locality = Locality.query.one()
+    assert (locality.name, locality.state, locality.country) == (
+        "Kyiv",
+        "Kyiv",
+        "Ukraine",
+    )
+    country = authenticated_client.get("/countries").json["items"][0]
+    assert (country["name"], country["states"], country["posts"]) == ("Ukraine", 1, 1)
+    assert locality.state_id is not None
+    assert check_location_stats() == []
+
+
+def location_counts(client, url):
+    db.session.expire_all()
+    response = client.get(url)
+    assert response.status_code == 200
+    return {
+        name: response.json[name]
+        for name in ("users", "posts", "approvedSolutions", "states", "localities")
+        if name in response.json
+    }
+
+
+def test_location_stats_follow_posts_and_solutions(
+    authenticated_client, post, solution
+):
+    country = Country(name="USA")  # type: ignore
+    state = State(name="NY", country=country)  # type: ignore
+    db.session.add(state)
+    db.session.flush()
+    locality = Locality.query.one()
+    locality.state_id = state.id
+    locality.country_id = country.id
+    db.session.commit()
+    country_url = f"/countries/{country.id}"
+    state_url = f"/states/{state.id}"
+    locality_url = f"/localities/{locality.id}"
+
+    response = authenticated_client.put(f"{solution}/approval")
+
+    assert response.status_code == 204
+    assert location_counts(authenticated_client, locality_url) == {
+        "users": 0,
+        "posts": 1,
+        "approvedSolutions": 1,
+    }
+    assert location_counts(authenticated_client, state_url) == {
+        "users": 0,
+        "posts": 1,
+        "approvedSolutions": 1,
+        "localities": 1,
+    }
+    assert location_counts(authenticated_client, country_url)["states"] == 1
+    assert check_location_stats() == []
+
+    # moving the post takes its approved solution along
+    moved = dict(post_data, localityId=26150422)
+    assert authenticated_client.put(post, json=moved).status_code == 200
+    assert location_counts(authenticated_client, state_url)["approvedSolutions"] == 0
+    assert check_location_stats() == []
+
+    assert authenticated_client.delete(post).status_code == 204
+    assert location_counts(authenticated_client, locality_url)["posts"] == 0
+    assert check_location_stats() == []
+
+
+def test_location_stats_are_only_loaded_by_location_endpoints(
+    authenticated_client, post
+):
+    with count_queries() as queries:
+        assert authenticated_client.get("/posts").status_code == 200
+    assert not any("location_stats" in query for query in queries)
+
+    locality_id = Locality.query.one().id
+    with count_queries() as queries:
+        response = authenticated_client.get(f"/localities/{locality_id}")
+    assert response.json["posts"] == 1
+    assert sum("location_stats" in query for query in queries) == 1
+
+
+def test_rebuild_stats_command(app, post):
+    db.session.execute(sa.update(LocationStats).values(posts=LocationStats.posts + 5))
+    db.session.commit()
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=["locations", "check-stats"])
+    assert result.exit_code == 1
+    assert "Found 1 inconsistent location stats" in result.output
+
+    result = runner.invoke(args=["locations", "rebuild-stats"])
+    assert result.exit_code == 0, result.output
+    assert runner.invoke(args=["locations", "check-stats"]).exit_code == 0
+    assert LocationStats.query.one().posts == 1
@@ -1,13 +1,37 @@
+import base64
+import json
+import os
+import threading
 import time
 
 import pytest
+import requests
+import sqlalchemy as sa
 
+from api import db
+from api.blueprints.common.cache import (
+    CachedResponse,
+    FileSystemCacheBackend,
+    LRUCacheBackend,
+    RedisCacheBackend,
+)
+from api.blueprints.locations.models import Country, Locality, State
+from api.blueprints.posts.geocoding import resolve_post_locality
+from api.blueprints.posts.models import LOCALITY_INVALID, LOCALITY_PENDING
+from api.blueprints.posts.models import Post as PostModel
+from api.blueprints.posts.schemas import PostOutSchema
+from api.services import NominatimService
 from api.tests.api.assertions import (
     assert_pagination_response,
     assert_resources_order_match,
 )
-from api.tests.api.data import post_data
-from api.tests.api.helpers import create_post
+from api.tests.api.data import post_data, updated_post_data
+from api.tests.api.helpers import (
+    FakeRedis,
+    count_queries,
+    create_post,
+    create_post_with_images,
+)
 
 
 def test_post_author_link_is_valid(authenticated_client, post):
@@ -74,6 +98,370 @@ def test_get_posts(authenticated_client, authenticated_client2):
     )
 
 
+def test_get_posts_by_region(authenticated_client):
+    for locality_id in (1, 2, 3):
+        create_post(authenticated_client, dict(post_data, localityId=locality_id))
+    country = Country(name="Ukraine")  # type: ignore
+    state = State(name="Kyiv Oblast", country=country)  # type: ignore
+    db.session.add(state)
+    db.session.commit()
+    country_id, state_id = country.id, state.id
+    localities = {
+        locality.osm_id: locality
+        for locality in db.session.scalars(sa.select(Locality))
+    }
+    for osm_id in (1, 2):
+        localities[osm_id].state_id = state_id
+    for osm_id in (1, 2, 3):
+        localities[osm_id].country_id = country_id
+    db.session.commit()
+
+    response = authenticated_client.get(f"/posts?stateId={state_id}")
+    assert_pagination_response(response, total=2, page=1, total_pages=1, items_count=2)
+    response = authenticated_client.get(f"/posts?countryId={country_id}")
+    assert_pagination_response(response, total=3, page=1, total_pages=1, items_count=3)
+    response = authenticated_client.get(
+        f"/posts?stateId={state_id}&localityId=1&localityProvider=nominatim"
+    )
+    assert_pagination_response(response, total=1, page=1, total_pages=1, items_count=1)
+
+    # moving a locality out of the state refreshes the cached feed
+    localities[2].state_id = None
+    db.session.commit()
+
+    response = authenticated_client.get(f"/posts?stateId={state_id}")
+    assert_pagination_response(response, total=1, page=1, total_pages=1, items_count=1)
+    response = authenticated_client.get(f"/posts?countryId={country_id + 1}")
+    assert_pagination_response(response, total=0, page=1, total_pages=0, items_count=0)
+
+
+def test_get_posts_total_is_cached_until_write(authenticated_client):
+    create_post(authenticated_client)
+
+    response = authenticated_client.get("/posts")
+    assert response.json["countMode"] == "exact"
+    with count_queries() as queries:
+        response = authenticated_client.get("/posts")
+    assert response.json["countMode"] == "cached"
+    assert response.json["totalItems"] == 1
+    assert not any("count(" in statement.lower() for statement in queries)
+
+    create_post(authenticated_client)
+    response = authenticated_client.get("/posts")
+    assert response.json["countMode"] == "exact"
+    assert response.json["totalItems"] == 2
+
+
+def test_get_posts_without_count(authenticated_client):
+    for _ in range(3):
+        create_post(authenticated_client)
+
+    response = authenticated_client.get("/posts?count=none&per_page=2")
+    assert response.json["countMode"] == "none"
+    assert "totalItems" not in response.json
+    assert "last" not in response.json["links"]
+    assert response.json["hasNext"]
+    response = authenticated_client.get(response.json["links"]["next"])
+    assert len(response.json["items"]) == 1
+    assert not response.json["hasNext"]
+
+
+def test_get_posts_with_estimated_count_falls_back_on_sqlite(authenticated_client):
+    create_post(authenticated_client)
+
+    response = authenticated_client.get("/posts?count=estimate")
+
+    assert response.json["countMode"] in ("exact", "cached")
+    assert response.json["totalItems"] == 1
+
+
+@pytest.mark.parametrize("estimate", [1, 100])
+def test_estimated_count_does_not_decide_the_next_page(
+    authenticated_client, mocker, estimate
+):
+    for _ in range(3):
+        create_post(authenticated_client)
+    mocker.patch("api.blueprints.common.routes.estimate_count", return_value=estimate)
+
+    response = authenticated_client.get("/posts?count=estimate&per_page=2")
+    assert response.json["countMode"] == "estimate"
+    assert response.json["hasNext"]
+    assert response.json["totalItems"] == max(estimate, 3)
+    response = authenticated_client.get(response.json["links"]["next"])
+    assert len(response.json["items"]) == 1
+    assert not response.json["hasNext"]
+    assert "next" not in response.json["links"]
+
+
+def test_get_posts_with_sparse_fields(authenticated_client, post):
+    with count_queries() as queries:
+        response = authenticated_client.get("/posts?fields=id,title,authorLastName")
+
+    assert response.status_code == 200
+    assert response.json["items"] == [
+        {
+            "id": int(post.rsplit("/", 1)[1]),
+            "title": post_data["title"],
+            "authorLastName": "Doe",
+        }
+    ]
+    assert response.json["totalItems"] == 1
+    assert "fields=id,title,authorLastName" in response.json["links"]["self"].replace(
+        "%2C", ","
+    )
+    post_query = next(q for q in queries if "FROM post" in q and "LIMIT" in q)
+    assert "post.body" not in post_query
+    assert "post.latitude" not in post_query
+
+
+def test_get_post_with_sparse_fields(authenticated_client, post):
+    response = authenticated_client.get(f"{post}?fields=title,authorLink")
+
+    assert response.status_code == 200
+    assert set(response.json) == {"title", "authorLink"}
+
+
+def test_get_posts_with_unknown_sparse_field(authenticated_client):
+    response = authenticated_client.get("/posts?fields=id,passwordHash")
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize("order", ["asc", "desc"])
+def test_get_posts_with_cursor(authenticated_client, order):
+    for i in range(5):
+        new_post = post_data.copy()
+        new_post["title"] = f"Post {i}"
+        create_post(authenticated_client, new_post)
+    expected_titles = [f"Post {i}" for i in range(5)]
+    if order == "desc":
+        expected_titles.reverse()
+
+    response = authenticated_client.get(
+        f"/posts?sort_by=created_at&order={order}&per_page=2&count=exact&cursor="
+    )
+    assert response.status_code == 200
+    assert "count=" not in response.json["links"]["next"]
+    assert "totalItems" not in response.json
+    assert "last" not in response.json["links"]
+    assert not response.json["hasPrev"]
+    titles = []
+    pages = [response.json]
+    while "next" in response.json["links"]:
+        titles += [item["title"] for item in response.json["items"]]
+        response = authenticated_client.get(response.json["links"]["next"])
+        pages.append(response.json)
+    titles += [item["title"] for item in response.json["items"]]
+    assert titles == expected_titles
+    assert len(pages) == 3
+    assert not response.json["hasNext"]
+
+    response = authenticated_client.get(response.json["links"]["prev"])
+    assert response.json["items"] == pages[1]["items"]
+    response = authenticated_client.get(response.json["links"]["prev"])
+    assert response.json["items"] == pages[0]["items"]
+    assert not response.json["hasPrev"]
+
+
+def encode_cursor(values):
+    payload = json.dumps([["created_at", "id"], values, "next"]).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "garbage",
+        "WyJ4Il0=",
+        encode_cursor(["2025-01-01T00:00:00", "1"]),
+        encode_cursor(["2025-01-01T00:00:00", 1.5]),
+        encode_cursor(["2025-01-01T00:00:00", True]),
+        encode_cursor([{"$gt": ""}, 1]),
+        encode_cursor([["2025-01-01T00:00:00"], 1]),
+    ],
+)
+def test_get_posts_with_invalid_cursor(authenticated_client, cursor):
+    response = authenticated_client.get(f"/posts?cursor={cursor}")
+    assert response.status_code == 422
+
+
+def test_anonymous_responses_are_cached_until_write(
+    response_cache, client, authenticated_client, post
+):
+    response = client.get(post)
+    assert response.headers["X-Cache"] == "MISS"
+    response = client.get(post)
+    assert response.headers["X-Cache"] == "HIT"
+    assert client.get("/posts?page=1&per_page=5").headers["X-Cache"] == "MISS"
+    assert client.get("/posts?per_page=5&page=1").headers["X-Cache"] == "HIT"
+
+    updated_post = {**post_data, "title": "Updated title"}
+    authenticated_client.put(post, json=updated_post)
+
+    response = client.get(post)
+    assert response.headers["X-Cache"] == "MISS"
+    assert response.json["title"] == "Updated title"
+    response = client.get("/posts?page=1&per_page=5")
+    assert response.headers["X-Cache"] == "MISS"
+    assert response.json["items"][0]["title"] == "Updated title"
+
+
+def test_cached_responses_are_invalidated_by_renamed_author(
+    response_cache, client, post
+):
+    post_id = int(post.rsplit("/", 1)[1])
+    for url in (
+        post,
+        "/posts",
+        f"/posts?localityId={post_data['localityId']}&localityProvider=nominatim",
+    ):
+        assert client.get(url).headers["X-Cache"] == "MISS"
+        assert client.get(url).headers["X-Cache"] == "HIT"
+
+    db.get_or_404(PostModel, post_id).author.firstname = "Jane"
+    db.session.commit()
+
+    response = client.get(post)
+    assert response.headers["X-Cache"] == "MISS"
+    assert response.json["authorFirstName"] == "Jane"
+    response = client.get("/posts")
+    assert response.headers["X-Cache"] == "MISS"
+    assert response.json["items"][0]["authorFirstName"] == "Jane"
+    response = client.get(
+        f"/posts?localityId={post_data['localityId']}&localityProvider=nominatim"
+    )
+    assert response.headers["X-Cache"] == "MISS"
+
+
+def test_authenticated_responses_are_not_cached(
+    response_cache, authenticated_client, post
+):
+    authenticated_client.get(post)
+    response = authenticated_client.get(post)
+    assert "X-Cache" not in response.headers
+
+
+def test_map_clusters_cache_is_invalidated_by_new_posts(
+    response_cache, client, authenticated_client
+):
+    url = "/posts/map-clusters?minLat=0&maxLat=1&minLng=0&maxLng=1&zoom=18"
+    create_posts_at(authenticated_client, [(0.5, 0.5)])
+    assert client.get(url).json["totalInView"] == 1
+    assert client.get(url).headers["X-Cache"] == "HIT"
+
+    create_posts_at(authenticated_client, [(0.6, 0.6)])
+
+    response = client.get(url)
+    assert response.headers["X-Cache"] == "MISS"
+    assert response.json["totalInView"] == 2
+
+
+def test_get_post_not_modified(authenticated_client, post, mocker):
+    response = authenticated_client.get(post)
+    etag = response.headers["ETag"]
+    last_modified = response.headers["Last-Modified"]
+    dump = mocker.spy(PostOutSchema, "dump")
+
+    response = authenticated_client.get(post, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    response = authenticated_client.get(
+        post, headers={"If-Modified-Since": last_modified}
+    )
+    assert response.status_code == 304
+    dump.assert_not_called()
+
+
+def test_cached_post_not_modified(response_cache, client, post):
+    etag = client.get(post).headers["ETag"]
+    response = client.get(post, headers={"If-None-Match": etag})
+    assert response.headers["X-Cache"] == "HIT"
+    assert response.status_code == 304
+
+
+def test_post_etag_changes_with_image_order(authenticated_client, images):
+    images_ids = [image_id for image_id, _ in images]
+    post = create_post_with_images(authenticated_client, images_ids)
+    etag = authenticated_client.get(post).headers["ETag"]
+
+    data = {**post_data, "imagesIds": images_ids[::-1]}
+    response = authenticated_client.put(post, json=data)
+
+    assert response.headers["ETag"] != etag
+    response = authenticated_client.get(post, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+
+def test_update_post_with_if_match(authenticated_client, post):
+    etag = authenticated_client.get(post).headers["ETag"]
+    response = authenticated_client.put(
+        post, json=dict(updated_post_data), headers={"If-Match": etag}
+    )
+    assert response.status_code == 200
+
+    response = authenticated_client.put(
+        post, json=dict(updated_post_data), headers={"If-Match": etag}
+    )
+    assert response.status_code == 412
+
+
+def test_edited_at_moves_only_with_content_changes(authenticated_client, post):
+    post_id = int(post.rsplit("/", 1)[1])
+    edited_at = db.get_or_404(PostModel, post_id).edited_at
+    etag = authenticated_client.get(post).headers["ETag"]
+
+    response = authenticated_client.put(post, json=dict(post_data))
+    assert response.status_code == 200
+    assert response.headers["ETag"] == etag
+    db.get_or_404(PostModel, post_id).locality_status = LOCALITY_PENDING
+    db.session.commit()
+    assert db.get_or_404(PostModel, post_id).edited_at == edited_at
+    assert authenticated_client.get(post).headers["ETag"] != etag
+
+    response = authenticated_client.put(post, json=dict(updated_post_data))
+    assert response.status_code == 200
+    assert db.get_or_404(PostModel, post_id).edited_at > edited_at
+
+
+@pytest.fixture(params=["lru", "filesystem", "redis"])
+def cache_backend(request, tmp_path):
+    if request.param == "lru":
+        return LRUCacheBackend(max_entries=2)
+    if request.param == "filesystem":
+        return FileSystemCacheBackend(str(tmp_path))
+    return RedisCacheBackend(FakeRedis())
+
+
+def test_cache_backend_invalidates_tags(cache_backend):
+    response = CachedResponse(
+        b"{}",
+        "application/json",
+        (("ETag", '"1"'),),
+        (("br", b"\x0b\x00"), ("gzip", b"\x1f\x8b\n")),
+    )
+    cache_backend.set("/posts/1", response, ["post:1", "posts"], ttl=60)
+    cache_backend.set("/posts/2", response, ["post:2", "posts"], ttl=60)
+    assert cache_backend.get("/posts/1") == response
+
+    cache_backend.invalidate_tags(["post:1"])
+    assert cache_backend.get("/posts/1") is None
+    assert cache_backend.get("/posts/2") == response
+
+    cache_backend.invalidate_tags(["posts"])
+    assert cache_backend.get("/posts/2") is None
+
+
+def test_lru_cache_backend_evicts_least_recently_used():
+    cache = LRUCacheBackend(max_entries=2)
+    response = CachedResponse(b"{}", "application/json")
+    cache.set("a", response, [], ttl=60)
+    cache.set("b", response, [], ttl=60)
+    cache.get("a")
+    cache.set("c", response, [], ttl=60)
+    assert cache.get("a") == response
+    assert cache.get("b") is None
+    assert cache.get("c") == response
+
+
 @pytest.mark.parametrize(
     "method,payload",
     [
@@ -90,3 +478,409 @@ def test_post_not_found(authenticated_client, method, payload, post):
         non_existent_post_url, json=payload
     )
     assert response.status_code == 404
+
+
+def create_posts_at(client, coordinates):
+    for latitude, longitude in coordinates:
+        new_post = post_data.copy()
+        new_post["latitude"] = latitude
+        new_post["longitude"] = longitude
+        create_post(client, new_post)
+
+
+def test_map_clusters_groups_posts_by_grid_cell(authenticated_client):
+    create_posts_at(
+        authenticated_client, [(40.01, -74.99), (40.03, -74.97), (40.9, -74.1)]
+    )
+
+    response = authenticated_client.get(
+        "/posts/map-clusters?minLat=40&maxLat=41&minLng=-75&maxLng=-74&zoom=10"
+    )
+
+    assert response.status_code == 200
+    assert response.json["totalInView"] == 3
+    clusters = [i for i in response.json["items"] if i["type"] == "cluster"]
+    markers = [i for i in response.json["items"] if i["type"] == "post"]
+    assert len(clusters) == 1
+    assert clusters[0]["count"] == 2
+    assert clusters[0]["latitude"] == pytest.approx(40.02)
+    assert clusters[0]["longitude"] == pytest.approx(-74.98)
+    assert clusters[0]["bounds"]["minLat"] == pytest.approx(40)
+    assert clusters[0]["bounds"]["maxLat"] == pytest.approx(40.04)
+    assert len(markers) == 1
+    assert markers[0]["latitude"] == 40.9
+    assert markers[0]["title"] == post_data["title"]
+    assert markers[0]["authorFirstName"] == "John"
+
+
+def test_map_clusters_returns_individual_posts_at_high_zoom(authenticated_client):
+    create_posts_at(
+        authenticated_client, [(40.01, -74.99), (40.011, -74.991), (42, -74.5)]
+    )
+
+    response = authenticated_client.get(
+        "/posts/map-clusters?minLat=40&maxLat=41&minLng=-75&maxLng=-74&zoom=16"
+    )
+
+    assert response.status_code == 200
+    assert response.json["totalInView"] == 2
+    assert [i["type"] for i in response.json["items"]] == ["post", "post"]
+
+
+def test_map_markers_use_fixed_number_of_queries(authenticated_client, images):
+    images_ids = [image_id for image_id, _ in images]
+    create_post_with_images(authenticated_client, images_ids)
+    url = "/posts/map-clusters?minLat=40&maxLat=41&minLng=-75&maxLng=-74&zoom=16"
+    with count_queries() as few_posts_queries:
+        response = authenticated_client.get(url)
+    assert response.json["items"][0]["thumbnailUrl"] == images[0][1]
+    assert response.json["items"][0]["authorLastName"] == "Doe"
+
+    create_posts_at(authenticated_client, [(40.2 + i / 100, -74.5) for i in range(5)])
+    with count_queries() as many_posts_queries:
+        response = authenticated_client.get(url)
+
+    assert response.json["totalInView"] == 6
+    assert len(many_posts_queries) == len(few_posts_queries)
+
+
+@pytest.fixture
+def pyramid_clustering(app):
+    app.config["MAP_CLUSTERING"] = "pyramid"
+    yield
+    app.config["MAP_CLUSTERING"] = "grid"
+
+
+def test_map_clusters_from_pyramid(authenticated_client, pyramid_clustering):
+    create_posts_at(
+        authenticated_client, [(40.01, -74.99), (40.03, -74.97), (40.9, -74.1)]
+    )
+
+    response = authenticated_client.get(
+        "/posts/map-clusters?minLat=40&maxLat=41&minLng=-75&maxLng=-74&zoom=8"
+    )
+
+    assert response.status_code == 200
+    assert response.json["totalInView"] == 3
+    clusters = [i for i in response.json["items"] if i["type"] == "cluster"]
+    markers = [i for i in response.json["items"] if i["type"] == "post"]
+    assert len(clusters) == 1
+    assert clusters[0]["count"] == 2
+    assert clusters[0]["latitude"] == pytest.approx(40.02)
+    assert clusters[0]["bounds"]["minLat"] <= 40.01 <= clusters[0]["bounds"]["maxLat"]
+    assert len(markers) == 1
+    assert markers[0]["latitude"] == 40.9
+
+
+def test_cluster_pyramid_is_maintained_on_writes(app, authenticated_client):
+    from api.blueprints.posts.services import check_cluster_pyramid
+
+    first_post = create_post(authenticated_client)
+    second_post = create_post(authenticated_client)
+    moved_post = post_data.copy()
+    moved_post["latitude"] = -33.86
+    moved_post["longitude"] = 151.2
+    authenticated_client.put(first_post, json=moved_post)
+    authenticated_client.delete(second_post)
+    create_post(authenticated_client)
+
+    assert check_cluster_pyramid() == []
+
+
+def test_rebuild_clusters_command(app, authenticated_client):
+    from api import db
+    from api.blueprints.posts.models import PostCluster
+
+    create_post(authenticated_client)
+    db.session.execute(db.delete(PostCluster))
+    db.session.commit()
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=["posts", "check-clusters"])
+    assert result.exit_code != 0
+
+    result = runner.invoke(args=["posts", "rebuild-clusters"])
+    assert result.exit_code == 0
+
+    result = runner.invoke(args=["posts", "check-clusters"])
+    assert result.exit_code == 0
+    assert "consistent" in result.output
+
+
+def test_get_post_tile(app, authenticated_client):
+    from api.blueprints.posts.services import tile_xy
+
+    post_url = create_post(authenticated_client)
+    x, y = tile_xy(post_data["latitude"], post_data["longitude"], 16)
+
+    response = authenticated_client.get(f"/posts/tiles/16/{x}/{y}.mvt")
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/vnd.mapbox-vector-tile"
+    assert response.cache_control.public
+    assert b"posts" in response.data
+    assert post_data["title"].encode() in response.data
+    tile_path = os.path.join(app.config["TILE_CACHE_DIR"], "16", str(x), f"{y}.mvt")
+    assert os.path.exists(tile_path)
+
+    updated_post = post_data.copy()
+    updated_post["title"] = "Pothole"
+    authenticated_client.put(post_url, json=updated_post)
+
+    assert not os.path.exists(tile_path)
+    response = authenticated_client.get(f"/posts/tiles/16/{x}/{y}.mvt")
+    assert b"Pothole" in response.data
+
+
+@pytest.mark.parametrize("clustering", ["grid", "pyramid"])
+def test_get_clustered_post_tile(app, authenticated_client, mocker, clustering):
+    from api.blueprints.posts import tiles
+    from api.blueprints.posts.services import tile_xy
+
+    mocker.patch.dict(app.config, {"MAP_CLUSTERING": clustering})
+    grid = mocker.spy(tiles, "cluster_posts_in_grid")
+    create_posts_at(authenticated_client, [(40.01, -74.99), (40.011, -74.991)])
+    x, y = tile_xy(40.01, -74.99, 5)
+
+    response = authenticated_client.get(f"/posts/tiles/5/{x}/{y}.mvt")
+
+    assert response.status_code == 200
+    assert b"cluster" in response.data
+    assert post_data["title"].encode() not in response.data
+    # the tile has the clusters of /posts/map-clusters with the same setting
+    assert grid.called == (clustering == "grid")
+
+
+def test_tile_rendered_during_an_invalidation_is_not_kept(
+    app, authenticated_client, mocker
+):
+    from api.blueprints.posts import tiles
+    from api.blueprints.posts.services import tile_xy
+
+    create_post(authenticated_client)
+    x, y = tile_xy(post_data["latitude"], post_data["longitude"], 16)
+    render = tiles._tile_features
+
+    def render_and_invalidate(*args):
+        features = render(*args)
+        # a post is written by another request after the tile read the posts
+        tiles.get_tile_cache().invalidate(post_data["latitude"], post_data["longitude"])
+        return features
+
+    mocker.patch.object(tiles, "_tile_features", side_effect=render_and_invalidate)
+    response = authenticated_client.get(f"/posts/tiles/16/{x}/{y}.mvt")
+
+    assert response.status_code == 200
+    tile_path = os.path.join(app.config["TILE_CACHE_DIR"], "16", str(x), f"{y}.mvt")
+    assert not os.path.exists(tile_path)
+
+
+def test_post_writes_only_touch_rendered_tiles(app, authenticated_client):
+    from api.blueprints.posts.services import tile_xy
+    from api.blueprints.posts.tiles import get_tile_cache
+
+    get_tile_cache().clear()
+    post_url = create_post(authenticated_client)
+    assert not os.path.exists(app.config["TILE_CACHE_DIR"])
+
+    x, y = tile_xy(post_data["latitude"], post_data["longitude"], 16)
+    authenticated_client.get(f"/posts/tiles/16/{x}/{y}.mvt")
+    updated_post = post_data.copy()
+    updated_post["title"] = "Pothole"
+    authenticated_client.put(post_url, json=updated_post)
+
+    tile_dir = app.config["TILE_CACHE_DIR"]
+    files = [
+        os.path.relpath(os.path.join(directory, name), tile_dir)
+        for directory, _, names in os.walk(tile_dir)
+        for name in names
+    ]
+    # the token of the rendered tile, none for the other 20 zoom levels
+    assert files == [os.path.join("16", str(x), f"{y}.mvt.generation")]
+
+
+def test_rebuild_clusters_clears_cached_tiles(
+    app, authenticated_client, pyramid_clustering
+):
+    from api.blueprints.posts.services import tile_xy
+
+    create_post(authenticated_client)
+    x, y = tile_xy(post_data["latitude"], post_data["longitude"], 5)
+    authenticated_client.get(f"/posts/tiles/5/{x}/{y}.mvt")
+    tile_path = os.path.join(app.config["TILE_CACHE_DIR"], "5", str(x), f"{y}.mvt")
+    assert os.path.exists(tile_path)
+
+    result = app.test_cli_runner().invoke(args=["posts", "rebuild-clusters"])
+
+    assert result.exit_code == 0
+    assert not os.path.exists(tile_path)
+
+
+def test_get_post_tile_out_of_range(authenticated_client):
+    response = authenticated_client.get("/posts/tiles/2/4/0.mvt")
+
+    assert response.status_code == 404
+
+
+@pytest.fixture(params=["rtree", "memory"])
+def spatial_index(app, request):
+    from api.blueprints.posts.spatial import get_spatial_index
+
+    app.config["SPATIAL_INDEX"] = request.param
+    app.extensions.pop("spatial_index", None)
+    yield get_spatial_index()
+    app.config["SPATIAL_INDEX"] = "auto"
+    app.extensions.pop("spatial_index", None)
+
+
+def test_spatial_index_queries(authenticated_client, spatial_index):
+    from api.blueprints.posts.models import Post
+
+    create_posts_at(
+        authenticated_client, [(50.45, 30.52), (50.46, 30.53), (49.84, 24.03)]
+    )
+
+    assert Post.query.filter(spatial_index.within_bounds(50, 51, 30, 31)).count() == 2
+    assert Post.query.filter(spatial_index.within_bounds(0, 1, 0, 1)).count() == 0
+
+
+def test_spatial_index_follows_post_updates(authenticated_client, spatial_index):
+    from api.blueprints.posts.models import Post
+
+    post_url = create_post(authenticated_client)
+    bounds = (
+        post_data["latitude"] - 0.01,
+        post_data["latitude"] + 0.01,
+        post_data["longitude"] - 0.01,
+        post_data["longitude"] + 0.01,
+    )
+    assert Post.query.filter(spatial_index.within_bounds(*bounds)).count() == 1
+
+    moved_post = post_data.copy()
+    moved_post["latitude"] = 10.0
+    authenticated_client.put(post_url, json=moved_post)
+    assert Post.query.filter(spatial_index.within_bounds(*bounds)).count() == 0
+
+    authenticated_client.delete(post_url)
+    assert Post.query.filter(spatial_index.within_bounds(9, 11, -75, -73)).count() == 0
+
+
+def test_memory_spatial_index_is_reloaded_after_its_ttl(authenticated_client, mocker):
+    from api.blueprints.posts.models import Post
+    from api.blueprints.posts.spatial import InMemorySpatialIndex
+
+    monotonic = mocker.patch("time.monotonic", return_value=1000.0)
+    create_post(authenticated_client)
+    index = InMemorySpatialIndex(ttl=60)
+    bounds = (40, 41, -75, -73)
+    assert Post.query.filter(index.within_bounds(*bounds)).count() == 1
+
+    # a write of another worker process is not seen until the index expires
+    db.session.execute(sa.update(Post).values(latitude=10.0))
+    db.session.commit()
+    assert Post.query.filter(index.within_bounds(*bounds)).count() == 1
+    monotonic.return_value += 60
+    assert Post.query.filter(index.within_bounds(*bounds)).count() == 0
+
+
+@pytest.fixture
+def async_geocoding(app):
+    app.config["ASYNC_GEOCODING"] = True
+
+    def wait():
+        from api import db
+
+        worker = app.extensions.pop("geocoding_worker", None)
+        if worker is not None:
+            worker.shutdown()
+        # requests of the test client share the session of the app context
+        db.session.expire_all()
+
+    yield wait
+    wait()
+    app.config["ASYNC_GEOCODING"] = False
+
+
+def test_post_with_unknown_locality_is_created_pending(
+    authenticated_client, async_geocoding, mock_nominatim
+):
+    lookup_started = threading.Event()
+    release_lookup = threading.Event()
+
+    def slow_lookup(locality_id):
+        lookup_started.set()
+        release_lookup.wait(5)
+        return 40.7128, -74.0060
+
+    mock_nominatim.side_effect = slow_lookup
+    feed = "/posts?localityId=3167397&localityProvider=nominatim"
+
+    response = authenticated_client.post("/posts", json=dict(post_data))
+
+    assert response.status_code == 201
+    assert response.json["localityStatus"] == "pending"
+    assert "localityNominatimId" not in response.json
+    assert lookup_started.wait(5)
+    assert authenticated_client.get(feed).json["totalItems"] == 1
+
+    release_lookup.set()
+    async_geocoding()
+
+    post = authenticated_client.get(response.headers["Location"]).json
+    assert post["localityStatus"] == "resolved"
+    assert post["localityNominatimId"] == 3167397
+    assert authenticated_client.get(feed).json["totalItems"] == 1
+
+
+def test_post_with_invalid_locality_is_not_listed(
+    authenticated_client, async_geocoding, mock_nominatim
+):
+    mock_nominatim.side_effect = ValueError("Invalid locality id")
+
+    post = create_post(authenticated_client)
+    async_geocoding()
+
+    assert authenticated_client.get(post).json["localityStatus"] == "invalid"
+    assert authenticated_client.get("/posts").json["totalItems"] == 0
+
+
+def test_post_with_known_locality_is_not_pending(
+    authenticated_client, post, async_geocoding, mock_nominatim
+):
+    mock_nominatim.reset_mock()
+
+    response = authenticated_client.post("/posts", json=dict(post_data))
+
+    assert response.json["localityStatus"] == "resolved"
+    mock_nominatim.assert_not_called()
+
+
+def test_resolve_localities_command(
+    app, authenticated_client, async_geocoding, mock_nominatim, mocker
+):
+    # batched lookups filling the cache are tested in test_locations
+    mocker.patch.object(NominatimService, "get_latitude_longitude_many")
+    mock_nominatim.side_effect = requests.ConnectionError
+    post = create_post(authenticated_client)
+    async_geocoding()
+    assert authenticated_client.get(post).json["localityStatus"] == "pending"
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=["posts", "resolve-localities"])
+    assert result.exit_code != 0
+
+    mock_nominatim.side_effect = None
+    result = runner.invoke(args=["posts", "resolve-localities"])
+
+    assert result.exit_code == 0
+    assert "Resolved 1 of 1 pending posts" in result.output
+    assert authenticated_client.get(post).json["localityStatus"] == "resolved"
+
+
+def test_pending_post_without_locality_id_is_invalid(authenticated_client, post):
+    pending = db.session.scalars(sa.select(PostModel)).one()
+    pending.locality_status = LOCALITY_PENDING
+    db.session.commit()
+
+    assert resolve_post_locality(pending.id) == LOCALITY_INVALID
+    assert authenticated_client.get(post).json["localityStatus"] == "invalid"
@@ -11,7 +11,10 @@ from conftest import (
     solution_with_images,
 )
 
-from api.tests.api.assertions import assert_resource_images
+from api.tests.api.assertions import (
+    assert_constant_query_count,
+    assert_resource_images,
+)
 from api.tests.api.data import post_data, solution_data
 from api.tests.api.helpers import (
     create_post_with_images,
@@ -61,6 +64,38 @@ def test_get_resource_with_images(authenticated_client, resource_with_images, im
     assert_resource_images(response, images)
 
 
+@pytest.mark.parametrize(
+    "resource_parent,resource_create_func,resource_data",
+    [
+        ("", create_post_with_images, post_data),
+        (lf(post), create_solution_with_images, solution_data),
+    ],
+)
+def test_list_resources_with_images_without_lazy_loading(
+    authenticated_client,
+    authenticated_client2,
+    images,
+    resource_parent,
+    resource_create_func,
+    resource_data,
+):
+    """Test that listing resources runs the same queries for any page size."""
+    images_ids = [img_id for img_id, _ in images]
+    for client in (authenticated_client, authenticated_client2, authenticated_client):
+        if resource_parent:
+            resource_create_func(client, resource_parent, images_ids, resource_data)
+        else:
+            resource_create_func(client, images_ids, resource_data)
+    list_url = f"{resource_parent}/{'solutions' if resource_parent else 'posts'}"
+
+    assert_constant_query_count(
+        authenticated_client,
+        f"{list_url}?per_page=1&count=none",
+        f"{list_url}?per_page=3&count=none",
+        f"{list_url}?per_page=3&count=none&cursor=",
+    )
+
+
 @pytest.mark.parametrize(
     "resource,resource_data",
     [
@@ -168,6 +203,8 @@ def test_update_resource_remove_all_images_with_empty_list(
 
     assert update_response.status_code == 200
     assert update_response.json.get("images") == []
+    assert update_response.json["thumbnailUrl"] is None
+    assert update_response.json["imageCount"] == 0
 
 
 @pytest.mark.parametrize(
@@ -190,6 +227,8 @@ def test_update_resource_remove_all_images_without_key(
 
     assert update_response.status_code == 200
     assert update_response.json.get("images") == []
+    assert update_response.json["thumbnailUrl"] is None
+    assert update_response.json["imageCount"] == 0
 
 
 @pytest.mark.parametrize(
@@ -0,0 +1,114 @@
+import pytest
+import sqlalchemy as sa
+
+from api import db
+from api.blueprints.posts.models import LOCALITY_INVALID, Post
+from api.tests.api.data import post_data, solution_data, updated_post_data
+from api.tests.api.helpers import create_post, create_solution
+
+
+def test_filter_posts_by_search_text(authenticated_client):
+    create_post(authenticated_client, {**post_data, "title": "Broken streetlight"})
+    pothole = create_post(
+        authenticated_client, {**post_data, "body": "Deep pothole near the school"}
+    )
+
+    response = authenticated_client.get("/posts?q=potho")
+
+    assert [item["id"] for item in response.json["items"]] == [
+        authenticated_client.get(pothole).json["id"]
+    ]
+    assert response.json["totalItems"] == 1
+    assert "q=potho" in response.json["links"]["self"]
+
+
+def test_search_index_follows_updates_and_deletes(authenticated_client, post):
+    assert authenticated_client.get("/search?q=test").json["totalItems"] == 1
+
+    authenticated_client.put(
+        post,
+        json={**updated_post_data, "title": "Flooded underpass", "body": "Water"},
+    )
+
+    assert authenticated_client.get("/search?q=test").json["totalItems"] == 0
+    assert authenticated_client.get("/search?q=flooded").json["totalItems"] == 1
+    assert authenticated_client.get("/search?q=water").json["totalItems"] == 1
+
+    authenticated_client.delete(post)
+
+    assert authenticated_client.get("/search?q=flooded").json["totalItems"] == 0
+
+
+def test_search_ranks_title_matches_first(authenticated_client):
+    in_body = create_post(
+        authenticated_client, {**post_data, "body": "A graffiti covered wall"}
+    )
+    in_title = create_post(
+        authenticated_client, {**post_data, "title": "Graffiti on the bridge"}
+    )
+    solution = create_solution(
+        authenticated_client,
+        in_body,
+        {**solution_data, "body": "Graffiti was painted over"},
+    )
+
+    response = authenticated_client.get("/search?q=graffiti")
+
+    items = response.json["items"]
+    assert items[0]["link"] == in_title
+    assert {item["link"] for item in items} == {in_title, in_body, solution}
+    assert items[0]["title"] == "<mark>Graffiti</mark> on the bridge"
+    assert [item["score"] for item in items] == sorted(
+        [item["score"] for item in items], reverse=True
+    )
+    solution_item = next(item for item in items if item["type"] == "solution")
+    assert solution_item["postId"] == authenticated_client.get(in_body).json["id"]
+    assert "<mark>Graffiti</mark> was painted over" in solution_item["snippet"]
+
+
+def test_search_by_type(authenticated_client, solution):
+    response = authenticated_client.get("/search?q=test&type=solutions")
+    assert [item["type"] for item in response.json["items"]] == ["solution"]
+
+
+def test_search_skips_posts_with_invalid_localities(authenticated_client, solution):
+    assert authenticated_client.get("/search?q=test").json["totalItems"] == 2
+    db.session.execute(sa.update(Post).values(locality_status=LOCALITY_INVALID))
+    db.session.commit()
+
+    response = authenticated_client.get("/search?q=test")
+
+    assert response.json["items"] == []
+    assert response.json["totalItems"] == 0
+
+
+def test_search_escapes_html(authenticated_client):
+    create_post(authenticated_client, {**post_data, "body": "<b>Fallen</b> tree"})
+
+    response = authenticated_client.get("/search?q=fallen")
+
+    assert response.json["items"][0]["snippet"] == (
+        "&lt;b&gt;<mark>Fallen</mark>&lt;/b&gt; tree"
+    )
+
+
+@pytest.mark.parametrize(
+    ("q", "total"),
+    [
+        ('"test', 1),
+        ("title:test OR", 0),
+        ("(test) AND post*", 0),
+        ("(test) post*", 1),
+        ("-*^", 0),
+    ],
+)
+def test_search_text_is_not_parsed_as_query_syntax(
+    authenticated_client, post, q, total
+):
+    response = authenticated_client.get("/posts", query_string={"q": q})
+    assert response.json["totalItems"] == total
+
+
+def test_search_without_words(authenticated_client):
+    response = authenticated_client.get("/search?q=!!!")
+    assert response.status_code == 422
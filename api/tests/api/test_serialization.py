@@ -0,0 +1,77 @@
+import datetime
+import uuid
+
+import pytest
+from flask.json.provider import DefaultJSONProvider
+
+from api.blueprints.common.serialization import OrjsonProvider
+from api.tests.api.data import post_data
+from api.tests.api.helpers import (
+    create_post,
+    create_post_with_images,
+    create_solution_with_images,
+)
+
+# the orjson provider is optional
+pytest.importorskip("orjson")
+
+
+@pytest.fixture
+def fast_serialization(app):
+    """Switch to orjson and compiled schemas for the duration of the test."""
+    default_provider = app.json
+
+    def enable():
+        app.config["COMPILED_SCHEMAS"] = True
+        app.json = OrjsonProvider(app)
+
+    yield enable
+
+    app.config["COMPILED_SCHEMAS"] = False
+    app.json = default_provider
+
+
+def test_fast_serialization_matches_default_output(
+    authenticated_client, images, fast_serialization
+):
+    images_ids = [image_id for image_id, _ in images]
+    post = create_post_with_images(authenticated_client, images_ids)
+    create_post(
+        authenticated_client,
+        {**post_data, "title": "Яма на дорозі 🚧", "latitude": 40.71281},
+    )
+    create_solution_with_images(authenticated_client, post, images_ids[:1])
+    urls = [
+        "/posts?sort_by=created_at",
+        "/posts?sort_by=created_at&count=none&per_page=1",
+        "/posts?cursor=",
+        post,
+        f"{post}/solutions",
+        "/posts/map-clusters?minLat=40&maxLat=41&minLng=-75&maxLng=-74&zoom=18",
+        "/posts/map-clusters?minLat=40&maxLat=41&minLng=-75&maxLng=-74&zoom=5",
+    ]
+    for url in urls:  # cache the totals so both passes report the same count mode
+        authenticated_client.get(url)
+    expected = [authenticated_client.get(url).data for url in urls]
+
+    fast_serialization()
+
+    assert [authenticated_client.get(url).data for url in urls] == expected
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        {"b": 1, "a": [1.5, None, True], "c": {"z": "x", "y": ""}},
+        'control \x00\x1f\x7f quotes " \\ slash /',
+        "non-ASCII é \u2028 😀",
+        {
+            "date": datetime.datetime(2026, 1, 2, 3, 4, 5, tzinfo=datetime.UTC),
+            "id": uuid.UUID(int=1),
+        },
+        2**70,
+    ],
+)
+def test_orjson_provider_matches_default_provider(app, value):
+    expected = DefaultJSONProvider(app).response(value).data  # type: ignore
+    assert OrjsonProvider(app).response(value).data == expected  # type: ignore
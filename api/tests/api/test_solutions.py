@@ -1,12 +1,14 @@
 import time
+import uuid
 
 import pytest
 
+from api.blueprints.solutions.models import Solution as SolutionModel
 from api.tests.api.assertions import (
     assert_pagination_response,
     assert_resources_order_match,
 )
-from api.tests.api.data import post_data, solution_data
+from api.tests.api.data import post_data, solution_data, updated_solution_data
 from api.tests.api.helpers import create_post, create_solution
 
 
@@ -88,3 +90,79 @@ def test_post_not_found_on_getting_solutions(authenticated_client):
     response = authenticated_client.get("/posts/99999/solutions")
 
     assert response.status_code == 404
+
+
+def test_get_solutions_with_sparse_fields(authenticated_client, post, solution):
+    response = authenticated_client.get(f"{post}/solutions?fields=title,approved")
+
+    assert response.status_code == 200
+    assert response.json["items"] == [
+        {"title": solution_data["title"], "approved": False}
+    ]
+
+
+def test_cached_solutions_are_invalidated_by_new_solution(
+    response_cache, client, authenticated_client, post
+):
+    assert client.get(f"{post}/solutions").json["totalItems"] == 0
+    assert client.get(f"{post}/solutions").headers["X-Cache"] == "HIT"
+
+    create_solution(authenticated_client, post)
+
+    response = client.get(f"{post}/solutions")
+    assert response.headers["X-Cache"] == "MISS"
+    assert response.json["totalItems"] == 1
+
+
+def test_cached_solutions_are_invalidated_by_renamed_author(
+    response_cache, db, client, post, solution
+):
+    client.get(f"{post}/solutions")
+    assert client.get(f"{post}/solutions").headers["X-Cache"] == "HIT"
+
+    solution_id = int(solution.rsplit("/", 1)[1])
+    db.get_or_404(SolutionModel, solution_id).author.lastname = "Smith"
+    db.session.commit()
+
+    response = client.get(f"{post}/solutions")
+    assert response.headers["X-Cache"] == "MISS"
+    assert response.json["items"][0]["authorLastName"] == "Smith"
+
+
+def test_cached_solutions_are_invalidated_by_new_solution_image(
+    response_cache, db, client, post, solution, image
+):
+    from api.blueprints.solutions.models import SolutionImage
+
+    solution_id = int(solution.rsplit("/", 1)[1])
+    client.get(f"{post}/solutions")
+    assert client.get(f"{post}/solutions").headers["X-Cache"] == "HIT"
+
+    # only the foreign key is set, the solution relationship is never loaded
+    db.session.add(
+        SolutionImage(
+            solution_id=solution_id,  # type: ignore
+            image_id=uuid.UUID(image[0]),  # type: ignore
+            order=0,  # type: ignore
+        )
+    )
+    db.session.commit()
+
+    response = client.get(f"{post}/solutions")
+    assert response.headers["X-Cache"] == "MISS"
+    assert len(response.json["items"][0]["images"]) == 1
+
+
+def test_solution_conditional_requests(authenticated_client, solution):
+    etag = authenticated_client.get(solution).headers["ETag"]
+    response = authenticated_client.get(solution, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    response = authenticated_client.put(
+        solution, json=dict(updated_solution_data), headers={"If-Match": etag}
+    )
+    assert response.status_code == 200
+    response = authenticated_client.put(
+        solution, json=dict(updated_solution_data), headers={"If-Match": etag}
+    )
+    assert response.status_code == 412
@@ -1,5 +1,14 @@
+import hashlib
 from io import BytesIO
 
+import pytest
+
+from api.blueprints.uploads.services import (
+    FileTooLargeError,
+    ImageUpload,
+    LocalFolderStorageService,
+)
+
 
 def test_upload_image(authenticated_client):
     data = {"image": (BytesIO(b"fake image content"), "test.png")}
@@ -24,3 +33,54 @@ def test_upload_not_image_as_image(authenticated_client):
         "/uploads/images", data=data, content_type="multipart/form-data"
     )
     assert response.status_code == 422
+
+
+def test_upload_too_large_image(authenticated_client, app, monkeypatch):
+    monkeypatch.setattr(app.storage_service, "max_size", 8)
+    data = {"image": (BytesIO(b"fake image content"), "test.png")}
+
+    response = authenticated_client.post(
+        "/uploads/images", data=data, content_type="multipart/form-data"
+    )
+
+    assert response.status_code == 413
+    assert app.storage_service.uploaded_images == {}
+
+
+PNG = b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR" + bytes(range(256)) * 4
+
+
+@pytest.fixture
+def upload_folder(tmp_path, monkeypatch):
+    monkeypatch.setattr("api.blueprints.uploads.services.UPLOAD_FOLDER", str(tmp_path))
+    return tmp_path
+
+
+def test_local_storage_streams_upload_into_place(upload_folder):
+    upload = ImageUpload(BytesIO(PNG), chunk_size=100)
+
+    LocalFolderStorageService()._save_file(upload, "image.png")
+
+    assert [path.name for path in upload_folder.iterdir()] == ["image.png"]
+    assert (upload_folder / "image.png").read_bytes() == PNG
+    assert upload.mime == "image/png"
+    assert upload.size == len(PNG)
+    assert upload.sha256 == hashlib.sha256(PNG).hexdigest()
+
+
+@pytest.mark.parametrize(
+    ("content", "max_size", "error"),
+    [
+        (b"plain text, not an image", 1000, ValueError),
+        (PNG, len(PNG) - 1, FileTooLargeError),
+    ],
+)
+def test_local_storage_leaves_nothing_of_rejected_upload(
+    upload_folder, content, max_size, error
+):
+    upload = ImageUpload(BytesIO(content), chunk_size=100, max_size=max_size)
+
+    with pytest.raises(error):
+        LocalFolderStorageService()._save_file(upload, "image.png")
+
+    assert list(upload_folder.iterdir()) == []